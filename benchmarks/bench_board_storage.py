@@ -0,0 +1,74 @@
+"""
+Stored size and (de)serialization time of boards: the original JSON game
+blob, per-board JSON with phrase strings, and packed phrase indices.
+
+    python benchmarks/bench_board_storage.py [num_boards] [phrase_length]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bingo.bingoServer import create_game
+from bingo.board_codec import board_grid, decode_board, encode_board
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    num_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    phrase_length = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    phrases = [f"{i:03d} " + "x" * (phrase_length - 4) for i in range(75)]
+
+    game = create_game("bench", num_boards, phrases, seed=1)
+    table = game["phrase_table"]
+    boards = {
+        board_uuid: {"board_num": board["board_num"], "board_data": board_grid(board["squares"], table)}
+        for board_uuid, board in game["board_assignments"].items()
+    }
+    legacy_game = dict(game, board_assignments={
+        board_uuid: dict(board, board_data=boards[board_uuid]["board_data"])
+        for board_uuid, board in game["board_assignments"].items()
+    })
+    for board in legacy_game["board_assignments"].values():
+        board.pop("squares")
+    for field in ("phrase_table", "phrase_index", "seed"):
+        legacy_game.pop(field)
+
+    rows = []
+
+    blob, enc = timed(lambda: json.dumps(legacy_game))
+    _, dec = timed(lambda: json.loads(blob))
+    rows.append(("json game blob", len(blob), enc, dec))
+
+    per_board, enc = timed(lambda: {u: json.dumps(b) for u, b in boards.items()})
+    _, dec = timed(lambda: {u: json.loads(b) for u, b in per_board.items()})
+    rows.append(("json per board", sum(len(v) for v in per_board.values()), enc, dec))
+
+    packed, enc = timed(lambda: {
+        u: encode_board(b["board_num"], b["squares"], len(table))
+        for u, b in game["board_assignments"].items()
+    })
+    _, dec = timed(lambda: {u: decode_board(b) for u, b in packed.items()})
+    table_bytes = len(json.dumps(table))
+    rows.append(("packed + table", sum(len(v) for v in packed.values()) + table_bytes, enc, dec))
+
+    _, grid = timed(lambda: [board_grid(decode_board(b)[1], table) for b in packed.values()])
+    print(f"{num_boards} boards, {phrase_length}-char phrases (phrase table {table_bytes} bytes)")
+    print(f"{'layout':<16} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    for name, size, enc, dec in rows:
+        print(f"{name:<16} {size:>10} {enc * 1000:>10.2f} {dec * 1000:>10.2f}")
+    print(f"decode packed to phrase grids (template edge): {grid * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Time and peak memory of board generation.
+
+    python benchmarks/bench_card_generator.py [num_phrases]
+
+Compares the batched index generator against the previous per-board
+random.sample loop, and against building the nested-list boards that
+create_game stores.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bingo.bingoCardGenerator import bingoCardGenerator, generate_board_indices
+
+
+def legacy_generator(phrases, num_boards):
+    boards = {}
+    for board_num in range(num_boards):
+        selected_phrases = random.sample(phrases, 24)
+        random.shuffle(selected_phrases)
+        selected_phrases.insert(12, "Free Space")
+        boards[board_num] = [selected_phrases[i*5:(i+1)*5] for i in range(5)]
+    return boards
+
+
+def measure(fn):
+    # Timed and memory-traced separately; tracemalloc slows Python code down
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    num_phrases = int(sys.argv[1]) if len(sys.argv) > 1 else 75
+    phrases = [f"Phrase number {i} with some typical length" for i in range(num_phrases)]
+
+    print(f"{num_phrases} phrases")
+    print(f"{'boards':>8} {'generator':<12} {'seconds':>9} {'peak MB':>9} {'result MB':>10}")
+    for num_boards in (256, 10_000, 100_000):
+        indices, elapsed, peak = measure(lambda: generate_board_indices(num_phrases, num_boards, seed=1))
+        print(f"{num_boards:>8} {'indices':<12} {elapsed:>9.3f} {peak / 1e6:>9.1f} {indices.nbytes / 1e6:>10.2f}")
+        for name, fn in (
+            ("nested", lambda: bingoCardGenerator(phrases, num_boards, seed=1)),
+            ("legacy", lambda: legacy_generator(phrases, num_boards)),
+        ):
+            _, elapsed, peak = measure(fn)
+            print(f"{num_boards:>8} {name:<12} {elapsed:>9.3f} {peak / 1e6:>9.1f} {'':>10}")
+
+
+if __name__ == "__main__":
+    main()
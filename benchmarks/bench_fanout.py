@@ -0,0 +1,103 @@
+"""
+CPU per broadcast on the consumer side of a group_send: every connected
+socket's handler re-encoding the event (the old consumers) versus forwarding
+the frame encoded once at the group_send site. Both go through each socket's
+outbox and writer task. Sockets are in-process consumers whose sends are
+discarded, so only handler work is measured.
+
+    python benchmarks/bench_fanout.py [sockets ...]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shiftjoy.settings")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")  # Never contacted
+
+import django
+
+django.setup()
+
+from bingo import frames
+from bingo.consumers import BingoGameConsumer
+
+EVENT = {
+    "type": "phrase_called",
+    "phrase": "Someone says 'synergy' during the all-hands meeting",
+    "phrase_id": 17,
+    "total_called": 31,
+    "seq": 57,
+}
+
+
+async def discard(message):
+    pass
+
+
+def sockets(n):
+    consumers = []
+    for _ in range(n):
+        consumer = BingoGameConsumer()
+        consumer.base_send = discard
+        consumer.init_state()
+        consumers.append(consumer)
+    return consumers
+
+
+async def sent(consumers):
+    # Until every writer has sent the frame
+    while any(consumer.outbox for consumer in consumers):
+        await asyncio.sleep(0)
+
+
+async def per_socket(consumers, seq):
+    # What each handler used to do: build and encode its own frame
+    event = dict(EVENT, seq=seq)
+    for consumer in consumers:
+        await consumer.forward(seq, event["type"], json.dumps({
+            "type": "phrase_called",
+            "phrase": event["phrase"],
+            "phrase_id": event["phrase_id"],
+            "total_called": event["total_called"],
+            "seq": event["seq"],
+        }))
+    await sent(consumers)
+
+
+async def encode_once(consumers, seq):
+    event = dict(EVENT, seq=seq)
+    message = {"type": event["type"], "seq": seq, **frames.encode_all(event)}
+    for consumer in consumers:
+        await consumer.phrase_called(message)
+    await sent(consumers)
+
+
+def per_broadcast(fn, consumers, repeat=50):
+    async def run():
+        for consumer in consumers:
+            consumer.writer = asyncio.create_task(consumer.write())
+        best = float("inf")
+        for seq in range(1, repeat + 1):
+            start = time.process_time()
+            await fn(consumers, seq)
+            best = min(best, time.process_time() - start)
+        for consumer in consumers:
+            consumer.writer.cancel()
+        return best
+    return asyncio.run(run())
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [256, 5000]
+    print(f"{'sockets':>8} {'per-socket ms':>14} {'encode-once ms':>15} {'speedup':>8}")
+    for n in counts:
+        before = per_broadcast(per_socket, sockets(n))
+        after = per_broadcast(encode_once, sockets(n))
+        print(f"{n:>8} {before * 1000:>14.3f} {after * 1000:>15.3f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
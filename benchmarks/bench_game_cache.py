@@ -0,0 +1,60 @@
+"""
+Latency of the async board read behind BoardView with the per-worker game
+cache cold (every read goes to Redis) and warm, plus the cache counters.
+Needs a Redis server at REDIS_URL; the benchmark game is deleted afterwards.
+
+    python benchmarks/bench_game_cache.py [num_boards] [reads]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shiftjoy.settings")
+
+import django
+
+django.setup()
+
+from bingo import redis_game_store as store
+from bingo.bingoServer import create_game
+
+GAME_ID = "bench-game-cache"
+
+
+async def reads(board_uuids, n, cold):
+    start = time.perf_counter()
+    for i in range(n):
+        if cold:
+            store._layouts.clear()
+            store._states.clear()
+        await store.aget_board(GAME_ID, board_uuids[i % len(board_uuids)])
+    return (time.perf_counter() - start) / n
+
+
+async def run(num_boards, n):
+    game = create_game(GAME_ID, num_boards, [f"Phrase {i}" for i in range(75)])
+    store.save_game(GAME_ID, game)
+    board_uuids = list(game["board_assignments"])
+    try:
+        await store.aget_board(GAME_ID, board_uuids[0])  # Connect and start the listener
+        await asyncio.sleep(0.5)
+        cold = await reads(board_uuids, n, cold=True)
+        warm = await reads(board_uuids, n, cold=False)
+    finally:
+        store._redis(GAME_ID)[0].delete(*store._keys(GAME_ID))
+    return cold, warm
+
+
+def main():
+    num_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    cold, warm = asyncio.run(run(num_boards, n))
+    print(f"{'boards':>8} {'cold ms':>9} {'warm ms':>9} {'speedup':>8}")
+    print(f"{num_boards:>8} {cold * 1000:>9.3f} {warm * 1000:>9.3f} {cold / warm:>7.1f}x")
+    print(store.cache_stats())
+
+
+if __name__ == "__main__":
+    main()
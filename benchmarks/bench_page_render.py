@@ -0,0 +1,73 @@
+"""
+Render time of the admin dashboard shell (boards are fetched separately from
+the admin API) and a player's board page as games grow, the board page with
+its grid rendered from scratch (first request) and from the fragment cache
+(every later request). Runs in-process on synthetic games.
+
+    python benchmarks/bench_page_render.py [num_boards ...]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shiftjoy.settings")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")  # Never contacted
+
+import django
+
+django.setup()
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from bingo import fragments
+from bingo.bingoServer import create_game
+
+PHRASE = "Someone says 'synergy' during the all-hands meeting"
+
+
+async def admin_page(game_id, game):
+    return render_to_string("bingo/game_admin.html", {
+        "game_data": game, "game_id": game_id, "phrases_called": game["phrase_table"][:30],
+    })
+
+
+async def board_page(game_id, game):
+    board_uuid, board = next(iter(game["board_assignments"].items()))
+    return render_to_string("bingo/game_board.html", {
+        "game_id": game_id, "board_uuid": board_uuid,
+        "board_html": await fragments.board_html(game_id, board_uuid, board["squares"], game["phrase_table"]),
+        "player_name": "Player 0", "player_email": "p@example.com",
+        "phrases_called": game["phrase_table"][:30], "seq": 31,
+    })
+
+
+async def timed(page, game_id, game, cold, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        start = time.perf_counter()
+        await page(game_id, game)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def run(counts):
+    print(f"{'boards':>8} {'admin ms':>9} {'board cold ms':>14} {'board cached ms':>16}")
+    for n in counts:
+        game_id = f"bench-{n}"
+        game = create_game(game_id, n, [f"{PHRASE} {i}" for i in range(75)])
+        admin = await timed(admin_page, game_id, game, cold=False) * 1000
+        cold, cached = [await timed(board_page, game_id, game, cold) * 1000 for cold in (True, False)]
+        print(f"{n:>8} {admin:>9.3f} {cold:>14.3f} {cached:>16.3f}")
+
+
+def main():
+    asyncio.run(run([int(arg) for arg in sys.argv[1:]] or [64, 1000, 5000]))
+
+
+if __name__ == "__main__":
+    main()
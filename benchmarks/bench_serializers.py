@@ -0,0 +1,70 @@
+"""
+Encode/decode latency and stored bytes for each game store format, with and
+without compression, on a realistic game (claimed boards, called phrases and
+winners).
+
+    python benchmarks/bench_serializers.py [num_boards]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bingo import serializers
+from bingo.bingoServer import create_game
+from bingo.board_codec import board_grid
+
+
+def timed(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def realistic_game(num_boards):
+    phrases = [f"Someone says '{word}' during the all-hands meeting" for word in
+               (f"synergy {i}" for i in range(75))]
+    game = create_game("bench", num_boards, phrases, seed=1)
+    for i, board in enumerate(game["board_assignments"].values()):
+        if i % 4:
+            board.update(assigned=True, player_name=f"Player {i}",
+                         player_email=f"player{i}@example.com", player_id=f"player{i}@example.com")
+    game["phrases_called"] = game["phrase_table"][:30]
+    game["winners"] = [
+        {"board_uuid": board_uuid, "player_name": "Player", "player_email": "p@example.com",
+         "pattern": "traditional", "timestamp": "2026-01-01 12:00:00.000000"}
+        for board_uuid in list(game["board_assignments"])[:10]
+    ]
+    game.pop("phrase_index")
+    # The same game with boards as phrase strings, as in the original blob
+    strings = dict(game, board_assignments={
+        board_uuid: dict(board, board_data=board_grid(board.pop("squares"), game["phrase_table"]))
+        for board_uuid, board in ((u, dict(b)) for u, b in game["board_assignments"].items())
+    })
+    return game, strings
+
+
+def main():
+    num_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    for label, game in zip(("index boards", "string boards"), realistic_game(num_boards)):
+        print(f"{num_boards} boards, {label}")
+        print(f"{'format':<20} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+        blob, enc = timed(lambda: json.dumps(game).encode())
+        _, dec = timed(lambda: json.loads(blob))
+        print(f"{'stdlib json':<20} {len(blob):>10} {enc * 1000:>10.2f} {dec * 1000:>10.2f}")
+        for fmt in ("ujson", "msgpack", "cbor"):
+            for compress_min in (0, 1024):
+                payload, enc = timed(lambda: serializers.dumps(game, fmt, compress_min))
+                _, dec = timed(lambda: serializers.loads(payload))
+                name = fmt + (" + zlib" if compress_min else "")
+                print(f"{name:<20} {len(payload):>10} {enc * 1000:>10.2f} {dec * 1000:>10.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Bytes per WebSocket frame for the default JSON protocol and the binary
+subprotocols (bingo.msgpack, bingo.cbor), for each event type and for a
+reconnect snapshot.
+
+    python benchmarks/bench_wire_formats.py [num_boards]
+"""
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bingo import frames
+
+PHRASE = "Someone says 'synergy' during the all-hands meeting"
+
+
+def events():
+    board_uuid = str(uuid.uuid4())
+    return {
+        "phrase_called": {"type": "phrase_called", "phrase": PHRASE, "phrase_id": 41, "total_called": 31, "seq": 180},
+        "player_joined": {"type": "player_joined", "board_uuid": board_uuid, "board_num": 117,
+                          "player_name": "Player 117", "player_email": "player117@example.com", "seq": 181},
+        "player_won": {"type": "player_won", "board_uuid": board_uuid, "board_num": 117,
+                       "player_name": "Player 117", "pattern": "traditional", "seq": 182},
+    }
+
+
+def snapshot_sizes(num_boards, num_called=40):
+    claimed = [(n, {"player_name": f"Player {n}", "player_email": f"player{n}@example.com"})
+               for n in range(num_boards) if n % 4]
+    text = json.dumps({
+        "type": "snapshot",
+        "seq": 180,
+        "phrases_called": [f"{PHRASE} {i}" for i in range(num_called)],
+        "board_assignments": {
+            str(uuid.uuid4()): {"assigned": n % 4 != 0, "player_name": f"Player {n}" if n % 4 else None,
+                                "player_email": f"player{n}@example.com" if n % 4 else None}
+            for n in range(num_boards)
+        },
+    })
+    sizes = {"text": len(text.encode())}
+    for fmt in ("msgpack", "cbor"):
+        sizes[fmt] = len(frames.encode_snapshot(180, list(range(num_called)), claimed, fmt))
+    return sizes
+
+
+def main():
+    num_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    print(f"{'frame':<24} {'json':>8} {'msgpack':>8} {'cbor':>8}")
+    for name, event in events().items():
+        sizes = {fmt: len(frame.encode() if isinstance(frame, str) else frame)
+                 for fmt, frame in frames.encode_all(event).items()}
+        print(f"{name:<24} {sizes['text']:>8} {sizes['msgpack']:>8} {sizes['cbor']:>8}")
+    sizes = snapshot_sizes(num_boards)
+    print(f"{f'snapshot ({num_boards} boards)':<24} {sizes['text']:>8} {sizes['msgpack']:>8} {sizes['cbor']:>8}")
+
+
+if __name__ == "__main__":
+    main()
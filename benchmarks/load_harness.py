@@ -0,0 +1,267 @@
+"""
+Load test of the full call -> broadcast path against the ASGI application
+(shiftjoy.asgi:application), driven in-process. For each of N games it
+creates the game through the create form, claims M boards, opens M
+WebSocket clients, sends call_phrase bursts and claims wins for completed
+boards. It reports per-request latency, call throughput and the latency
+from each call_phrase POST to its receipt on every socket.
+
+The game store is the Redis at REDIS_URL, or with --fake-redis an
+in-process fakeredis server (pip install fakeredis). The channel layer is
+whatever settings configure (in-memory unless CHANNEL_REDIS_URL is set).
+A summary table goes to stderr and the results, with the current commit,
+to stdout as JSON so runs can be compared across commits:
+
+    python benchmarks/load_harness.py --games 4 --clients 50 > results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shiftjoy.settings")
+# Every simulated player shares one address; measure the app, not the limits
+os.environ.setdefault("BINGO_RATE_LIMITS", "0")
+
+HOST = [(b"host", b"localhost")]
+FORM = [*HOST, (b"content-type", b"application/x-www-form-urlencoded")]
+JSON = [*HOST, (b"content-type", b"application/json")]
+PHRASES = [f"Someone says '{word}' during the all-hands meeting #{i}"
+           for i, word in enumerate(["synergy", "circle back", "bandwidth", "deep dive", "low-hanging fruit"] * 15)]
+
+
+def use_fake_redis():
+    # Must run before the store module creates its clients on import
+    import fakeredis
+    import redis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+    redis.asyncio.from_url = lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    os.environ.setdefault("REDIS_URL", "redis://fakeredis/0")
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {"count": len(ordered), "p50_ms": at(50), "p95_ms": at(95), "p99_ms": at(99), "max_ms": at(100)}
+
+
+class Harness:
+    def __init__(self, application, args):
+        self.application = application
+        self.args = args
+        self.latencies = {"create": [], "claim_board": [], "call_phrase": [], "claim_win": [], "delivery": []}
+        self.errors = {name: 0 for name in self.latencies}
+        self.sent_at = {}  # (game_id, phrase) -> call_phrase POST start
+        self.delivered = 0
+        self.expected = 0
+
+    async def http(self, method, path, body=b"", headers=HOST):
+        from channels.testing import HttpCommunicator
+
+        communicator = HttpCommunicator(self.application, method, path, body, headers)
+        response = await communicator.get_response(timeout=30)
+        return response, communicator
+
+    async def request(self, name, method, path, body=b"", headers=HOST):
+        start = time.perf_counter()
+        response, communicator = await self.http(method, path, body, headers)
+        self.latencies[name].append(time.perf_counter() - start)
+        if response["status"] >= 400:
+            self.errors[name] += 1
+        await self.close(communicator)
+        return response
+
+    async def close(self, communicator):
+        # Django keeps listening for the client to go away after responding
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=30)
+
+    async def create_game(self):
+        body = urlencode({"phrases": "\n".join(PHRASES), "num_players": self.args.clients}).encode()
+        response = await self.request("create", "POST", "/bingo/create/", body, FORM)
+        location = dict(response["headers"])[b"Location"].decode()
+        return location.rstrip("/").rsplit("/", 1)[-1]
+
+    async def boards(self, game_id, status=None):
+        boards, offset = [], 0
+        while offset is not None:
+            query = urlencode({"offset": offset, "limit": 200, **({"filter": status} if status else {})})
+            response, communicator = await self.http("GET", f"/bingo/admin/{game_id}/boards/?{query}")
+            await self.close(communicator)
+            page = json.loads(response["body"])
+            boards.extend(page["boards"])
+            offset = page["next_offset"]
+        return boards
+
+    async def listen(self, game_id, communicator):
+        while True:
+            message = await communicator.output_queue.get()
+            if message.get("type") != "websocket.send" or "text" not in message:
+                continue
+            event = json.loads(message["text"])
+            if event.get("type") == "phrase_called":
+                phrases = [event["phrase"]]
+            elif event.get("type") == "phrases_called":
+                phrases = event["phrases"]
+            else:
+                continue
+            for phrase in phrases:
+                sent = self.sent_at.get((game_id, phrase))
+                if sent is not None:
+                    self.latencies["delivery"].append(time.perf_counter() - sent)
+                    self.delivered += 1
+
+    async def call(self, game_id, phrase, sockets):
+        self.sent_at[(game_id, phrase)] = time.perf_counter()
+        response = await self.request(
+            "call_phrase", "POST", f"/bingo/games/{game_id}/call/", json.dumps({"phrase": phrase}).encode(), JSON
+        )
+        if response["status"] == 200:
+            self.expected += sockets
+        return response["status"] == 200
+
+    async def claim_wins(self, game_id):
+        from bingo.bingoServer import WIN_PATTERNS, compile_win_patterns
+
+        compiled = compile_win_patterns(WIN_PATTERNS)
+        for board in await self.boards(game_id, "claimed"):
+            if board["to_win"] != 0:
+                continue
+            for pattern, masks in compiled.items():
+                mask = next((m for m in masks if board["marked"] & m == m), None)
+                if mask is not None:
+                    positions = [pos for pos in range(25) if mask >> pos & 1]
+                    await self.request("claim_win", "POST", f"/bingo/games/{game_id}/claim-win/", json.dumps({
+                        "board_uuid": board["board_uuid"], "pattern": pattern, "positions": positions,
+                    }).encode(), JSON)
+                    break
+
+    async def run_game(self, rng):
+        from channels.testing import WebsocketCommunicator
+
+        game_id = await self.create_game()
+        for board in await self.boards(game_id):
+            body = urlencode({"player_name": f"Player {board['board_num']}",
+                              "player_email": f"player{board['board_num']}@example.com"}).encode()
+            await self.request("claim_board", "POST", f"/bingo/games/{game_id}/{board['board_uuid']}/", body, FORM)
+
+        sockets = []
+        for _ in range(self.args.clients):
+            communicator = WebsocketCommunicator(self.application, f"/ws/bingo/{game_id}/")
+            connected, _ = await communicator.connect(timeout=30)
+            if connected:
+                sockets.append(communicator)
+        listeners = [asyncio.create_task(self.listen(game_id, c)) for c in sockets]
+
+        phrases = rng.sample(PHRASES, min(self.args.calls, len(PHRASES)))
+        call_start = time.perf_counter()
+        called = 0
+        for first in range(0, len(phrases), self.args.burst):
+            burst = phrases[first:first + self.args.burst]
+            called += sum(await asyncio.gather(*(self.call(game_id, phrase, len(sockets)) for phrase in burst)))
+        return game_id, sockets, listeners, called, time.perf_counter() - call_start
+
+    async def run(self):
+        rng = random.Random(self.args.seed)
+        start = time.perf_counter()
+        games = await asyncio.gather(*(self.run_game(random.Random(rng.random())) for _ in range(self.args.games)))
+        calls_done = time.perf_counter()
+
+        # Wait for every socket to receive every successful call
+        deadline = time.monotonic() + self.args.drain_timeout
+        while self.delivered < self.expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        drained = time.perf_counter()
+
+        for game_id, *_ in games:
+            await self.claim_wins(game_id)
+        for _, sockets, listeners, *_ in games:
+            for listener in listeners:
+                listener.cancel()
+            for communicator in sockets:
+                await communicator.disconnect()
+
+        calls = sum(game[3] for game in games)
+        return {
+            "calls": calls,
+            "calls_per_s": round(calls / (calls_done - start), 1) if calls_done > start else None,
+            "deliveries": self.delivered,
+            "expected_deliveries": self.expected,
+            "deliveries_per_s": round(self.delivered / (drained - start), 1) if drained > start else None,
+            "call_phase_s": round(max(game[4] for game in games), 3),
+            "total_s": round(time.perf_counter() - start, 3),
+        }
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=50, help="boards claimed and sockets opened per game")
+    parser.add_argument("--calls", type=int, default=30, help="phrases called per game")
+    parser.add_argument("--burst", type=int, default=5, help="concurrent call_phrase requests per game")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument("--fake-redis", action="store_true", help="use an in-process fakeredis server")
+    args = parser.parse_args()
+
+    if args.fake_redis:
+        use_fake_redis()
+    elif not os.environ.get("REDIS_URL"):
+        parser.error("set REDIS_URL or pass --fake-redis")
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from shiftjoy.asgi import application
+
+    harness = Harness(application, args)
+    # Keep stdout for the JSON results; the consumers print per connection
+    with contextlib.redirect_stdout(sys.stderr):
+        throughput = asyncio.run(harness.run())
+    results = {
+        "commit": commit(),
+        "config": {key: value for key, value in vars(args).items()},
+        "channel_layer": settings.CHANNEL_LAYERS["default"]["BACKEND"],
+        "throughput": throughput,
+        "latency": {name: dict(percentiles(samples), errors=harness.errors[name])
+                    for name, samples in harness.latencies.items()},
+    }
+
+    print(f"{'operation':<12} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    for name, stats in results["latency"].items():
+        print(f"{name:<12} {stats['count']:>7} {stats['errors']:>7} {stats.get('p50_ms', 0):>9.2f} "
+              f"{stats.get('p95_ms', 0):>9.2f} {stats.get('p99_ms', 0):>9.2f}", file=sys.stderr)
+    print(f"{throughput['calls_per_s']} calls/s, {throughput['deliveries']}/{throughput['expected_deliveries']} "
+          f"deliveries ({throughput['deliveries_per_s']}/s)", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
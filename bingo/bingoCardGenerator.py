@@ -1,26 +1,100 @@
-import random
+import numpy as np
 
-def bingoCardGenerator(phrases, num_boards):
+FREE_SPACE_INDEX = 0xFFFF  # Marks the centre square in index boards
+MAX_PHRASES = FREE_SPACE_INDEX  # Indices must stay below the Free Space marker
+PHRASES_PER_BOARD = 24
+
+
+def generate_board_indices(num_phrases, num_boards, seed=None, unique=True):
+    """
+    Generate bingo boards in bulk as phrase indices.
+
+    Boards are dealt 24 at a time from a stream of shuffled "decks" (one
+    permutation of all phrases each), so every phrase is used within one
+    time of every other across the game. Where a board straddles two decks,
+    repeats are swapped out with squares from the middle of the newer deck,
+    which keeps the counts even.
+
+    Args:
+        num_phrases: Size of the phrase table (48 to MAX_PHRASES)
+        num_boards: Number of boards to generate
+        seed: Seed for reproducible boards (None for a random game)
+        unique: Guarantee no two boards have the same layout
+
+    Returns:
+        np.ndarray: (num_boards, 25) uint16, row-major, with FREE_SPACE_INDEX at 12
+    """
+    if num_phrases < 48:
+        raise ValueError(f"MUST provide at least 48 phrases for competitive play. Got {num_phrases}.")
+    if num_phrases > MAX_PHRASES:
+        raise ValueError(f"At most {MAX_PHRASES} phrases. Got {num_phrases}.")
+
+    rng = np.random.default_rng(seed)
+    needed = num_boards * PHRASES_PER_BOARD
+    num_decks = -(-needed // num_phrases)
+    decks = rng.permuted(np.tile(np.arange(num_phrases, dtype=np.uint16), (num_decks, 1)), axis=1)
+
+    # A board straddles decks d and d+1 when the boundary is not a multiple of
+    # 24: its last `tail` squares come from the end of deck d and its first
+    # `head` squares from the start of deck d+1. Find boundaries whose two
+    # halves share a phrase, using each deck's inverse permutation.
+    boundaries = np.arange(1, num_decks) * num_phrases
+    tails = boundaries % PHRASES_PER_BOARD
+    heads = (PHRASES_PER_BOARD - tails) % PHRASES_PER_BOARD
+    ranks = np.empty_like(decks)
+    ranks[np.arange(num_decks)[:, None], decks] = np.arange(num_phrases, dtype=np.uint16)
+    in_tail = ranks[:-1] >= (num_phrases - tails)[:, None]
+    in_head = ranks[1:] < heads[:, None]
+    for d in np.flatnonzero((in_tail & in_head).any(axis=1)):
+        deck = decks[d + 1]
+        head, tail = heads[d], tails[d]
+        # Swap candidates sit between this board and the one straddling the
+        # next boundary, so fixing one boundary never disturbs another.
+        next_tail = tails[d + 1] if d + 1 < len(tails) else 0
+        taken = set(decks[d, num_phrases - tail:].tolist())
+        spare = (k for k in range(head, num_phrases - next_tail) if int(deck[k]) not in taken)
+        for j in range(head):
+            if int(deck[j]) in taken:
+                k = next(spare)
+                deck[j], deck[k] = deck[k], deck[j]
+
+    picks = decks.reshape(-1)[:needed].reshape(num_boards, PHRASES_PER_BOARD)
+
+    if unique:
+        # Reshuffling a repeated board's squares keeps phrase counts unchanged
+        while True:
+            _, first = np.unique(picks, axis=0, return_index=True)
+            repeats = np.setdiff1d(np.arange(num_boards), first)
+            if not len(repeats):
+                break
+            picks[repeats] = rng.permuted(picks[repeats], axis=1)
+
+    free = np.full((num_boards, 1), FREE_SPACE_INDEX, dtype=np.uint16)
+    return np.hstack([picks[:, :12], free, picks[:, 12:]])
+
+
+def bingoCardGenerator(phrases, num_boards, seed=None):
     """
     Generate bingo boards from a list of phrases.
-    
+
     Args:
         phrases: List of phrase strings (MUST be 48+)
         num_boards: Number of boards to generate
-        
+        seed: Seed for reproducible boards (None for a random game)
+
     Returns:
         dict: {0: [[row0], [row1], ...], 1: [[row0], [row1], ...], ...}
     """
     if len(phrases) < 48:
         raise ValueError(f"MUST provide at least 48 phrases for competitive play. Got {len(phrases)}.")
-    
+
+    table = list(phrases) + ["Free Space"]
+    indices = generate_board_indices(len(phrases), num_boards, seed=seed)
+    indices[:, 12] = len(phrases)
+
     boards = {}
-    
-    for board_num in range(num_boards):
-        selected_phrases = random.sample(phrases, 24)
-        random.shuffle(selected_phrases)
-        selected_phrases.insert(12, "Free Space")
-        board = [selected_phrases[i*5:(i+1)*5] for i in range(5)]
-        boards[board_num] = board
-    
-    return boards
\ No newline at end of file
+    for board_num, board in enumerate(indices.tolist()):
+        squares = [table[i] for i in board]
+        boards[board_num] = [squares[i*5:(i+1)*5] for i in range(5)]
+
+    return boards
@@ -1,23 +1,61 @@
+import copy
 import uuid
 import json
+import secrets
 import sys
-from .bingoCardGenerator import bingoCardGenerator
+from .bingoCardGenerator import FREE_SPACE_INDEX, generate_board_indices
 
+FREE_SPACE = "Free Space"
 
-def create_game(game_id, num_boards, phrases):
+# Win patterns (positions in row-major order: 0-24)
+WIN_PATTERNS = {
+    "traditional": {
+        "rows": [[0,1,2,3,4], [5,6,7,8,9], [10,11,12,13,14], [15,16,17,18,19], [20,21,22,23,24]],
+        "cols": [[0,5,10,15,20], [1,6,11,16,21], [2,7,12,17,22], [3,8,13,18,23], [4,9,14,19,24]],
+        "diags": [[0,6,12,18,24], [4,8,12,16,20]]
+    },
+    "four_corners": [[0, 4, 20, 24]],
+    "x": [[0,6,12,18,24,4,8,16,20]],
+    "around_the_world": [[0,1,2,3,4,9,14,19,24,23,22,21,20,15,10,5]],
+    "full_board": [[i for i in range(25)]]
+}
+
+
+def build_phrase_index(board_assignments, phrase_table):
+    """
+    Map each callable phrase to the boards and positions it appears on.
+    Returns {phrase: [[board_num, position], ...]}; positions are row-major 0-24.
+    """
+    phrase_index = {}
+    for board in board_assignments.values():
+        for pos, i in enumerate(board["squares"]):
+            if i == FREE_SPACE_INDEX:
+                continue
+            phrase_index.setdefault(phrase_table[i], []).append([board["board_num"], pos])
+    return phrase_index
+
+
+def create_game(game_id, num_boards, phrases, seed=None):
     """
-    Generate complete game data structure.
+    Generate complete game data structure. Boards are reproducible from the
+    stored seed; a random one is picked when none is given.
     """
-    boards = bingoCardGenerator(phrases, num_boards)
+    if seed is None:
+        seed = secrets.randbits(63)
+    
+    # Game-level phrase table (each distinct phrase once, in input order).
+    # Boards are stored as 25 indices into it; see board_codec.
+    phrase_table = list(dict.fromkeys(p for p in phrases if p != FREE_SPACE))
+    boards = generate_board_indices(len(phrase_table), num_boards, seed=seed)
     
     board_assignments = {}
     player_links = []
     
-    for board_num in range(num_boards):
+    for board_num, squares in enumerate(boards.tolist()):
         board_uuid = str(uuid.uuid4())
         board_assignments[board_uuid] = {
             "board_num": board_num,
-            "board_data": boards[board_num],
+            "squares": squares,
             "assigned": False,
             "player_id": None,
         }
@@ -25,23 +63,15 @@ def create_game(game_id, num_boards, phrases):
         link = f"website.com/bingo/games/{game_id}/{board_uuid}"
         player_links.append(link)
     
-    # Win patterns (positions in row-major order: 0-24)
-    win_patterns = {
-        "traditional": {
-            "rows": [[0,1,2,3,4], [5,6,7,8,9], [10,11,12,13,14], [15,16,17,18,19], [20,21,22,23,24]],
-            "cols": [[0,5,10,15,20], [1,6,11,16,21], [2,7,12,17,22], [3,8,13,18,23], [4,9,14,19,24]],
-            "diags": [[0,6,12,18,24], [4,8,12,16,20]]
-        },
-        "four_corners": [[0, 4, 20, 24]],
-        "x": [[0,6,12,18,24,4,8,16,20]],
-        "around_the_world": [[0,1,2,3,4,9,14,19,24,23,22,21,20,15,10,5]],
-        "full_board": [[i for i in range(25)]]
-    }
-    
+    win_patterns = copy.deepcopy(WIN_PATTERNS)
+
     return {
         "game_id": game_id,
         "num_boards": num_boards,
         "board_assignments": board_assignments,
+        "seed": seed,
+        "phrase_table": phrase_table,
+        "phrase_index": build_phrase_index(board_assignments, phrase_table),
         "player_links": player_links,
         "phrases_called": [],
         "game_state": "waiting",
@@ -52,6 +82,48 @@ def create_game(game_id, num_boards, phrases):
     }
 
 
+def positions_mask(positions):
+    """25-bit mask with bit N set for each board position N."""
+    mask = 0
+    for pos in positions:
+        mask |= 1 << pos
+    return mask
+
+
+def board_mask(squares, called_indices):
+    """Marked-squares mask for a board; Free Space is always marked."""
+    return positions_mask(
+        pos for pos, i in enumerate(squares) if i == FREE_SPACE_INDEX or i in called_indices
+    )
+
+
+def compile_win_patterns(win_patterns):
+    """
+    Flatten win_patterns into {pattern_name: [mask, ...]}. Nested groups
+    (traditional rows/cols/diags) all count as their top-level pattern.
+    """
+    compiled = {}
+    for name, group in win_patterns.items():
+        lines = [line for lines in group.values() for line in lines] if isinstance(group, dict) else group
+        compiled[name] = [positions_mask(line) for line in lines]
+    return compiled
+
+
+def find_new_wins(compiled_patterns, marked, new_bits):
+    """
+    Given each affected board's mask after a call ({board_num: mask}) and the
+    bits that call set ({board_num: bits}), return the (board_num, pattern)
+    pairs the call completed for the first time.
+    """
+    wins = []
+    for board_num, mask in marked.items():
+        before = mask & ~new_bits[board_num]
+        for name, masks in compiled_patterns.items():
+            if any(mask & m == m for m in masks) and not any(before & m == m for m in masks):
+                wins.append((board_num, name))
+    return wins
+
+
 # CLI interface for testing
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -0,0 +1,43 @@
+import struct
+
+from .bingoCardGenerator import FREE_SPACE_INDEX, MAX_PHRASES
+from .bingoServer import FREE_SPACE
+
+# A stored board is a format tag, the board number and its 25 squares as
+# indices into the game's phrase table, row-major. Games with fewer than 255
+# phrases use one byte per square (0xFF is Free Space), larger ones two
+# (0xFFFF is Free Space, so at most MAX_PHRASES phrases).
+#   tag 1: >B I 25B   (30 bytes)
+#   tag 2: >B I 25H   (55 bytes)
+_NARROW = struct.Struct(">BI25B")
+_WIDE = struct.Struct(">BI25H")
+_NARROW_FREE = 0xFF
+
+
+def encode_board(board_num, squares, table_size):
+    if table_size > MAX_PHRASES:
+        raise ValueError(f"At most {MAX_PHRASES} phrases. Got {table_size}.")
+    if table_size < _NARROW_FREE:
+        return _NARROW.pack(1, board_num, *(_NARROW_FREE if i == FREE_SPACE_INDEX else i for i in squares))
+    return _WIDE.pack(2, board_num, *squares)
+
+
+def decode_board(data):
+    """Returns (board_num, squares) for a packed board."""
+    if data[0] == 1:
+        _, board_num, *squares = _NARROW.unpack(data)
+        return board_num, [FREE_SPACE_INDEX if i == _NARROW_FREE else i for i in squares]
+    _, board_num, *squares = _WIDE.unpack(data)
+    return board_num, squares
+
+
+def board_grid(squares, phrase_table):
+    """Expand phrase indices into the 5x5 grid of phrase strings."""
+    phrases = [FREE_SPACE if i == FREE_SPACE_INDEX else phrase_table[i] for i in squares]
+    return [phrases[i*5:(i+1)*5] for i in range(5)]
+
+
+def grid_squares(board_data, phrase_table):
+    """Inverse of board_grid, for boards stored as 5x5 phrase strings."""
+    lookup = {phrase: i for i, phrase in enumerate(phrase_table)}
+    return [FREE_SPACE_INDEX if phrase == FREE_SPACE else lookup[phrase] for row in board_data for phrase in row]
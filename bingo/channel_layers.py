@@ -0,0 +1,34 @@
+from channels_redis.core import RedisChannelLayer
+
+from .sharding import HashRing, node_name
+
+GROUP_PREFIX = "bingo_game_"
+
+
+def game_group(game_id):
+    """The channel layer group of a game's sockets."""
+    return f"{GROUP_PREFIX}{game_id}"
+
+
+class GameShardedChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer that puts each game's group on the host the game store
+    hashes the game to (see sharding.py), instead of by CRC of the group
+    name. With the same Redis URLs for both, a game's keys, events and
+    sockets' group live on one node and adding a node moves only its share.
+    """
+
+    def __init__(self, hosts=None, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        names = [
+            node_name(host["address"]) if isinstance(host.get("address"), str) else str(i)
+            for i, host in enumerate(self.hosts)
+        ]
+        self._ring = HashRing(range(len(self.hosts)), name=names.__getitem__)
+
+    def consistent_hash(self, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        if value.startswith(GROUP_PREFIX):
+            return self._ring.index_for(value[len(GROUP_PREFIX):])
+        return super().consistent_hash(value)
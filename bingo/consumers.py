@@ -1,57 +1,282 @@
+import asyncio
+import collections
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from . import frames, metrics
+from .channel_layers import game_group
+from .game_store import store
+from .views import board_states
+
+# Each socket's frames go through an outbox drained by its own writer task,
+# so a slow client never holds up the channel layer. Clients that connect
+# with ?ack=1 report the last seq they processed, and at most OUTBOX_WINDOW
+# frames are sent ahead of that; the rest wait in the outbox. When more than
+# OUTBOX_SIZE are waiting, everything a snapshot covers (all but player_won)
+# is dropped and one snapshot is sent instead. A socket whose writer has made
+# no progress for OUTBOX_STALL_TIMEOUT seconds is closed with a resume hint.
+OUTBOX_SIZE = getattr(settings, 'BINGO_WS_OUTBOX_SIZE', 64)
+OUTBOX_WINDOW = getattr(settings, 'BINGO_WS_OUTBOX_WINDOW', 16)
+OUTBOX_STALL_TIMEOUT = getattr(settings, 'BINGO_WS_OUTBOX_STALL_TIMEOUT', 30)
+# Close code for stuck sockets; the reason is "last_seq=<seq>", the seq to
+# reconnect with
+STALLED = 4008
+# Events a snapshot (phrases called and board claims) makes redundant
+SNAPSHOT_COVERS = {'phrase_called', 'phrases_called', 'player_joined', 'players_joined'}
+# Concurrent mutations can reach a socket out of order. An event that skips
+# a seq is held this many seconds for the missing ones, which are then read
+# from the game's event log
+GAP_WAIT = 0.25
+
 
 class BingoGameConsumer(AsyncWebsocketConsumer):
+    def init_state(self, frame_format='text', acks=False):
+        """Per-socket delivery state, set up before the socket gets any event."""
+        self.frame_format = frame_format
+        # Every event up to last_seq has been queued; later ones that arrived
+        # early wait in held, {seq: (type, frame)}
+        self.last_seq = 0
+        self.held = {}
+        self.gap_filler = None
+        # (seq, type, frame) waiting to be sent; a pending snapshot replaces
+        # whatever it covers
+        self.outbox = collections.deque()
+        self.snapshot_pending = self.snapshot_reading = False
+        # Seqs sent but not yet acknowledged, for clients that acknowledge
+        self.acks = acks
+        self.in_flight = collections.deque()
+        self.sent_seq = self.acked_seq = 0
+        self.blocked_since = None
+        self.closing = False
+        self.ready = asyncio.Event()
+        self.writer = None
+
     async def connect(self):
         self.game_id = self.scope['url_route']['kwargs']['game_id']
-        self.room_group_name = f'bingo_game_{self.game_id}'
-        
+        self.room_group_name = game_group(self.game_id)
+        query = parse_qs(self.scope['query_string'].decode())
+        # Clients may ask for a binary subprotocol (see frames); JSON otherwise
+        subprotocol = next((p for p in self.scope.get('subprotocols', []) if p in frames.SUBPROTOCOLS), None)
+        self.init_state(frames.SUBPROTOCOLS.get(subprotocol, 'text'), acks=query.get('ack') == ['1'])
+
+        metrics.probe_event_loop()
+        metrics.WEBSOCKETS.inc()
+        # A connecting player keeps the game alive (and rehydrates it if archived)
+        await store.anote_activity(self.game_id)
+
         # Join game room
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        
-        await self.accept()
+
+        await self.accept(subprotocol)
+        self.writer = asyncio.create_task(self.write())
         print(f"WebSocket connected to game {self.game_id}")
-    
+
+        # Reconnecting clients pass the last seq they saw. Group messages are
+        # not dispatched until connect returns, so live events queue up behind
+        # the replay and anything both logged and queued is sent once
+        last_seq = query.get('last_seq', [''])[0]
+        if last_seq.isdecimal():
+            self.acked_seq = int(last_seq)
+            await self.resume(int(last_seq))
+        else:
+            # Live events start after the current version
+            self.last_seq = await store.aget_version(self.game_id) or 0
+
     async def disconnect(self, close_code):
+        metrics.WEBSOCKETS.dec()
+        for task in (self.writer, self.gap_filler):
+            if task:
+                task.cancel()
+        if self.outbox:
+            metrics.WS_OUTBOX.dec(amount=len(self.outbox))
+            self.outbox.clear()
+
         # Leave game room
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
         print(f"WebSocket disconnected from game {self.game_id}")
-    
-    async def receive(self, text_data):
-        # This method handles messages FROM clients
-        # We don't need it for now since clients only listen
-        pass
-    
-    # Handler for phrase_called events
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # The only message clients send is {"type": "ack", "seq": n}
+        try:
+            message = json.loads(text_data or '')
+            seq = int(message['seq']) if message.get('type') == 'ack' else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return
+        if seq is None:
+            return
+        self.acked_seq = max(self.acked_seq, seq)
+        while self.in_flight and self.in_flight[0] <= seq:
+            self.in_flight.popleft()
+        self.ready.set()
+
+    async def resume(self, last_seq):
+        events = await store.aevents_since(self.game_id, last_seq)
+        if events is not None:
+            self.last_seq = last_seq
+            for event in events:
+                await self.forward(event['seq'], event['type'], frames.encode(event, self.frame_format))
+            return
+
+        # Missed events were trimmed from the log; send the current state
+        self.request_snapshot()
+
+    async def snapshot(self):
+        """(seq, frame) for the game's current state, or None if it is gone."""
+        if self.frame_format != 'text':
+            state = await store.aget_indexed_state(self.game_id)
+            if state is None:
+                return None
+            return state[0], frames.encode_snapshot(*state, self.frame_format)
+
+        assignments = await store.aget_assignments(self.game_id)
+        if assignments is None:
+            return None
+        version, phrases_called, claims = assignments
+        return version, json.dumps({
+            'type': 'snapshot',
+            'seq': version,
+            'phrases_called': phrases_called,
+            'board_assignments': board_states(claims)
+        })
+
+    def request_snapshot(self):
+        covered = [entry for entry in self.outbox if entry[1] in SNAPSHOT_COVERS]
+        if covered:
+            self.outbox = collections.deque(entry for entry in self.outbox if entry[1] not in SNAPSHOT_COVERS)
+            metrics.WS_OUTBOX.dec(amount=len(covered))
+        self.snapshot_pending = True
+        self.ready.set()
+
+    async def forward(self, seq, kind, frame):
+        # Skip events already replayed or covered by a snapshot
+        if seq <= self.last_seq or self.closing:
+            return
+        if self.blocked_since is not None and (
+            asyncio.get_running_loop().time() - self.blocked_since > OUTBOX_STALL_TIMEOUT
+        ):
+            await self.stalled()
+            return
+        if self.snapshot_pending:
+            # The snapshot covers what was logged before it is read. Wins, and
+            # anything arriving while it is read, wait for it in held
+            if kind not in SNAPSHOT_COVERS or self.snapshot_reading:
+                self.held[seq] = (kind, frame)
+            return
+        self.held[seq] = (kind, frame)
+        self.release()
+
+    def release(self):
+        # Queue held events up to the first missing seq
+        while self.last_seq + 1 in self.held and not self.snapshot_pending:
+            self.last_seq += 1
+            self.queue(self.last_seq, *self.held.pop(self.last_seq))
+        if self.held and not self.snapshot_pending and (self.gap_filler is None or self.gap_filler.done()):
+            self.gap_filler = asyncio.create_task(self.fill_gap())
+
+    async def fill_gap(self):
+        await asyncio.sleep(GAP_WAIT)
+        if not self.held or self.snapshot_pending or self.closing:
+            return
+        # Events are logged before they are broadcast, so the log has the
+        # missing ones unless they were trimmed
+        events = await store.aevents_since(self.game_id, self.last_seq)
+        if events is None:
+            self.request_snapshot()
+            return
+        for event in events:
+            if event['seq'] > self.last_seq:
+                self.held[event['seq']] = (event['type'], frames.encode(event, self.frame_format))
+        self.release()
+
+    def queue(self, seq, kind, frame):
+        self.outbox.append((seq, kind, frame))
+        metrics.WS_OUTBOX.inc()
+        metrics.WS_OUTBOX_DEPTH.observe(len(self.outbox))
+        if len(self.outbox) > OUTBOX_SIZE:
+            metrics.WS_COALESCED.inc()
+            self.request_snapshot()
+        self.ready.set()
+
+    async def stalled(self):
+        self.closing = True
+        metrics.WS_STALLED.inc()
+        resume_seq = self.acked_seq if self.acks else self.sent_seq
+        print(f"Closing stalled WebSocket for game {self.game_id} at seq {resume_seq}")
+        await self.close(code=STALLED, reason=f"last_seq={resume_seq}")
+
+    def window_full(self):
+        return self.acks and len(self.in_flight) >= OUTBOX_WINDOW
+
+    async def write(self):
+        # Sends the outbox in order, then any pending snapshot, as the window allows
+        loop = asyncio.get_running_loop()
+        while True:
+            if not (self.outbox or self.snapshot_pending) or self.window_full():
+                # Waiting on the client counts as blocked; an empty outbox does not
+                if not (self.outbox or self.snapshot_pending):
+                    self.blocked_since = None
+                elif self.blocked_since is None:
+                    self.blocked_since = loop.time()
+                await self.ready.wait()
+                self.ready.clear()
+                continue
+            if self.blocked_since is None:
+                self.blocked_since = loop.time()
+            if not self.outbox:
+                self.snapshot_reading = True
+                snapshot = await self.snapshot()
+                self.snapshot_pending = self.snapshot_reading = False
+                if snapshot is None:
+                    self.closing = True
+                    await self.close()
+                    return
+                self.send_snapshot(*snapshot)
+            seq, _, frame = self.outbox.popleft()
+            metrics.WS_OUTBOX.dec()
+            if self.frame_format == 'text':
+                await self.send(text_data=frame)
+            else:
+                await self.send(bytes_data=frame)
+            self.sent_seq = max(self.sent_seq, seq)
+            if self.acks:
+                self.in_flight.append(seq)
+            self.blocked_since = None
+
+    def send_snapshot(self, seq, frame):
+        # Wins logged before the snapshot go ahead of it; it covers the rest
+        earlier = sorted(held_seq for held_seq in self.held if held_seq <= seq)
+        for held_seq in earlier:
+            kind, held_frame = self.held.pop(held_seq)
+            if kind not in SNAPSHOT_COVERS:
+                self.outbox.append((held_seq, kind, held_frame))
+                metrics.WS_OUTBOX.inc()
+        self.outbox.append((seq, 'snapshot', frame))
+        metrics.WS_OUTBOX.inc()
+        self.last_seq = max(self.last_seq, seq)
+        self.release()
+
+    # Group message handlers. Broadcasts arrive already encoded in every
+    # format (see views._broadcast), so nothing is serialized per socket
     async def phrase_called(self, event):
-        # Send phrase to WebSocket client
-        await self.send(text_data=json.dumps({
-            'type': 'phrase_called',
-            'phrase': event['phrase'],
-            'total_called': event['total_called']
-        }))
-    
-    # Handler for player_joined events
+        await self.forward(event['seq'], event['type'], event[self.frame_format])
+
     async def player_joined(self, event):
-        # Send player info to WebSocket client
-        await self.send(text_data=json.dumps({
-            'type': 'player_joined',
-            'board_uuid': event['board_uuid'],
-            'player_name': event['player_name'],
-            'player_email': event['player_email']
-        }))
+        await self.forward(event['seq'], event['type'], event[self.frame_format])
 
     async def player_won(self, event):
-        # Send win notification to WebSocket client
-        await self.send(text_data=json.dumps({
-            'type': 'player_won',
-            'board_uuid': event['board_uuid'],
-            'player_name': event['player_name'],
-            'pattern': event['pattern']
-        }))
\ No newline at end of file
+        await self.forward(event['seq'], event['type'], event[self.frame_format])
+
+    async def phrases_called(self, event):
+        await self.forward(event['seq'], event['type'], event[self.frame_format])
+
+    async def players_joined(self, event):
+        await self.forward(event['seq'], event['type'], event[self.frame_format])
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .board_codec import board_grid
+from .game_store import GAME_TTL
+
+# Board layouts never change once a game is created, so the HTML that only
+# depends on them is rendered once and kept in the Django cache. Pages add
+# the dynamic part (player, called phrases) around it per request. The admin
+# dashboard instead loads its board cards from the admin_boards API.
+# Each entry keeps the layout it was rendered from and is re-rendered if a
+# game id turns up with another one (a game created again under that id).
+# Bump LAYOUT_VERSION whenever a template under bingo/fragments/ or the
+# entry format changes.
+LAYOUT_VERSION = 2
+
+
+def _key(*parts):
+    return ":".join(("bingo:fragment", str(LAYOUT_VERSION), *map(str, parts)))
+
+
+def board_columns(squares, phrase_table):
+    """The 5x5 grid as columns of {'row', 'col', 'phrase'}, as the board page lays it out."""
+    board_data = board_grid(squares, phrase_table)
+    return [
+        [{'row': row, 'col': col, 'phrase': board_data[row][col]} for row in range(5)]
+        for col in range(5)
+    ]
+
+
+async def _cached(key, layout, render):
+    entry = await cache.aget(key)
+    if entry is None or entry[0] != layout:
+        entry = (layout, render())
+        await cache.aset(key, entry, GAME_TTL)
+    return entry[1]
+
+
+async def board_html(game_id, board_uuid, squares, phrase_table):
+    """The player's board grid."""
+    columns = board_columns(squares, phrase_table)
+    return await _cached(
+        _key("board", game_id, board_uuid),
+        [square['phrase'] for column in columns for square in column],
+        lambda: render_to_string('bingo/fragments/board_grid.html', {'columns': columns}),
+    )
+
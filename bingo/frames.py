@@ -0,0 +1,58 @@
+import json
+
+import cbor2
+import msgpack
+
+# WebSocket frames. JSON text frames (the default) carry events exactly as
+# logged by the store. Clients can instead request a binary subprotocol, whose
+# frames are msgpack or CBOR arrays that refer to phrases by their index in
+# the game's phrase table and to boards by board_num:
+#   [0, seq, [phrase_id, ...], [[board_num, player_name, player_email], ...]]  snapshot
+#   [1, seq, phrase_id, total_called]                                          phrase_called
+#   [2, seq, board_num, player_name, player_email]                             player_joined
+#   [3, seq, board_num, player_name, pattern]                                  player_won
+#   [4, seq, [phrase_id, ...], total_called]                                   phrases_called
+#   [5, seq, [[board_num, player_name, player_email], ...]]                    players_joined
+SUBPROTOCOLS = {"bingo.msgpack": "msgpack", "bingo.cbor": "cbor"}
+SNAPSHOT, PHRASE_CALLED, PLAYER_JOINED, PLAYER_WON, PHRASES_CALLED, PLAYERS_JOINED = range(6)
+
+_encoders = {
+    "msgpack": lambda value: msgpack.packb(value, use_bin_type=True),
+    "cbor": cbor2.dumps,
+}
+
+
+def compact(event):
+    """The binary-protocol array for a logged event."""
+    kind = event["type"]
+    if kind == "phrase_called":
+        return [PHRASE_CALLED, event["seq"], event["phrase_id"], event["total_called"]]
+    if kind == "player_joined":
+        return [PLAYER_JOINED, event["seq"], event["board_num"], event["player_name"], event.get("player_email")]
+    if kind == "player_won":
+        return [PLAYER_WON, event["seq"], event.get("board_num"), event["player_name"], event["pattern"]]
+    if kind == "phrases_called":
+        return [PHRASES_CALLED, event["seq"], event["phrase_ids"], event["total_called"]]
+    if kind == "players_joined":
+        return [PLAYERS_JOINED, event["seq"], [
+            [player["board_num"], player["player_name"], player.get("player_email")] for player in event["players"]
+        ]]
+    raise ValueError(f"Unknown event type {kind!r}")
+
+
+def encode(event, fmt):
+    """One frame for event: str for "text", bytes for a binary format."""
+    if fmt == "text":
+        return json.dumps(event)
+    return _encoders[fmt](compact(event))
+
+
+def encode_all(event):
+    """Every encoding of event, keyed by format, so a broadcast encodes each once."""
+    return {fmt: encode(event, fmt) for fmt in ("text", *_encoders)}
+
+
+def encode_snapshot(seq, phrase_ids, claimed, fmt):
+    """Binary snapshot frame; claimed is [(board_num, claim), ...]."""
+    boards = [[board_num, claim.get("player_name"), claim.get("player_email")] for board_num, claim in claimed]
+    return _encoders[fmt]([SNAPSHOT, seq, phrase_ids, boards])
@@ -0,0 +1,282 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .bingoServer import FREE_SPACE, board_mask, build_phrase_index
+from .board_codec import grid_squares
+
+# Games expire GAME_TTL seconds after their last activity: mutations, reads
+# (at most once per TOUCH_INTERVAL per worker) and socket connects
+GAME_TTL = int(os.environ.get("BINGO_GAME_TTL", 60*60*12))
+TOUCH_INTERVAL = 60
+EVENT_LOG_LENGTH = 1000  # Approximate; older events are trimmed
+NEAR_WIN = 1  # Boards at most this many squares from a win pattern are "near_win"
+# archive_idle_games() moves games idle this many seconds to colder storage;
+# games with a winner go sooner
+ARCHIVE_IDLE = int(os.environ.get("BINGO_ARCHIVE_IDLE", 60*60*2))
+ARCHIVE_FINISHED_IDLE = int(os.environ.get("BINGO_ARCHIVE_FINISHED_IDLE", 60*30))
+
+META_FIELDS = ("game_id", "num_boards", "game_state", "created_at", "host_id", "win_patterns", "phrase_table", "seed")
+CLAIM_FIELDS = ("player_name", "player_email", "player_id")
+
+BACKENDS = {
+    "redis": "bingo.redis_game_store.RedisGameStore",
+    "memory": "bingo.memory_game_store.MemoryGameStore",
+    "sqlite": "bingo.sqlite_game_store.SQLiteGameStore",
+}
+
+
+def prepare_game(game_data):
+    """
+    Normalize game_data (as built by create_game or returned by get_game)
+    for storage: {"meta", "version", "boards": [(board_uuid, board_num,
+    squares), ...] in board order, "claims": {board_uuid: claim}, "index":
+    {phrase: [[board_num, position], ...]}, "marks": {board_num: mask},
+    "links", "called", "winners"}.
+    """
+    meta = {field: game_data.get(field) for field in META_FIELDS}
+    board_assignments = game_data["board_assignments"]
+
+    # Games stored before boards were index-encoded get a phrase table and
+    # index built here
+    if not meta["phrase_table"]:
+        meta["phrase_table"] = list(dict.fromkeys(
+            phrase for board in board_assignments.values()
+            for row in board["board_data"] for phrase in row if phrase != FREE_SPACE
+        ))
+    phrase_table = meta["phrase_table"]
+    for board in board_assignments.values():
+        if "squares" not in board:
+            board["squares"] = grid_squares(board["board_data"], phrase_table)
+
+    table_index = {phrase: i for i, phrase in enumerate(phrase_table)}
+    called_ids = {table_index[p] for p in game_data.get("phrases_called", []) if p in table_index}
+    ordered = sorted(board_assignments.items(), key=lambda item: item[1]["board_num"])
+    return {
+        "meta": meta,
+        "version": game_data.get("version", 0),
+        "boards": [(board_uuid, board["board_num"], board["squares"]) for board_uuid, board in ordered],
+        "claims": {
+            board_uuid: {f: board.get(f) for f in CLAIM_FIELDS}
+            for board_uuid, board in ordered if board.get("assigned")
+        },
+        "index": game_data.get("phrase_index") or build_phrase_index(board_assignments, phrase_table),
+        "marks": {board["board_num"]: board_mask(board["squares"], called_ids) for _, board in ordered},
+        "links": list(game_data.get("player_links") or []),
+        "called": list(game_data.get("phrases_called") or []),
+        "winners": list(game_data.get("winners") or []),
+    }
+
+
+def claim_record(player_name, player_email):
+    return {"player_name": player_name, "player_email": player_email, "player_id": player_email}
+
+
+def board_record(board_num, squares, claim):
+    """A board_assignments entry: board_num, squares and the claim's fields, or unassigned."""
+    board = {"board_num": board_num, "squares": squares}
+    if claim:
+        board.update(claim)
+        board["assigned"] = True
+    else:
+        board["assigned"] = False
+        board["player_id"] = None
+    return board
+
+
+def to_win(marked, win_masks):
+    # Squares still unmarked in the closest win pattern
+    return min(((mask & ~marked).bit_count() for mask in win_masks), default=None)
+
+
+class GameStore(ABC):
+    """
+    Where games live. Every operation is atomic on its own and the async
+    a-prefixed twins behave exactly like the sync ones; by default they run
+    the sync operation in a worker thread. Statuses, return shapes and
+    events are the same for every backend (see redis_game_store for the
+    reference documentation of each operation):
+
+      save_game(game_id, game_data, ttl)              store a new game
+      get_game(game_id)                               game_data or None
+      get_overview(game_id)                           (game_data, called, claims)
+      get_board(game_id, board_uuid)                  (board, called, phrase_table, version)
+      get_assignments(game_id)                        (version, called, {board_uuid: claim})
+      get_indexed_state(game_id)                      (version, [phrase_id], [(board_num, claim)])
+      get_board_page(game_id, status, offset, limit)  (version, total, phrase_table, boards)
+      get_version(game_id)                            version
+      events_since(game_id, last_seq)                 [event, ...] or None
+      get_board_owners(game_id, board_nums)           {board_num: (board_uuid, claim)}
+      record_called_phrase(game_id, phrase)           (status, total, new_wins, event)
+      record_called_phrases(game_id, phrases)         (status, detail, new_wins, event)
+      claim_board(game_id, board_uuid, name, email)   (status, event)
+      claim_boards(game_id, players)                  (status, detail, event)
+      record_win(game_id, winner)                     (status, event)
+      verify_and_record_win(game_id, board_uuid, pattern, positions, timestamp)
+                                                      (status, detail, event)
+      touch_game(game_id)                             restart the game's expiry
+
+    Reads return None for a game that does not exist; mutations return the
+    "missing" status.
+    """
+
+    def _async(self, method):
+        return sync_to_async(method, thread_sensitive=False)
+
+    @abstractmethod
+    def save_game(self, game_id, game_data, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def get_game(self, game_id):
+        ...
+
+    @abstractmethod
+    def get_overview(self, game_id):
+        ...
+
+    @abstractmethod
+    def get_board(self, game_id, board_uuid):
+        ...
+
+    @abstractmethod
+    def get_assignments(self, game_id):
+        ...
+
+    @abstractmethod
+    def get_indexed_state(self, game_id):
+        ...
+
+    @abstractmethod
+    def get_board_page(self, game_id, status=None, offset=0, limit=50):
+        ...
+
+    @abstractmethod
+    def get_version(self, game_id):
+        ...
+
+    @abstractmethod
+    def events_since(self, game_id, last_seq):
+        ...
+
+    @abstractmethod
+    def get_board_owners(self, game_id, board_nums):
+        ...
+
+    @abstractmethod
+    def record_called_phrase(self, game_id, phrase, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def record_called_phrases(self, game_id, phrases, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def claim_board(self, game_id, board_uuid, player_name, player_email, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def claim_boards(self, game_id, players, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def record_win(self, game_id, winner, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def verify_and_record_win(self, game_id, board_uuid, pattern, positions, timestamp, ttl=GAME_TTL):
+        ...
+
+    @abstractmethod
+    def touch_game(self, game_id, ttl=GAME_TTL):
+        ...
+
+    def archive_idle_games(self, idle=ARCHIVE_IDLE, finished_idle=ARCHIVE_FINISHED_IDLE):
+        """Move idle games to colder storage; only Redis has any. Returns the game ids."""
+        return []
+
+    async def asave_game(self, game_id, game_data, ttl=GAME_TTL):
+        return await self._async(self.save_game)(game_id, game_data, ttl)
+
+    async def aget_game(self, game_id):
+        return await self._async(self.get_game)(game_id)
+
+    async def aget_overview(self, game_id):
+        return await self._async(self.get_overview)(game_id)
+
+    async def aget_board(self, game_id, board_uuid):
+        return await self._async(self.get_board)(game_id, board_uuid)
+
+    async def aget_assignments(self, game_id):
+        return await self._async(self.get_assignments)(game_id)
+
+    async def aget_indexed_state(self, game_id):
+        return await self._async(self.get_indexed_state)(game_id)
+
+    async def aget_board_page(self, game_id, status=None, offset=0, limit=50):
+        return await self._async(self.get_board_page)(game_id, status, offset, limit)
+
+    async def aget_version(self, game_id):
+        return await self._async(self.get_version)(game_id)
+
+    async def aevents_since(self, game_id, last_seq):
+        return await self._async(self.events_since)(game_id, last_seq)
+
+    async def aget_board_owners(self, game_id, board_nums):
+        return await self._async(self.get_board_owners)(game_id, board_nums)
+
+    async def arecord_called_phrase(self, game_id, phrase, ttl=GAME_TTL):
+        return await self._async(self.record_called_phrase)(game_id, phrase, ttl)
+
+    async def arecord_called_phrases(self, game_id, phrases, ttl=GAME_TTL):
+        return await self._async(self.record_called_phrases)(game_id, phrases, ttl)
+
+    async def aclaim_board(self, game_id, board_uuid, player_name, player_email, ttl=GAME_TTL):
+        return await self._async(self.claim_board)(game_id, board_uuid, player_name, player_email, ttl)
+
+    async def aclaim_boards(self, game_id, players, ttl=GAME_TTL):
+        return await self._async(self.claim_boards)(game_id, players, ttl)
+
+    async def arecord_win(self, game_id, winner, ttl=GAME_TTL):
+        return await self._async(self.record_win)(game_id, winner, ttl)
+
+    async def averify_and_record_win(self, game_id, board_uuid, pattern, positions, timestamp, ttl=GAME_TTL):
+        return await self._async(self.verify_and_record_win)(game_id, board_uuid, pattern, positions, timestamp, ttl)
+
+    async def atouch_game(self, game_id, ttl=GAME_TTL):
+        return await self._async(self.touch_game)(game_id, ttl)
+
+    async def anote_activity(self, game_id):
+        """Activity that is not a mutation (a read, a socket connecting) extends the game's life."""
+        await self.atouch_game(game_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    The GameStore named by the BINGO_STORE_BACKEND setting ("redis",
+    "memory", "sqlite" or a dotted class path), created on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = getattr(settings, "BINGO_STORE_BACKEND", "redis")
+                _store = import_string(BACKENDS.get(backend, backend))()
+    return _store
+
+
+class _ConfiguredStore:
+    # Resolves the backend on first attribute access, not at import
+    def __getattr__(self, name):
+        return getattr(get_store(), name)
+
+
+store = _ConfiguredStore()
@@ -0,0 +1,417 @@
+import json
+from abc import ABC, abstractmethod
+
+from .bingoServer import compile_win_patterns, find_new_wins, positions_mask
+from .game_cache import LRUCache
+from .game_store import (
+    GAME_TTL, NEAR_WIN, TOUCH_INTERVAL, GameStore, board_record, claim_record, prepare_game, to_win,
+)
+
+
+class GameHandle(ABC):
+    """
+    One live game inside a LocalGameStore transaction. Values returned are
+    copies the caller may keep.
+    """
+
+    @abstractmethod
+    def meta(self):
+        """The META_FIELDS values."""
+
+    @abstractmethod
+    def version(self):
+        ...
+
+    @abstractmethod
+    def next_version(self):
+        """Bump the version counter; returns the new version."""
+
+    @abstractmethod
+    def touch(self, ttl):
+        """Mark the game active now and expire it ttl seconds from now."""
+
+    @abstractmethod
+    def order(self):
+        """board_uuid by board_num."""
+
+    @abstractmethod
+    def boards(self):
+        """[(board_uuid, board_num, squares), ...] in board order."""
+
+    @abstractmethod
+    def board(self, board_uuid):
+        """(board_num, squares), or None for an unknown board."""
+
+    @abstractmethod
+    def squares(self, board_num):
+        ...
+
+    @abstractmethod
+    def claims(self):
+        """{board_uuid: claim} for claimed boards, in board order."""
+
+    @abstractmethod
+    def claim(self, board_uuid):
+        ...
+
+    @abstractmethod
+    def set_claim(self, board_uuid, claim):
+        ...
+
+    @abstractmethod
+    def called(self):
+        """Called phrases in call order."""
+
+    @abstractmethod
+    def called_count(self):
+        ...
+
+    @abstractmethod
+    def is_called(self, phrase):
+        ...
+
+    @abstractmethod
+    def add_called(self, phrase):
+        """Append phrase to the called phrases; returns how many there are."""
+
+    @abstractmethod
+    def hits(self, phrase):
+        """[[board_num, position], ...] for a phrase on some board, else None."""
+
+    @abstractmethod
+    def mark(self, hits):
+        """Mark hits on their boards; returns {board_num: mask} for those boards."""
+
+    @abstractmethod
+    def masks(self, board_nums=None):
+        """{board_num: marked-squares mask} for board_nums, or every board."""
+
+    @abstractmethod
+    def winners(self):
+        ...
+
+    @abstractmethod
+    def has_win(self, win_key):
+        ...
+
+    @abstractmethod
+    def add_winner(self, win_key, winner):
+        ...
+
+    @abstractmethod
+    def log(self, seq, event):
+        """Append the encoded event under seq, trimming the log to EVENT_LOG_LENGTH."""
+
+    @abstractmethod
+    def events_after(self, seq):
+        """Logged events after seq, oldest first, decoded."""
+
+    @abstractmethod
+    def links(self):
+        ...
+
+
+class LocalGameStore(GameStore):
+    """
+    The store operations, run in this process on GameHandles. A backend
+    provides _game(game_id, write=False), a context manager that yields the
+    game's handle (None if it does not exist or has expired) inside a
+    transaction that keeps out other writers when write is true, and
+    _write_game(game_id, game, ttl) for prepare_game() output.
+    """
+
+    def __init__(self):
+        self._touched = LRUCache(4096, ttl=TOUCH_INTERVAL)
+
+    @abstractmethod
+    def _game(self, game_id, write=False):
+        ...
+
+    @abstractmethod
+    def _write_game(self, game_id, game, ttl):
+        ...
+
+    def _read(self, game_id, read):
+        with self._game(game_id) as game:
+            result = None if game is None else read(game)
+        if result is not None:
+            self._note_activity(game_id)
+        return result
+
+    def _mutate(self, game_id, ttl, mutate, missing):
+        # Like the Redis scripts, only a change refreshes the expiry
+        with self._game(game_id, write=True) as game:
+            if game is None:
+                return missing
+            result = mutate(game)
+            if result[0] == "ok":
+                game.touch(ttl)
+            return result
+
+    def _note_activity(self, game_id):
+        if self._touched.peek(game_id) is None:
+            self._touched.set(game_id, True)
+            self.touch_game(game_id)
+
+    async def anote_activity(self, game_id):
+        await self._async(self._note_activity)(game_id)
+
+    @staticmethod
+    def _emit(game, event):
+        # Bump the version and log event under it
+        event["seq"] = game.next_version()
+        game.log(event["seq"], json.dumps(event))
+        return event
+
+    @staticmethod
+    def _new_wins(game, hits):
+        masks = game.mark(hits)
+        new_bits = {}
+        for board_num, pos in hits:
+            new_bits[board_num] = new_bits.get(board_num, 0) | (1 << pos)
+        return find_new_wins(compile_win_patterns(game.meta()["win_patterns"] or {}), masks, new_bits)
+
+    @staticmethod
+    def _phrase_id(game, hits):
+        # The phrase's index in the phrase table, read off the first board it is on
+        board_num, pos = hits[0]
+        return game.squares(board_num)[pos]
+
+    def save_game(self, game_id, game_data, ttl=GAME_TTL):
+        self._write_game(game_id, prepare_game(game_data), ttl)
+
+    def get_game(self, game_id):
+        def read(game):
+            claims = game.claims()
+            game_data = dict(game.meta(), version=game.version())
+            game_data["board_assignments"] = {
+                board_uuid: board_record(board_num, squares, claims.get(board_uuid))
+                for board_uuid, board_num, squares in game.boards()
+            }
+            game_data["player_links"] = game.links()
+            game_data["phrases_called"] = game.called()
+            game_data["winners"] = game.winners()
+            return game_data
+        return self._read(game_id, read)
+
+    def get_overview(self, game_id):
+        def read(game):
+            game_data = dict(game.meta(), version=game.version(), winners=game.winners())
+            return game_data, game.called(), game.claims()
+        return self._read(game_id, read)
+
+    def get_board(self, game_id, board_uuid):
+        def read(game):
+            board = game.board(board_uuid)
+            if board is not None:
+                board = board_record(*board, game.claim(board_uuid))
+            return board, game.called(), game.meta()["phrase_table"], game.version()
+        return self._read(game_id, read)
+
+    def get_assignments(self, game_id):
+        def read(game):
+            claims = game.claims()
+            return game.version(), game.called(), {board_uuid: claims.get(board_uuid) for board_uuid in game.order()}
+        return self._read(game_id, read)
+
+    def get_indexed_state(self, game_id):
+        def read(game):
+            phrase_ids = {phrase: i for i, phrase in enumerate(game.meta()["phrase_table"])}
+            claims = game.claims()
+            return game.version(), [phrase_ids[phrase] for phrase in game.called()], [
+                (board_num, claims[board_uuid]) for board_num, board_uuid in enumerate(game.order())
+                if board_uuid in claims
+            ]
+        return self._read(game_id, read)
+
+    def get_board_page(self, game_id, status=None, offset=0, limit=50):
+        def read(game):
+            meta = game.meta()
+            win_masks = [mask for masks in compile_win_patterns(meta["win_patterns"] or {}).values() for mask in masks]
+            claims = game.claims()
+            boards = game.boards()
+            marks = None
+            if status == "claimed":
+                boards = [board for board in boards if board[0] in claims]
+            elif status == "unclaimed":
+                boards = [board for board in boards if board[0] not in claims]
+            elif status == "near_win":
+                marks = game.masks()
+                boards = [
+                    board for board in boards
+                    if 0 < (to_win(marks.get(board[1], 0), win_masks) or 0) <= NEAR_WIN
+                ]
+
+            page = boards[offset:offset + limit]
+            if marks is None:
+                marks = game.masks([board_num for _, board_num, _ in page])
+            result = []
+            for board_uuid, board_num, squares in page:
+                board = board_record(board_num, squares, claims.get(board_uuid))
+                board["board_uuid"] = board_uuid
+                board["marked"] = marks.get(board_num, 0)
+                board["to_win"] = to_win(board["marked"], win_masks)
+                result.append(board)
+            return game.version(), len(boards), meta["phrase_table"], result
+        return self._read(game_id, read)
+
+    def get_version(self, game_id):
+        return self._read(game_id, lambda game: game.version())
+
+    def events_since(self, game_id, last_seq):
+        with self._game(game_id) as game:
+            if game is None:
+                return None
+            events = game.events_after(last_seq)
+            # Sequence numbers have no gaps, so anything short of this means
+            # some were trimmed
+            return events if len(events) == game.version() - last_seq else None
+
+    def get_board_owners(self, game_id, board_nums):
+        with self._game(game_id) as game:
+            if game is None:
+                return {}
+            order = game.order()
+            return {
+                board_num: (order[board_num], game.claim(order[board_num]))
+                for board_num in board_nums if 0 <= board_num < len(order)
+            }
+
+    def record_called_phrase(self, game_id, phrase, ttl=GAME_TTL):
+        def call(game):
+            hits = game.hits(phrase)
+            if hits is None:
+                return "invalid", None, [], None
+            if game.is_called(phrase):
+                return "duplicate", game.called_count(), [], None
+            total = game.add_called(phrase)
+            event = self._emit(game, {
+                "type": "phrase_called",
+                "phrase": phrase,
+                "phrase_id": self._phrase_id(game, hits),
+                "total_called": total,
+            })
+            return "ok", total, self._new_wins(game, hits), event
+        return self._mutate(game_id, ttl, call, ("missing", None, [], None))
+
+    def record_called_phrases(self, game_id, phrases, ttl=GAME_TTL):
+        def call(game):
+            entries = []
+            for phrase in phrases:
+                hits = game.hits(phrase)
+                if hits is None:
+                    return "invalid", phrase, [], None
+                entries.append((phrase, hits))
+            called, phrase_ids, all_hits, total = [], [], [], 0
+            for phrase, hits in entries:
+                if not game.is_called(phrase):
+                    total = game.add_called(phrase)
+                    called.append(phrase)
+                    phrase_ids.append(self._phrase_id(game, hits))
+                    all_hits.extend(hits)
+            if not called:
+                return "duplicate", game.called_count(), [], None
+            event = self._emit(game, {
+                "type": "phrases_called",
+                "phrases": called,
+                "phrase_ids": phrase_ids,
+                "total_called": total,
+            })
+            return "ok", total, self._new_wins(game, all_hits), event
+        return self._mutate(game_id, ttl, call, ("missing", None, [], None))
+
+    def claim_board(self, game_id, board_uuid, player_name, player_email, ttl=GAME_TTL):
+        def claim(game):
+            board = game.board(board_uuid)
+            if board is None:
+                return "invalid", None
+            if game.claim(board_uuid) is not None:
+                return "taken", None
+            game.set_claim(board_uuid, claim_record(player_name, player_email))
+            return "ok", self._emit(game, {
+                "type": "player_joined",
+                "board_uuid": board_uuid,
+                "board_num": board[0],
+                "player_name": player_name,
+                "player_email": player_email,
+            })
+        return self._mutate(game_id, ttl, claim, ("missing", None))
+
+    def claim_boards(self, game_id, players, ttl=GAME_TTL):
+        def claim(game):
+            claims = game.claims()
+            free = [
+                (board_num, board_uuid) for board_num, board_uuid in enumerate(game.order())
+                if board_uuid not in claims
+            ][:len(players)]
+            if len(free) < len(players):
+                return "full", len(free), None
+            joined = []
+            for (board_num, board_uuid), (player_name, player_email) in zip(free, players):
+                game.set_claim(board_uuid, claim_record(player_name, player_email))
+                joined.append({
+                    "board_uuid": board_uuid,
+                    "board_num": board_num,
+                    "player_name": player_name,
+                    "player_email": player_email,
+                })
+            event = self._emit(game, {"type": "players_joined", "players": joined})
+            return "ok", joined, event
+        return self._mutate(game_id, ttl, claim, ("missing", None, None))
+
+    def record_win(self, game_id, winner, ttl=GAME_TTL):
+        def record(game):
+            win_key = f"{winner['board_uuid']}:{winner['pattern']}"
+            if game.has_win(win_key):
+                return "duplicate", None
+            game.add_winner(win_key, winner)
+            event = {
+                "type": "player_won",
+                "board_uuid": winner["board_uuid"],
+                "player_name": winner["player_name"],
+                "pattern": winner["pattern"],
+            }
+            board = game.board(winner["board_uuid"])
+            if board is not None:
+                event["board_num"] = board[0]
+            return "ok", self._emit(game, event)
+        return self._mutate(game_id, ttl, record, ("missing", None))
+
+    def verify_and_record_win(self, game_id, board_uuid, pattern, positions, timestamp, ttl=GAME_TTL):
+        def verify(game):
+            meta = game.meta()
+            if positions_mask(positions) not in compile_win_patterns(meta["win_patterns"] or {}).get(pattern, ()):
+                return "bad_pattern", None, None
+            win_key = f"{board_uuid}:{pattern}"
+            if game.has_win(win_key):
+                return "duplicate", None, None
+            board = game.board(board_uuid)
+            if board is None:
+                return "invalid", None, None
+            board_num, squares = board
+            marked = game.masks([board_num]).get(board_num, 0)
+            for pos in positions:
+                if not marked >> pos & 1:
+                    return "not_called", meta["phrase_table"][squares[pos]], None
+            player = game.claim(board_uuid) or {}
+            winner = {
+                "board_uuid": board_uuid,
+                "player_name": player.get("player_name") or "Anonymous",
+                "player_email": player.get("player_email"),
+                "pattern": pattern,
+                "timestamp": timestamp,
+            }
+            game.add_winner(win_key, winner)
+            return "ok", winner, self._emit(game, {
+                "type": "player_won",
+                "board_uuid": board_uuid,
+                "board_num": board_num,
+                "player_name": winner["player_name"],
+                "pattern": pattern,
+            })
+        return self._mutate(game_id, ttl, verify, ("missing", None, None))
+
+    def touch_game(self, game_id, ttl=GAME_TTL):
+        with self._game(game_id, write=True) as game:
+            if game is not None:
+                game.touch(ttl)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from bingo.game_store import ARCHIVE_FINISHED_IDLE, ARCHIVE_IDLE, get_store
+
+
+class Command(BaseCommand):
+    help = "Move idle and finished games out of Redis into the ArchivedGame table. Run it periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--idle", type=int, default=ARCHIVE_IDLE,
+                            help="archive games inactive for this many seconds")
+        parser.add_argument("--finished-idle", type=int, default=ARCHIVE_FINISHED_IDLE,
+                            help="archive games with a winner inactive for this many seconds")
+
+    def handle(self, *args, **options):
+        archived = get_store().archive_idle_games(options["idle"], options["finished_idle"])
+        for game_id in archived:
+            self.stdout.write(f"Archived {game_id}")
+        self.stdout.write(self.style.SUCCESS(f"{len(archived)} game(s) archived"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from bingo.redis_game_store import migrate_legacy_games
+
+
+class Command(BaseCommand):
+    help = "Convert games stored as a single JSON blob into the per-field Redis layout."
+
+    def handle(self, *args, **options):
+        migrated = migrate_legacy_games()
+        for game_id in migrated:
+            self.stdout.write(f"Migrated {game_id}")
+        self.stdout.write(self.style.SUCCESS(f"{len(migrated)} game(s) migrated"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from bingo.redis_game_store import rebalance_games
+from bingo.sharding import node_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Move games to the Redis node REDIS_URLS assigns them, e.g. after adding a node, "
+        "and give games stored before hash tags their tagged keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="list the moves without making them")
+
+    def handle(self, *args, **options):
+        moves = rebalance_games(dry_run=options["dry_run"])
+        for game_id, source, target in moves:
+            self.stdout.write(f"{game_id}: {node_name(source)} -> {node_name(target)}")
+        verb = "would be moved" if options["dry_run"] else "moved"
+        self.stdout.write(self.style.SUCCESS(f"{len(moves)} game(s) {verb}"))
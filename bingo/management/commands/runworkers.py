@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Run several Daphne worker processes serving one listening port."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)))
+        parser.add_argument("--bind", default="0.0.0.0")
+        parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+
+    def handle(self, *args, workers, bind, port, **options):
+        if workers > 1 and settings.CHANNEL_LAYERS["default"]["BACKEND"].endswith("InMemoryChannelLayer"):
+            raise CommandError(
+                "Set CHANNEL_REDIS_URL to run more than one worker; "
+                "the in-memory channel layer cannot reach other processes."
+            )
+
+        # Every worker accepts on the same inherited socket, so the kernel
+        # spreads connections across them and group messages travel through
+        # the channel layer
+        sock = socket.create_server((bind, port), backlog=2048)
+        fd = sock.fileno()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-m", "daphne", "--fd", str(fd), "shiftjoy.asgi:application"],
+                pass_fds=(fd,),
+            )
+            for _ in range(workers)
+        ]
+        sock.close()
+        self.stdout.write(f"Serving on {bind}:{port} with {workers} worker(s): {[p.pid for p in procs]}")
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        # Stop the whole group when asked to or when any worker dies, and let
+        # the process manager restart it
+        while not stopping and all(p.poll() is None for p in procs):
+            time.sleep(0.5)
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in procs:
+            p.wait()
+
+        if not stopping:
+            raise CommandError(f"A worker exited unexpectedly: {[(p.pid, p.returncode) for p in procs]}")
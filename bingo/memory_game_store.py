@@ -0,0 +1,153 @@
+import copy
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .game_store import EVENT_LOG_LENGTH
+from .local_game_store import GameHandle, LocalGameStore
+
+
+class _MemoryGame(GameHandle):
+    # Claims, winners and events are kept JSON-encoded, so callers never
+    # share them with the store
+
+    def __init__(self, game):
+        self._meta = game["meta"]
+        self._version = game["version"]
+        self.expires_at = 0
+        self._boards = {board_uuid: (board_num, squares) for board_uuid, board_num, squares in game["boards"]}
+        self._order = [board_uuid for board_uuid, _, _ in game["boards"]]
+        self._claims = {board_uuid: json.dumps(claim) for board_uuid, claim in game["claims"].items()}
+        self._index = game["index"]
+        self._marks = dict(game["marks"])
+        self._called = list(game["called"])
+        self._called_set = set(self._called)
+        self._winners = [json.dumps(winner) for winner in game["winners"]]
+        self._win_keys = {f"{w['board_uuid']}:{w['pattern']}" for w in game["winners"]}
+        self._links = list(game["links"])
+        self._events = deque(maxlen=EVENT_LOG_LENGTH)
+
+    def meta(self):
+        return copy.deepcopy(self._meta)
+
+    def version(self):
+        return self._version
+
+    def next_version(self):
+        self._version += 1
+        return self._version
+
+    def touch(self, ttl):
+        self.expires_at = time.time() + ttl
+
+    def order(self):
+        return list(self._order)
+
+    def boards(self):
+        boards = self._boards
+        return [(board_uuid, boards[board_uuid][0], list(boards[board_uuid][1])) for board_uuid in self._order]
+
+    def board(self, board_uuid):
+        board = self._boards.get(board_uuid)
+        return None if board is None else (board[0], list(board[1]))
+
+    def squares(self, board_num):
+        return self._boards[self._order[board_num]][1]
+
+    def claims(self):
+        return {
+            board_uuid: json.loads(self._claims[board_uuid])
+            for board_uuid in self._order if board_uuid in self._claims
+        }
+
+    def claim(self, board_uuid):
+        claim = self._claims.get(board_uuid)
+        return None if claim is None else json.loads(claim)
+
+    def set_claim(self, board_uuid, claim):
+        self._claims[board_uuid] = json.dumps(claim)
+
+    def called(self):
+        return list(self._called)
+
+    def called_count(self):
+        return len(self._called)
+
+    def is_called(self, phrase):
+        return phrase in self._called_set
+
+    def add_called(self, phrase):
+        self._called.append(phrase)
+        self._called_set.add(phrase)
+        return len(self._called)
+
+    def hits(self, phrase):
+        return self._index.get(phrase)
+
+    def mark(self, hits):
+        for board_num, pos in hits:
+            self._marks[board_num] = self._marks.get(board_num, 0) | (1 << pos)
+        return {board_num: self._marks[board_num] for board_num, _ in hits}
+
+    def masks(self, board_nums=None):
+        if board_nums is None:
+            return dict(self._marks)
+        return {board_num: self._marks.get(board_num, 0) for board_num in board_nums}
+
+    def winners(self):
+        return [json.loads(winner) for winner in self._winners]
+
+    def has_win(self, win_key):
+        return win_key in self._win_keys
+
+    def add_winner(self, win_key, winner):
+        self._win_keys.add(win_key)
+        self._winners.append(json.dumps(winner))
+
+    def log(self, seq, event):
+        self._events.append((seq, event))
+
+    def events_after(self, seq):
+        return [json.loads(event) for event_seq, event in self._events if event_seq > seq]
+
+    def links(self):
+        return list(self._links)
+
+
+class MemoryGameStore(LocalGameStore):
+    """
+    Games in this process's memory, behind one lock: no network, nothing
+    shared with other workers and nothing kept across restarts. For
+    single-process deployments, development and tests.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._games = {}
+        self._lock = threading.RLock()
+
+    def _async(self, method):
+        # Nothing here blocks for long enough to be worth a thread hop
+        async def run(*args):
+            return method(*args)
+        return run
+
+    @contextmanager
+    def _game(self, game_id, write=False):
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is not None and game.expires_at <= time.time():
+                del self._games[game_id]
+                game = None
+            yield game
+
+    def _write_game(self, game_id, game, ttl):
+        game = _MemoryGame(copy.deepcopy(game))
+        game.touch(ttl)
+        with self._lock:
+            now = time.time()
+            for expired in [gid for gid, g in self._games.items() if g.expires_at <= now]:
+                del self._games[expired]
+            self._games[game_id] = game
@@ -0,0 +1,267 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# In-process metrics in the Prometheus text format, served by views.metrics.
+# Each worker process keeps its own. Everything below is a no-op when the
+# BINGO_METRICS setting is off.
+ENABLED = getattr(settings, "BINGO_METRICS", True)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+BYTE_BUCKETS = tuple(2 ** n for n in range(8, 27, 2))  # 256 B to 64 MiB
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def remove(self, *labels):
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def _samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self._samples():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if ENABLED:
+            with self._lock:
+                self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        if ENABLED:
+            with self._lock:
+                self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        """Decrement, dropping a label set once it reaches zero."""
+        if ENABLED:
+            with self._lock:
+                value = self._values.get(labels, 0) - amount
+                if value or not labels:
+                    self._values[labels] = value
+                else:
+                    self._values.pop(labels, None)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # Per-bucket counts, then sum and count
+                counts = self._values[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            return [(labels, list(counts)) for labels, counts in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, counts in self._samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {counts[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {counts[-1]}")
+        return lines
+
+
+def register_collector(collect):
+    """collect() returns extra exposition lines, computed at scrape time."""
+    _collectors.append(collect)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "bingo_http_request_duration_seconds", "HTTP request latency by view.", ("view", "method", "status"),
+)
+REQUEST_ROUND_TRIPS = Histogram(
+    "bingo_http_request_redis_round_trips", "Redis round trips per HTTP request.", ("view",), COUNT_BUCKETS,
+)
+REQUEST_REDIS_BYTES = Histogram(
+    "bingo_http_request_redis_bytes", "Redis payload bytes sent and received per HTTP request.", ("view",),
+    BYTE_BUCKETS,
+)
+REDIS_ROUND_TRIPS = Counter("bingo_redis_round_trips_total", "Redis round trips by store operation.", ("op",))
+REDIS_SENT_BYTES = Counter("bingo_redis_sent_bytes_total", "Redis command payload bytes sent.", ("op",))
+REDIS_RECEIVED_BYTES = Counter("bingo_redis_received_bytes_total", "Redis reply payload bytes received.", ("op",))
+GAME_BYTES = Histogram("bingo_game_stored_bytes", "Serialized size of games written by save_game.", (), BYTE_BUCKETS)
+BROADCAST_SECONDS = Histogram("bingo_broadcast_seconds", "group_send duration per broadcast event.", ("type",))
+# No per-game labels: /metrics is public and a game id is its admin credential
+WEBSOCKETS = Gauge("bingo_websocket_connections", "Open WebSocket connections.")
+THROTTLED = Counter("bingo_throttled_requests_total", "Requests rejected by a rate limit, by view and bucket.", ("view", "bucket"))
+WS_OUTBOX = Gauge("bingo_websocket_outbox_frames", "Frames waiting in WebSocket outboxes.")
+WS_OUTBOX_DEPTH = Histogram(
+    "bingo_websocket_outbox_depth", "A socket's outbox depth after queueing a frame.", (), DEPTH_BUCKETS,
+)
+WS_COALESCED = Counter("bingo_websocket_coalesced_total", "Outbox overflows replaced by a snapshot.")
+WS_STALLED = Counter("bingo_websocket_stalled_total", "WebSockets closed for making no progress.")
+LOOP_LAG = Histogram("bingo_event_loop_lag_seconds", "Delay before the event loop runs a callback scheduled now.")
+
+
+def _size(value):
+    # Payload bytes, not counting protocol framing
+    kind = type(value)
+    if kind is bytes or kind is str:
+        return len(value)
+    if kind is list or kind is tuple:
+        return sum(map(_size, value))
+    if kind is dict:
+        return sum(map(_size, value)) + sum(map(_size, value.values()))
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return len(str(value))
+
+
+class _RequestRedis:
+    __slots__ = ("round_trips", "bytes")
+
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes = 0
+
+
+_request_redis = contextvars.ContextVar("bingo_request_redis", default=None)
+
+
+def redis_round_trip(op, commands, reply):
+    """
+    Account one Redis round trip made by the store: commands is the list of
+    command argument tuples sent, reply what came back. Returns bytes sent.
+    """
+    if not ENABLED:
+        return 0
+    sent, received = _size(commands), _size(reply)
+    REDIS_ROUND_TRIPS.inc(op)
+    REDIS_SENT_BYTES.inc(op, amount=sent)
+    REDIS_RECEIVED_BYTES.inc(op, amount=received)
+    current = _request_redis.get()
+    if current is not None:
+        current.round_trips += 1
+        current.bytes += sent + received
+    return sent
+
+
+def probe_event_loop():
+    """Sample event-loop lag: how long a callback scheduled now waits to run."""
+    if ENABLED:
+        loop = asyncio.get_running_loop()
+        scheduled = loop.time()
+        loop.call_soon(lambda: LOOP_LAG.observe(loop.time() - scheduled))
+
+
+class MetricsMiddleware:
+    """Records latency and Redis traffic for every request, labelled by view name."""
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start, token = time.perf_counter(), _request_redis.set(_RequestRedis())
+        try:
+            response = self.get_response(request)
+        finally:
+            current = _request_redis.get()
+            _request_redis.reset(token)
+        self._record(request, response, time.perf_counter() - start, current)
+        return response
+
+    async def __acall__(self, request):
+        probe_event_loop()
+        start, token = time.perf_counter(), _request_redis.set(_RequestRedis())
+        try:
+            response = await self.get_response(request)
+        finally:
+            current = _request_redis.get()
+            _request_redis.reset(token)
+        self._record(request, response, time.perf_counter() - start, current)
+        return response
+
+    def _record(self, request, response, elapsed, redis_stats):
+        # View names rather than paths keep label cardinality bounded
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        REQUEST_SECONDS.observe(elapsed, view, request.method, response.status_code)
+        REQUEST_ROUND_TRIPS.observe(redis_stats.round_trips, view)
+        REQUEST_REDIS_BYTES.observe(redis_stats.bytes, view)
@@ -1,3 +1,12 @@
 from django.db import models
 
-# Create your models here.
+
+class ArchivedGame(models.Model):
+    """
+    A game moved out of Redis by redis_game_store.archive_game(), as the
+    compressed serializers payload of get_game(). Rehydrated on access.
+    """
+    game_id = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,179 @@
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from . import metrics
+from .game_cache import LRUCache
+
+# Token buckets guarding the POST endpoints. Each view has up to three:
+# per game, per board and per client, each a (rate per second, burst) pair
+# from the BINGO_RATE_LIMITS setting. A request takes one token from each
+# of its buckets, or from none of them if any is empty. With the Redis store
+# buckets live on the game's node and are shared by every worker; otherwise
+# each worker keeps its own.
+# The board bucket only applies to boards of the game, so made-up board ids
+# cannot each get a fresh one.
+ENABLED = getattr(settings, "BINGO_RATE_LIMITS_ENABLED", True)
+LIMITS = getattr(settings, "BINGO_RATE_LIMITS", {})
+SCOPES = ("game", "board", "client")
+# Proxies in front of the app that append the client's address to
+# X-Forwarded-For; with none the header is the client's own and is ignored
+TRUSTED_PROXIES = getattr(settings, "BINGO_TRUSTED_PROXIES", 0)
+
+# KEYS are bucket keys, then the game's boards hash if ARGV[2], the 1-based
+# index of the board bucket, is not 0; that bucket is skipped unless ARGV[1]
+# is a board of the game. ARGV[3] is the number of tokens to take (-1 gives
+# one back) and ARGV[4...] hold rate and burst for each bucket. Returns {0}
+# when every bucket had the tokens (and takes them), else {i, wait} for the
+# bucket that takes longest to refill.
+_TAKE = """
+local board, board_at, cost = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local buckets, skip = #KEYS, 0
+if board_at > 0 then
+    buckets = buckets - 1
+    if redis.call('HEXISTS', KEYS[#KEYS], board) == 0 then skip = board_at end
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens, limited, wait = {}, 0, 0
+for i = 1, buckets do
+    if i ~= skip then
+        local rate, burst = tonumber(ARGV[i * 2 + 2]), tonumber(ARGV[i * 2 + 3])
+        local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'at')
+        local level = tonumber(bucket[1]) or burst
+        if bucket[2] then level = math.min(burst, level + (now - tonumber(bucket[2])) * rate) end
+        tokens[i] = level
+        if level < cost and (cost - level) / rate > wait then limited, wait = i, (cost - level) / rate end
+    end
+end
+if limited > 0 then return {limited, tostring(wait)} end
+for i = 1, buckets do
+    if i ~= skip then
+        local rate, burst = tonumber(ARGV[i * 2 + 2]), tonumber(ARGV[i * 2 + 3])
+        redis.call('HSET', KEYS[i], 'tokens', tostring(math.min(burst, tokens[i] - cost)), 'at', tostring(now))
+        -- A full bucket is the same as no bucket
+        redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+    end
+end
+return {0}
+"""
+
+
+def _bucket_key(view, game_id, scope, ident):
+    # The game id is a hash tag, so a request's buckets share a Cluster slot
+    # with each other and with the game
+    return f"shiftjoy:rate:{{{game_id}}}:{view}:{scope}:{ident}"
+
+
+class LocalBuckets:
+    """The same token buckets in this process, for the memory and SQLite stores."""
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        # Evicting a bucket refills it, like an expired Redis key
+        self._buckets = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def take(self, buckets, cost=1):
+        """
+        buckets is [(key, rate, burst), ...]; returns (index, wait) of the
+        limiting one, or None. A cost of -1 gives a token back.
+        """
+        with self._lock:
+            now = self._clock()
+            levels, limited, wait = [], None, 0
+            for i, (key, rate, burst) in enumerate(buckets):
+                level, at = self._buckets.peek(key, (burst, now))
+                level = min(burst, level + (now - at) * rate)
+                levels.append(level)
+                if level < cost and (cost - level) / rate > wait:
+                    limited, wait = i, (cost - level) / rate
+            if limited is not None:
+                return limited, wait
+            for (key, _, burst), level in zip(buckets, levels):
+                self._buckets.set(key, (min(burst, level - cost), now))
+            return None
+
+
+_local = LocalBuckets()
+_scripts = weakref.WeakKeyDictionary()
+
+
+async def _redis_take(game_id, buckets, board_at=None, board=None, cost=1):
+    # board_at is the index of the board bucket in buckets
+    from .redis_game_store import _aredis, _key
+
+    client = _aredis(game_id)[0]
+    if client not in _scripts:
+        _scripts[client] = client.register_script(_TAKE)
+    keys = [key for key, _, _ in buckets]
+    args = [board or "", 0 if board_at is None else board_at + 1, cost]
+    args += [value for _, rate, burst in buckets for value in (rate, burst)]
+    if board_at is not None:
+        keys.append(_key(game_id, "boards"))
+    result = await _scripts[client](keys=keys, args=args)
+    metrics.redis_round_trip("rate_limit", [keys, args], result)
+    return None if result[0] == 0 else (result[0] - 1, float(result[1]))
+
+
+async def acheck(view, game_id, board=None, client=None):
+    """
+    Take a token for a request to view. Returns None if it may proceed,
+    else (scope, seconds until it may retry) for the exhausted bucket.
+    """
+    limited = await _atake(view, game_id, board, client, 1)
+    if limited is None:
+        return None
+    metrics.THROTTLED.inc(view, limited[0])
+    return limited
+
+
+async def arefund(view, game_id, board=None, client=None):
+    """Give back the tokens acheck() took, for a request that changed nothing."""
+    await _atake(view, game_id, board, client, -1)
+
+
+async def _atake(view, game_id, board, client, cost):
+    limits = LIMITS.get(view) if ENABLED else None
+    if not limits:
+        return None
+    idents = {"game": game_id, "board": board, "client": client}
+    scopes = [scope for scope in SCOPES if scope in limits and idents[scope] is not None]
+    redis_store = getattr(settings, "BINGO_STORE_BACKEND", "redis") == "redis"
+    if "board" in scopes and not redis_store and not await _is_board(game_id, board):
+        scopes.remove("board")
+    buckets = [(_bucket_key(view, game_id, scope, idents[scope]), *limits[scope]) for scope in scopes]
+    if not buckets:
+        return None
+    if redis_store:
+        # The script checks the board itself
+        board_at = scopes.index("board") if "board" in scopes else None
+        limited = await _redis_take(game_id, buckets, board_at, board, cost)
+    else:
+        limited = _local.take(buckets, cost)
+    if limited is None:
+        return None
+    return scopes[limited[0]], limited[1]
+
+
+async def _is_board(game_id, board):
+    from .game_store import store
+
+    found = await store.aget_board(game_id, board)
+    return found is not None and found[0] is not None
+
+
+def client_ip(request):
+    """
+    The client's address. Behind TRUSTED_PROXIES proxies it is the
+    X-Forwarded-For hop the outermost one appended; entries before that
+    come from the client and are not trusted. Otherwise the peer address.
+    """
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if TRUSTED_PROXIES and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return request.META.get("REMOTE_ADDR")
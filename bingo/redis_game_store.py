@@ -1,32 +1,1573 @@
 import os
 import json
+import time
+import asyncio
+import weakref
+import threading
+from functools import lru_cache
+
 import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+
+from .bingoServer import compile_win_patterns, find_new_wins, positions_mask
+from .board_codec import encode_board, decode_board
+from . import metrics, serializers
+from .game_cache import LRUCache
+from .sharding import HashRing, parse_urls
+from .game_store import (
+    ARCHIVE_FINISHED_IDLE, ARCHIVE_IDLE, EVENT_LOG_LENGTH, GAME_TTL, NEAR_WIN, TOUCH_INTERVAL,
+    GameStore, board_record, claim_record, prepare_game, to_win,
+)
 
 REDIS_URL = os.environ.get("REDIS_URL")
-if not REDIS_URL:
-    raise RuntimeError("REDIS_URL not set")
+# Games are spread over these nodes by consistent hashing on game_id (see
+# sharding.py); one node, REDIS_URL, unless set
+REDIS_URLS = parse_urls(os.environ.get("REDIS_URLS"))
 
-r = redis.from_url(REDIS_URL, decode_responses=True)
+# Boards and masks are binary, so replies are bytes and decoded here.
+# Sync callers (game creation, management commands) use the client from
+# _redis(game_id); async views use a pooled asyncio client from
+# _aredis(game_id). Both pick the game's node and connect on first use.
+# Every store operation has an a-prefixed async twin; async reads go through
+# the per-worker cache below.
 
 PREFIX = "shiftjoy"
+VERSIONS_CHANNEL = f"{PREFIX}:versions"  # "<meta key> <version>" after every mutation
+
+# Per-worker read cache bounds (see the cache section below)
+CACHE_GAMES = int(os.environ.get("BINGO_CACHE_GAMES", 64))
+CACHE_TTL = float(os.environ.get("BINGO_CACHE_TTL", 30))
+
+# Per-game key layout, all on the game's node. The game id is a hash tag
+# ("{id}" in braces), so in Redis Cluster every key of a game is in one slot
+# and the scripts below stay single-slot:
+#   {PREFIX}:game:{id}:meta        hash   field -> serialized value (see serializers)
+#   {PREFIX}:game:{id}:boards      hash   board_uuid -> packed board (see board_codec)
+#   {PREFIX}:game:{id}:claims      hash   board_uuid -> {"player_name", "player_email", "player_id"}
+#   {PREFIX}:game:{id}:links       list   player links, in board order
+#   {PREFIX}:game:{id}:called      list   phrases in call order
+#   {PREFIX}:game:{id}:called_set  set    same phrases, for membership checks
+#   {PREFIX}:game:{id}:winners     list   JSON winner records
+#   {PREFIX}:game:{id}:win_keys    set    "board_uuid:pattern" of every recorded win
+#   {PREFIX}:game:{id}:index       hash   phrase -> [[board_num, position], ...]
+#   {PREFIX}:game:{id}:order       list   board_uuid by board_num
+#   {PREFIX}:game:{id}:marks       string u32 marked-squares mask per board, board N at bit N*32
+#   {PREFIX}:game:{id}:win_masks   set    "pattern:mask" for every compiled win pattern
+#   {PREFIX}:game:{id}:events      stream broadcast events, entry ID "{seq}-0", capped at EVENT_LOG_LENGTH
+# meta also carries a plain integer "version" counter bumped by every mutation;
+# each bump appends one event whose "seq" is the new version. Its plain
+# integer "active_at" is the unix time of the game's last activity.
+# Claims, index entries and winners recorded by scripts are plain JSON because
+# the Lua scripts read or write them with cjson; serializers.loads() reads both.
+# The legacy layout stored the whole game as one JSON string at
+# {PREFIX}:game:<id>, and games written before hash tags used the same
+# per-field keys without the braces. Both are moved into place on first
+# access (see _restore) or by rebalance_games().
+PARTS = (
+    "meta", "boards", "claims", "links", "called", "called_set", "winners", "win_keys", "index", "order", "marks",
+    "win_masks", "events",
+)
+
+
+def _key(game_id, part):
+    return f"{PREFIX}:game:{{{game_id}}}:{part}"
+
+
+def _keys(game_id):
+    return [_key(game_id, part) for part in PARTS]
 
-def _key(game_id):
+
+def _blob_key(game_id):
     return f"{PREFIX}:game:{game_id}"
 
+
+def _untagged_keys(game_id):
+    return [f"{PREFIX}:game:{game_id}:{part}" for part in PARTS]
+
+
+def _game_id_of(meta_key):
+    # Inverse of _key(game_id, "meta")
+    return meta_key.decode()[len(f"{PREFIX}:game:{{"):-len("}:meta")]
+
+
+def _win_key(board_uuid, pattern):
+    return f"{board_uuid}:{pattern}"
+
+
+def _str(value):
+    return value.decode() if value is not None else None
+
+
+def _expire_all(pipe, game_id, ttl):
+    for key in _keys(game_id):
+        pipe.expire(key, ttl)
+
+
+def _write_game(pipe, game_id, game_data, ttl):
+    """
+    Queue the commands that store game_data in the per-field layout.
+    Returns the version written.
+    """
+    pipe.delete(*_keys(game_id))
+    game = prepare_game(game_data)
+    meta = game["meta"]
+
+    pipe.hset(_key(game_id, "meta"), mapping={field: serializers.dumps(value) for field, value in meta.items()})
+    pipe.hset(_key(game_id, "meta"), mapping={"version": game["version"], "active_at": int(time.time())})
+
+    if game["boards"]:
+        pipe.hset(_key(game_id, "boards"), mapping={
+            board_uuid: encode_board(board_num, squares, len(meta["phrase_table"]))
+            for board_uuid, board_num, squares in game["boards"]
+        })
+        pipe.rpush(_key(game_id, "order"), *[board_uuid for board_uuid, _, _ in game["boards"]])
+        pipe.set(_key(game_id, "marks"), b"".join(
+            game["marks"][board_num].to_bytes(4, "big") for _, board_num, _ in game["boards"]
+        ))
+    if game["index"]:
+        pipe.hset(_key(game_id, "index"), mapping={
+            phrase: json.dumps(positions) for phrase, positions in game["index"].items()
+        })
+    if game["claims"]:
+        pipe.hset(_key(game_id, "claims"), mapping={
+            board_uuid: json.dumps(claim) for board_uuid, claim in game["claims"].items()
+        })
+
+    if meta["win_patterns"]:
+        pipe.sadd(_key(game_id, "win_masks"), *[
+            f"{name}:{mask}"
+            for name, masks in compile_win_patterns(meta["win_patterns"]).items()
+            for mask in masks
+        ])
+
+    if game["links"]:
+        pipe.rpush(_key(game_id, "links"), *game["links"])
+    if game["called"]:
+        pipe.rpush(_key(game_id, "called"), *game["called"])
+        pipe.sadd(_key(game_id, "called_set"), *game["called"])
+    if game["winners"]:
+        pipe.rpush(_key(game_id, "winners"), *[serializers.dumps(w) for w in game["winners"]])
+        pipe.sadd(_key(game_id, "win_keys"), *[_win_key(w["board_uuid"], w["pattern"]) for w in game["winners"]])
+
+    _expire_all(pipe, game_id, ttl)
+    return game["version"]
+
+
+def _assignment(packed, claim_json):
+    return board_record(*decode_board(packed), json.loads(claim_json) if claim_json else None)
+
+
+def _meta(meta):
+    return {
+        field.decode(): int(value) if field in (b"version", b"active_at") else serializers.loads(value)
+        for field, value in meta.items()
+    }
+
+
+# Moving a game between clients never overwrites a copy someone else put
+# on its node. On one node the copy and the source delete are one MULTI.
+# Across nodes every key of the game on its node is watched, and the copy is
+# only written while the node has no copy of the game, or only the one this
+# call wrote (same version) before the source changed under it. A lost race
+# retries, finds the other copy and just removes the stale source.
+
+
+def _migrate_legacy(game_id, source):
+    """
+    Convert a game stored as a single JSON blob on the source client into
+    the per-field layout on its node. Returns True if the game is on its
+    node afterwards.
+    """
+    blob_key, meta_key = _blob_key(game_id), _key(game_id, "meta")
+    target = _redis(game_id)[0]
+    same = source is target
+    written = None  # Version this call copied to another node
+    with source.pipeline() as pipe, target.pipeline() as target_pipe:
+        write = pipe if same else target_pipe
+        while True:
+            try:
+                pipe.watch(blob_key)
+                write.watch(*_keys(game_id))
+                current = write.hget(meta_key, "version")
+                if pipe.type(blob_key) != b"string":
+                    pipe.reset()
+                    write.reset()
+                    return current is not None
+                game_data = json.loads(pipe.get(blob_key))
+                ttl = pipe.ttl(blob_key)
+                ttl = ttl if ttl > 0 else GAME_TTL
+                if same:
+                    pipe.multi()
+                    if current is None:
+                        _write_game(pipe, game_id, game_data, ttl)
+                elif current is None or int(current) == written:
+                    target_pipe.multi()
+                    version = _write_game(target_pipe, game_id, game_data, ttl)
+                    _execute("migrate", target_pipe)
+                    written = version
+                    pipe.multi()
+                else:
+                    target_pipe.reset()
+                    pipe.multi()
+                pipe.delete(blob_key)
+                _execute("migrate", pipe)
+                return True
+            except redis.WatchError:
+                continue
+
+
+def _move_game(game_id, source, untagged=False):
+    """
+    Copy a game's per-field keys from the source client to its node (as
+    hash-tagged keys, if untagged), expiry included, then delete them from
+    the source. Returns True if the game is on its node afterwards, False
+    if it is on neither.
+    """
+    source_keys = _untagged_keys(game_id) if untagged else _keys(game_id)
+    meta_key = _key(game_id, "meta")
+    target = _redis(game_id)[0]
+    same = source is target
+    written = None  # Version this call copied to another node
+    with source.pipeline() as pipe, target.pipeline() as target_pipe:
+        write = pipe if same else target_pipe
+        while True:
+            try:
+                # Every mutation writes meta, so watching it catches any of them
+                pipe.watch(source_keys[0])
+                write.watch(*_keys(game_id))
+                current = write.hget(meta_key, "version")
+                if not pipe.exists(source_keys[0]):
+                    pipe.reset()
+                    write.reset()
+                    return current is not None
+                version = int(pipe.hget(source_keys[0], "version") or 0)
+                dumps = [(key, pipe.dump(source_key), pipe.pttl(source_key))
+                         for key, source_key in zip(_keys(game_id), source_keys)]
+                copy = current is None or (not same and int(current) == written)
+                if copy:
+                    write.multi()
+                    # Watched, so these are leftovers (or this call's own copy)
+                    write.delete(*_keys(game_id))
+                    for key, dump, pttl in dumps:
+                        if dump is not None:
+                            write.restore(key, max(pttl, 0), dump)
+                if not same:
+                    if copy:
+                        _execute("move", target_pipe)
+                        written = version
+                    else:
+                        target_pipe.reset()
+                    pipe.multi()
+                elif not copy:
+                    pipe.multi()
+                pipe.delete(*source_keys)
+                _execute("move", pipe)
+                return True
+            except redis.WatchError:
+                continue
+
+
+def _locate(game_id):
+    """
+    Find a game that is not where it belongs: on another node (the nodes
+    changed), without hash tags or as a legacy blob. Returns (client, layout)
+    with layout "tagged", "untagged" or "blob", or None.
+    """
+    for client, _ in _all_redis():
+        with client.pipeline(transaction=False) as pipe:
+            pipe.exists(_key(game_id, "meta"))
+            pipe.exists(_untagged_keys(game_id)[0])
+            pipe.type(_blob_key(game_id))
+            tagged, untagged, blob_type = _execute("locate", pipe)
+        if tagged and client is not _redis(game_id)[0]:
+            return client, "tagged"
+        if untagged:
+            return client, "untagged"
+        if blob_type == b"string":
+            return client, "blob"
+    return None
+
+
+def _rehydrate(game_id):
+    """
+    Move an archived game back into Redis. Returns True if it was archived.
+    """
+    from .models import ArchivedGame
+
+    archived = ArchivedGame.objects.filter(game_id=game_id).first()
+    if archived is None:
+        return False
+    meta_key = _key(game_id, "meta")
+    with _redis(game_id)[0].pipeline() as pipe:
+        try:
+            pipe.watch(meta_key)
+            if not pipe.exists(meta_key):
+                pipe.multi()
+                _write_game(pipe, game_id, serializers.loads(archived.data), GAME_TTL)
+                _execute("rehydrate", pipe)
+        except redis.WatchError:
+            pass  # Another worker restored it first
+    # Only this copy; the game may have been archived again since
+    ArchivedGame.objects.filter(game_id=game_id, archived_at=archived.archived_at).delete()
+    return True
+
+
+def _restore(game_id):
+    """
+    Bring back a game missing from its node: move it from wherever it is
+    (see _locate) or rehydrate it if archived. Returns True if it was found.
+    """
+    found = _locate(game_id)
+    if found is None:
+        return _rehydrate(game_id)
+    source, layout = found
+    if layout == "blob":
+        return _migrate_legacy(game_id, source)
+    return _move_game(game_id, source, untagged=layout == "untagged")
+
+
+def migrate_legacy_games():
+    """Migrate every legacy blob game in Redis. Returns the migrated game ids."""
+    migrated = []
+    for client, _ in _all_redis():
+        for key in client.scan_iter(match=_blob_key("*"), _type="string"):
+            game_id = key.decode()[len(_blob_key("")):]
+            # Skip per-field string keys such as {id}:marks
+            if ":" not in game_id and _migrate_legacy(game_id, client):
+                migrated.append(game_id)
+    return migrated
+
+
+def rebalance_games(dry_run=False):
+    """
+    Move every game that is not on the node the ring assigns it (after
+    REDIS_URLS changed) or is stored without hash tags. Games are moved one
+    at a time and stay readable throughout: a worker that misses a game on
+    its node finds and moves it itself. Returns [(game_id, from_url, to_url)].
+    """
+    shards = _shards()
+    moves = []
+    for source_url, (client, _) in zip(shards.nodes, _all_redis()):
+        for meta_key in client.scan_iter(match=f"{PREFIX}:game:*:meta", _type="hash"):
+            untagged = not meta_key.startswith(f"{PREFIX}:game:{{".encode())
+            game_id = meta_key.decode()[len(f"{PREFIX}:game:"):-len(":meta")] if untagged else _game_id_of(meta_key)
+            target_url = shards.node_for(game_id)
+            if target_url == source_url and not untagged:
+                continue
+            if dry_run or _move_game(game_id, client, untagged):
+                moves.append((game_id, source_url, target_url))
+    return moves
+
+
+def _url():
+    if not REDIS_URL:
+        raise RuntimeError("REDIS_URL not set")
+    return REDIS_URL
+
+
+_ring = None
+_sync_clients = {}
+_sync_clients_lock = threading.Lock()
+
+
+def _shards():
+    """The HashRing of node URLs (REDIS_URLS, or just REDIS_URL)."""
+    global _ring
+    if _ring is None:
+        _ring = HashRing(REDIS_URLS or [_url()])
+    return _ring
+
+
+def _connect(url):
+    client = redis.from_url(url)
+    return client, {name: client.register_script(_LUA_PRELUDE + src) for name, src in _SCRIPTS.items()}
+
+
+def _redis(game_id):
+    """Returns (client, scripts) for sync callers on game_id's node, connecting on first use."""
+    url = _shards().node_for(game_id)
+    if url not in _sync_clients:
+        with _sync_clients_lock:
+            if url not in _sync_clients:
+                _sync_clients[url] = _connect(url)
+    return _sync_clients[url]
+
+
+def _all_redis():
+    """(client, scripts) for every node, in _shards().nodes order."""
+    for url in _shards().nodes:
+        if url not in _sync_clients:
+            with _sync_clients_lock:
+                if url not in _sync_clients:
+                    _sync_clients[url] = _connect(url)
+    return [_sync_clients[url] for url in _shards().nodes]
+
+
+# asyncio connections are tied to the loop that opened them. Under Daphne
+# there is one loop per process; runserver and the test client start one per
+# request, so keep a pool (and its registered scripts) per loop and node.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _aredis(game_id):
+    """Returns (client, scripts) on game_id's node for the running event loop."""
+    url = _shards().node_for(game_id)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if url not in clients:
+        client = redis.asyncio.from_url(url)
+        clients[url] = client, {
+            name: client.register_script(_LUA_PRELUDE + src) for name, src in _SCRIPTS.items()
+        }
+    return clients[url]
+
+
+def _commands(pipe):
+    return [args for args, _ in pipe.command_stack] if metrics.ENABLED else ()
+
+
+def _execute(op, pipe):
+    """pipe.execute(), accounted in the Redis metrics. Returns the replies."""
+    commands = _commands(pipe)
+    results = pipe.execute()
+    metrics.redis_round_trip(op, commands, results)
+    return results
+
+
+async def _aexecute(op, pipe):
+    commands = _commands(pipe)
+    results = await pipe.execute()
+    metrics.redis_round_trip(op, commands, results)
+    return results
+
+
+def _read(game_id, queue):
+    """
+    Run the reads queued by queue(pipe) in one round trip, preceded by an
+    existence check on the game's meta hash. Legacy blob and archived games
+    are restored on first access. Returns None if the game does not exist.
+    """
+    for _ in range(2):
+        with _redis(game_id)[0].pipeline(transaction=False) as pipe:
+            pipe.exists(_key(game_id, "meta"))
+            queue(pipe)
+            exists, *results = _execute("read", pipe)
+        if exists:
+            return results
+        if not _restore(game_id):
+            return None
+    return None
+
+
+async def _aread(game_id, queue):
+    for _ in range(2):
+        async with _aredis(game_id)[0].pipeline(transaction=False) as pipe:
+            pipe.exists(_key(game_id, "meta"))
+            queue(pipe)
+            exists, *results = await _aexecute("read", pipe)
+        if exists:
+            return results
+        if not await sync_to_async(_restore)(game_id):
+            return None
+    return None
+
+
+def save_game(game_id, game_data, ttl=GAME_TTL):
+    with _redis(game_id)[0].pipeline() as pipe:
+        _write_game(pipe, game_id, game_data, ttl)
+        commands = _commands(pipe)
+        replies = pipe.execute()
+    # Everything written is the serialized game
+    metrics.GAME_BYTES.observe(metrics.redis_round_trip("save_game", commands, replies))
+    _layouts.pop(game_id)
+    _states.pop(game_id)
+
+
+def _queue_game(game_id):
+    return lambda pipe: (
+        pipe.hgetall(_key(game_id, "meta")),
+        pipe.hgetall(_key(game_id, "boards")),
+        pipe.hgetall(_key(game_id, "claims")),
+        pipe.lrange(_key(game_id, "links"), 0, -1),
+        pipe.lrange(_key(game_id, "called"), 0, -1),
+        pipe.lrange(_key(game_id, "winners"), 0, -1),
+    )
+
+
+def _parse_game(results):
+    if results is None:
+        return None
+    meta, boards, claims, links, called, winners = results
+
+    game_data = _meta(meta)
+    game_data.pop("active_at", None)
+    assignments = [
+        (board_uuid.decode(), _assignment(packed, claims.get(board_uuid)))
+        for board_uuid, packed in boards.items()
+    ]
+    game_data["board_assignments"] = dict(sorted(assignments, key=lambda item: item[1]["board_num"]))
+    game_data["player_links"] = [_str(link) for link in links]
+    game_data["phrases_called"] = [_str(phrase) for phrase in called]
+    game_data["winners"] = [serializers.loads(w) for w in winners]
+    return game_data
+
+
 def get_game(game_id):
-    data = r.get(_key(game_id))
-    return json.loads(data) if data else None
-
-def save_game(game_id, game_data, ttl=60*60*12):
-    r.set(_key(game_id), json.dumps(game_data), ex=ttl)
-
-def touch_game(game_id, ttl=60*60*12):
-    r.expire(_key(game_id), ttl)
-
-def with_lock(game_id, fn):
-    lock = r.lock(f"{PREFIX}:lock:{game_id}", timeout=5, blocking_timeout=5)
-    lock.acquire()
-    try:
-        return fn()
-    finally:
-        lock.release()
\ No newline at end of file
+    return _parse_game(_read(game_id, _queue_game(game_id)))
+
+
+def _queue_board(game_id, board_uuid):
+    return lambda pipe: (
+        pipe.hget(_key(game_id, "boards"), board_uuid),
+        pipe.hget(_key(game_id, "claims"), board_uuid),
+        pipe.lrange(_key(game_id, "called"), 0, -1),
+        pipe.hget(_key(game_id, "meta"), "phrase_table"),
+        pipe.hget(_key(game_id, "meta"), "version"),
+    )
+
+
+def _parse_board(results):
+    if results is None:
+        return None
+    packed, claim_json, called, phrase_table, version = results
+    board = _assignment(packed, claim_json) if packed else None
+    return board, [_str(phrase) for phrase in called], serializers.loads(phrase_table), int(version or 0)
+
+
+def get_board(game_id, board_uuid):
+    """
+    Returns (board_assignment, phrases_called, phrase_table, version) for a
+    single board, or None if the game does not exist. board_assignment is
+    None for an unknown board; its "squares" index into phrase_table.
+    """
+    return _parse_board(_read(game_id, _queue_board(game_id, board_uuid)))
+
+
+def _queue_assignments(game_id):
+    return lambda pipe: (
+        pipe.hget(_key(game_id, "meta"), "version"),
+        pipe.lrange(_key(game_id, "called"), 0, -1),
+        pipe.hkeys(_key(game_id, "boards")),
+        pipe.hgetall(_key(game_id, "claims")),
+    )
+
+
+def _parse_assignments(results):
+    if results is None:
+        return None
+    version, called, board_uuids, claims = results
+    return int(version or 0), [_str(phrase) for phrase in called], {
+        board_uuid.decode(): json.loads(claims[board_uuid]) if board_uuid in claims else None
+        for board_uuid in board_uuids
+    }
+
+
+def get_assignments(game_id):
+    """
+    Returns (version, phrases_called, {board_uuid: claim or None}) without
+    loading board layouts, or None if the game does not exist.
+    """
+    return _parse_assignments(_read(game_id, _queue_assignments(game_id)))
+
+
+def _queue_indexed_state(game_id):
+    return lambda pipe: (
+        pipe.hget(_key(game_id, "meta"), "version"),
+        pipe.lrange(_key(game_id, "called"), 0, -1),
+        pipe.hget(_key(game_id, "meta"), "phrase_table"),
+        pipe.lrange(_key(game_id, "order"), 0, -1),
+        pipe.hgetall(_key(game_id, "claims")),
+    )
+
+
+def _parse_indexed_state(results):
+    if results is None:
+        return None
+    version, called, phrase_table, order, claims = results
+    phrase_ids = {phrase: i for i, phrase in enumerate(serializers.loads(phrase_table))}
+    return int(version or 0), [phrase_ids[_str(phrase)] for phrase in called], [
+        (board_num, json.loads(claims[board_uuid]))
+        for board_num, board_uuid in enumerate(order)
+        if board_uuid in claims
+    ]
+
+
+def get_indexed_state(game_id):
+    """
+    Like get_assignments, but with called phrases as phrase-table indices and
+    only claimed boards, by number: (version, [phrase_id, ...],
+    [(board_num, claim), ...]), or None if the game does not exist.
+    """
+    return _parse_indexed_state(_read(game_id, _queue_indexed_state(game_id)))
+
+
+def _queue_version(game_id):
+    return lambda pipe: pipe.hget(_key(game_id, "meta"), "version")
+
+
+def _parse_version(results):
+    return None if results is None else int(results[0] or 0)
+
+
+def get_version(game_id):
+    """Returns the game's version counter, or None if the game does not exist."""
+    return _parse_version(_read(game_id, _queue_version(game_id)))
+
+
+def _queue_events(game_id, last_seq):
+    return lambda pipe: (
+        pipe.hget(_key(game_id, "meta"), "version"),
+        pipe.xrange(_key(game_id, "events"), min=f"{last_seq + 1}-0"),
+    )
+
+
+def _parse_events(last_seq, results):
+    if results is None:
+        return None
+    version, entries = results
+    events = [json.loads(fields[b"event"]) for _, fields in entries]
+    # Sequence numbers have no gaps, so anything short of this means some
+    # were trimmed (or last_seq is from a different incarnation of the game)
+    if len(events) != int(version or 0) - last_seq:
+        return None
+    return events
+
+
+def events_since(game_id, last_seq):
+    """
+    Returns the events after last_seq, oldest first, or None if the game does
+    not exist or some of them are no longer in the log.
+    """
+    return _parse_events(last_seq, _read(game_id, _queue_events(game_id, last_seq)))
+
+
+async def aevents_since(game_id, last_seq):
+    return _parse_events(last_seq, await _aread(game_id, _queue_events(game_id, last_seq)))
+
+
+# Per-worker read-through cache for the async reads. A game splits into its
+# layout (meta, boards, links), which never changes after create_game and is
+# only evicted for space, and its state (version, called phrases, claims,
+# winners), which is tagged with the version it was read at. Every mutation
+# publishes its new version on VERSIONS_CHANNEL of the game's node; while
+# this worker's listener is subscribed there, a cached state is current
+# unless a newer version has been published. Caching a state records its
+# version as published too, so a game missing from _published was evicted
+# from it and its state is not known to be current. Otherwise each use
+# costs one HGET of the version. CACHE_TTL bounds how long a missed message
+# can leave a state stale.
+_layouts = LRUCache(CACHE_GAMES)
+_states = LRUCache(CACHE_GAMES, ttl=CACHE_TTL)
+_published = LRUCache(CACHE_GAMES * 16)
+_listening = set()  # Nodes whose versions this worker is subscribed to
+_listener_lock = threading.Lock()
+_listeners = None
+_cache_counters = {"version_checks": 0, "stale": 0}
+
+
+def _listen(url, client):
+    # Scripts publish on the node they run on, so each node has a listener
+    while True:
+        try:
+            pubsub = client.pubsub()
+            pubsub.subscribe(VERSIONS_CHANNEL)
+            for message in pubsub.listen():
+                if message["type"] == "subscribe":
+                    # Versions published while not subscribed were missed
+                    _states.clear()
+                    _listening.add(url)
+                elif message["type"] == "message":
+                    meta_key, version = message["data"].split()
+                    _publish(_game_id_of(meta_key), int(version))
+        except redis.RedisError:
+            _listening.discard(url)
+            time.sleep(1)
+
+
+def _start_listener():
+    global _listeners
+    with _listener_lock:
+        if _listeners is None:
+            _listeners = [
+                threading.Thread(target=_listen, args=(url, client), name="game-cache-listener", daemon=True)
+                for url, (client, _) in zip(_shards().nodes, _all_redis())
+            ]
+            for listener in _listeners:
+                listener.start()
+
+
+def _publish(game_id, version):
+    _published.set(game_id, max(version, _published.peek(game_id, 0)))
+
+
+def _subscribed(game_id):
+    return _shards().node_for(game_id) in _listening
+
+
+def _current(game_id, state):
+    # None if this worker cannot tell and must check the version in Redis
+    published = _published.peek(game_id)
+    if published is None or not _subscribed(game_id):
+        return None
+    return state["version"] >= published
+
+
+def _queue_layout(game_id):
+    return lambda pipe: (
+        pipe.hgetall(_key(game_id, "meta")),
+        pipe.hgetall(_key(game_id, "boards")),
+        pipe.lrange(_key(game_id, "links"), 0, -1),
+    )
+
+
+def _parse_layout(results):
+    meta, boards, links = results
+    meta = _meta(meta)
+    meta.pop("version", None)
+    meta.pop("game_state", None)
+    meta.pop("active_at", None)
+    decoded = sorted((decode_board(packed) + (board_uuid.decode(),) for board_uuid, packed in boards.items()))
+    return {
+        "meta": meta,
+        "boards": {board_uuid: (board_num, squares) for board_num, squares, board_uuid in decoded},
+        "phrase_ids": {phrase: i for i, phrase in enumerate(meta["phrase_table"])},
+        "win_masks": [mask for masks in compile_win_patterns(meta["win_patterns"] or {}).values() for mask in masks],
+        "links": [_str(link) for link in links],
+    }
+
+
+def _queue_state(game_id):
+    return lambda pipe: (
+        pipe.hmget(_key(game_id, "meta"), "version", "game_state"),
+        pipe.lrange(_key(game_id, "called"), 0, -1),
+        pipe.hgetall(_key(game_id, "claims")),
+        pipe.lrange(_key(game_id, "winners"), 0, -1),
+    )
+
+
+def _parse_state(results):
+    (version, game_state), called, claims, winners = results
+    return {
+        "version": int(version or 0),
+        "game_state": serializers.loads(game_state) if game_state is not None else None,
+        "called": [_str(phrase) for phrase in called],
+        "claims": {board_uuid.decode(): json.loads(claim) for board_uuid, claim in claims.items()},
+        "winners": [serializers.loads(w) for w in winners],
+    }
+
+
+async def _aload(game_id, with_layout=True):
+    """
+    Returns (layout, state) for a game, reading only what is not cached and
+    current, or None if the game does not exist. layout is None unless
+    with_layout. Cached values are shared; callers must not modify them.
+    """
+    _start_listener()
+    layout = _layouts.get(game_id) if with_layout else None
+    state = _states.get(game_id)
+    if state is not None:
+        current = _current(game_id, state)
+        if current is None:
+            _cache_counters["version_checks"] += 1
+            version = await _aredis(game_id)[0].hget(_key(game_id, "meta"), "version")
+            metrics.redis_round_trip("version_check", [(_key(game_id, "meta"), "version")], version)
+            current = version is not None and int(version) == state["version"]
+            if current:
+                _publish(game_id, state["version"])
+        if not current:
+            _cache_counters["stale"] += 1
+            state = None
+
+    queues = []
+    if with_layout and layout is None:
+        queues.append(_queue_layout(game_id))
+    if state is None:
+        queues.append(_queue_state(game_id))
+    if queues:
+        results = await _aread(game_id, lambda pipe: [queue(pipe) for queue in queues])
+        if results is None:
+            return None
+        if with_layout and layout is None:
+            layout, results = _parse_layout(results[:3]), results[3:]
+            _layouts.set(game_id, layout)
+        if state is None:
+            state = _parse_state(results)
+            _states.set(game_id, state)
+            _publish(game_id, state["version"])
+    await anote_activity(game_id)
+    return layout, state
+
+
+def cache_stats():
+    """Hit/miss counters for this worker's game cache."""
+    return {"layouts": _layouts.stats(), "states": _states.stats(), **_cache_counters}
+
+
+def _cache_metrics():
+    # cache_stats() in the metrics exposition format
+    stats = cache_stats()
+    lines = []
+    for stat, name, kind in (
+        ("hits", "bingo_game_cache_hits_total", "counter"),
+        ("misses", "bingo_game_cache_misses_total", "counter"),
+        ("evictions", "bingo_game_cache_evictions_total", "counter"),
+        ("size", "bingo_game_cache_size", "gauge"),
+    ):
+        lines.append(f"# TYPE {name} {kind}")
+        lines += [f'{name}{{cache="{cache}"}} {stats[cache][stat]}' for cache in ("layouts", "states")]
+    for stat in ("version_checks", "stale"):
+        lines += [f"# TYPE bingo_game_cache_{stat}_total counter", f"bingo_game_cache_{stat}_total {stats[stat]}"]
+    return lines
+
+
+metrics.register_collector(_cache_metrics)
+
+
+async def aget_game(game_id):
+    loaded = await _aload(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    game_data = dict(layout["meta"], version=state["version"], game_state=state["game_state"])
+    game_data["board_assignments"] = {
+        board_uuid: board_record(board_num, squares, state["claims"].get(board_uuid))
+        for board_uuid, (board_num, squares) in layout["boards"].items()
+    }
+    game_data["player_links"] = list(layout["links"])
+    game_data["phrases_called"] = list(state["called"])
+    game_data["winners"] = list(state["winners"])
+    return game_data
+
+
+def _load(game_id):
+    # (layout, state) read in one round trip, bypassing the cache, for the
+    # sync reads that the async ones serve from it
+    results = _read(game_id, lambda pipe: (_queue_layout(game_id)(pipe), _queue_state(game_id)(pipe)))
+    if results is None:
+        return None
+    return _parse_layout(results[:3]), _parse_state(results[3:])
+
+
+def _overview(layout, state):
+    game_data = dict(layout["meta"], version=state["version"], game_state=state["game_state"])
+    game_data["winners"] = list(state["winners"])
+    return game_data, list(state["called"]), dict(state["claims"])
+
+
+def get_overview(game_id):
+    """
+    Returns (game_data, phrases_called, claims) without expanding boards:
+    game_data has the meta fields, version and winners, claims is {board_uuid: claim}
+    for claimed boards only. None if the game does not exist.
+    """
+    loaded = _load(game_id)
+    return None if loaded is None else _overview(*loaded)
+
+
+async def aget_overview(game_id):
+    loaded = await _aload(game_id)
+    return None if loaded is None else _overview(*loaded)
+
+
+async def aget_board(game_id, board_uuid):
+    loaded = await _aload(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    board = layout["boards"].get(board_uuid)
+    if board is not None:
+        board = board_record(*board, state["claims"].get(board_uuid))
+    return board, list(state["called"]), layout["meta"]["phrase_table"], state["version"]
+
+
+async def aget_assignments(game_id):
+    loaded = await _aload(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    return state["version"], list(state["called"]), {
+        board_uuid: state["claims"].get(board_uuid) for board_uuid in layout["boards"]
+    }
+
+
+async def aget_indexed_state(game_id):
+    loaded = await _aload(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    return state["version"], [layout["phrase_ids"][phrase] for phrase in state["called"]], [
+        (board_num, state["claims"][board_uuid])
+        for board_uuid, (board_num, _) in layout["boards"].items()
+        if board_uuid in state["claims"]
+    ]
+
+
+def _parse_marks(data):
+    # The whole bitmap is 4 bytes per board
+    data = data or b""
+    return {n: int.from_bytes(data[n * 4:n * 4 + 4], "big") for n in range(len(data) // 4)}
+
+
+def _select_boards(layout, claims, status, marks):
+    # [(board_uuid, (board_num, squares)), ...] matching status; marks are
+    # only needed for near_win
+    boards = layout["boards"].items()
+    if status == "claimed":
+        return [item for item in boards if item[0] in claims]
+    if status == "unclaimed":
+        return [item for item in boards if item[0] not in claims]
+    if status == "near_win":
+        return [
+            item for item in boards
+            if 0 < (to_win(marks.get(item[1][0], 0), layout["win_masks"]) or 0) <= NEAR_WIN
+        ]
+    return list(boards)
+
+
+def _page_fields(client, game_id, page):
+    fields = client.bitfield(_key(game_id, "marks"))
+    for _, (board_num, _) in page:
+        fields.get("u32", board_num * 32)
+    return fields
+
+
+def _board_page(layout, state, boards, page, marks):
+    result = []
+    for board_uuid, (board_num, squares) in page:
+        board = board_record(board_num, squares, state["claims"].get(board_uuid))
+        board["board_uuid"] = board_uuid
+        board["marked"] = marks.get(board_num, 0)
+        board["to_win"] = to_win(board["marked"], layout["win_masks"])
+        result.append(board)
+    return state["version"], len(boards), layout["meta"]["phrase_table"], result
+
+
+def get_board_page(game_id, status=None, offset=0, limit=50):
+    """
+    Returns (version, total, phrase_table, boards) for one page of the boards
+    matching status (None for all, "claimed", "unclaimed" or "near_win"), in
+    board order, or None if the game does not exist. Each board is the
+    board dict plus "board_uuid", "marked" (marked-squares mask) and "to_win"
+    (squares missing from the closest win pattern).
+    """
+    loaded = _load(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    client = _redis(game_id)[0]
+    marks = None
+    if status == "near_win":
+        data = client.get(_key(game_id, "marks"))
+        metrics.redis_round_trip("marks", [(_key(game_id, "marks"),)], data)
+        marks = _parse_marks(data)
+    boards = _select_boards(layout, state["claims"], status, marks)
+    page = boards[offset:offset + limit]
+    if marks is None:
+        marks = {}
+        if page:
+            fields = _page_fields(client, game_id, page)
+            values = fields.execute()
+            metrics.redis_round_trip("marks", [fields.command], values)
+            marks = dict(zip((board_num for _, (board_num, _) in page), values))
+    return _board_page(layout, state, boards, page, marks)
+
+
+async def aget_board_page(game_id, status=None, offset=0, limit=50):
+    # Only the marks bitmap is read from Redis; layouts and claims come from
+    # the game cache
+    loaded = await _aload(game_id)
+    if loaded is None:
+        return None
+    layout, state = loaded
+    client = _aredis(game_id)[0]
+    marks = None
+    if status == "near_win":
+        data = await client.get(_key(game_id, "marks"))
+        metrics.redis_round_trip("marks", [(_key(game_id, "marks"),)], data)
+        marks = _parse_marks(data)
+    boards = _select_boards(layout, state["claims"], status, marks)
+    page = boards[offset:offset + limit]
+    if marks is None:
+        marks = {}
+        if page:
+            fields = _page_fields(client, game_id, page)
+            values = await fields.execute()
+            metrics.redis_round_trip("marks", [fields.command], values)
+            marks = dict(zip((board_num for _, (board_num, _) in page), values))
+    return _board_page(layout, state, boards, page, marks)
+
+
+async def aget_version(game_id):
+    _start_listener()
+    state = _states.peek(game_id)
+    if state is not None and _current(game_id, state):
+        version = state["version"]
+    else:
+        version = _parse_version(await _aread(game_id, _queue_version(game_id)))
+    if version is not None:
+        await anote_activity(game_id)
+    return version
+
+
+# Mutations run as server-side scripts so concurrent requests never lose
+# each other's writes. Every script receives all of the game's keys (in PARTS
+# order) and an ARGV[1] ttl, emits one event when it changes something, and
+# refreshes the expiry of every key.
+_LUA_PRELUDE = "\n".join(
+    f"local {part}_key = KEYS[{i}]" for i, part in enumerate(PARTS, start=1)
+) + f"""
+local ttl = tonumber(ARGV[1])
+local function touch()
+    redis.call('HSET', meta_key, 'active_at', redis.call('TIME')[1])
+    for i = 1, #KEYS do redis.call('EXPIRE', KEYS[i], ttl) end
+end
+-- Packed board: tag (1 = byte squares, 2 = 16-bit squares), u32 board_num, 25 squares
+local function board_num_of(board)
+    local b1, b2, b3, b4 = string.byte(board, 2, 5)
+    return ((b1 * 256 + b2) * 256 + b3) * 256 + b4
+end
+local function square_of(board, pos)
+    local width = string.byte(board, 1)
+    local off = 6 + pos * width
+    local index = string.byte(board, off)
+    if width == 2 then index = index * 256 + string.byte(board, off + 1) end
+    return index
+end
+-- A phrase's index entry lists its hits as {{board_num, pos}}; its index in the
+-- phrase table is read off the first board it is on
+local function phrase_id_of(hits)
+    local first_board = redis.call('HGET', boards_key, redis.call('LINDEX', order_key, hits[1][1]))
+    return square_of(first_board, hits[1][2])
+end
+-- Mark hits on their boards and append board_num, pos and the board's mask
+-- after marking to result for each, in chunks to stay under Lua's unpack()
+-- limit
+local function mark(hits, result)
+    for first = 1, #hits, 1000 do
+        local last = math.min(first + 999, #hits)
+        local args = {{}}
+        for i = first, last do
+            local off = hits[i][1] * 32
+            table.insert(args, 'SET'); table.insert(args, 'u1'); table.insert(args, off + 31 - hits[i][2]); table.insert(args, 1)
+        end
+        for i = first, last do
+            table.insert(args, 'GET'); table.insert(args, 'u32'); table.insert(args, hits[i][1] * 32)
+        end
+        local values = redis.call('BITFIELD', marks_key, unpack(args))
+        local n = last - first + 1
+        for i = first, last do
+            table.insert(result, hits[i][1]); table.insert(result, hits[i][2]); table.insert(result, values[n + i - first + 1])
+        end
+    end
+end
+-- Bump the version and log event under it; returns the encoded event, which
+-- is what gets broadcast
+local function emit(event)
+    event.seq = redis.call('HINCRBY', meta_key, 'version', 1)
+    local encoded = cjson.encode(event)
+    redis.call('XADD', events_key, 'MAXLEN', '~', {EVENT_LOG_LENGTH}, event.seq .. '-0', 'event', encoded)
+    redis.call('PUBLISH', '{VERSIONS_CHANNEL}', meta_key .. ' ' .. event.seq)
+    return encoded
+end
+if redis.call('EXISTS', meta_key) == 0 then return {{'missing'}} end
+"""
+
+_SCRIPTS = {}
+
+_SCRIPTS["call_phrase"] = """
+local phrase = ARGV[2]
+local entry = redis.call('HGET', index_key, phrase)
+if not entry then return {'invalid'} end
+if redis.call('SADD', called_set_key, phrase) == 0 then
+    return {'duplicate', redis.call('LLEN', called_key)}
+end
+local total = redis.call('RPUSH', called_key, phrase)
+local hits = cjson.decode(entry)
+local event = emit({
+    type = 'phrase_called',
+    phrase = phrase,
+    phrase_id = phrase_id_of(hits),
+    total_called = total
+})
+local result = {'ok', total, event, redis.call('HGET', meta_key, 'win_patterns')}
+-- Mark the phrase on every board it appears on and read back those boards' masks
+mark(hits, result)
+touch()
+return result
+"""
+
+# call_phrase for ARGV[2..]: rejected as a whole if any phrase is invalid;
+# phrases already called are skipped. One phrases_called event for the batch
+_SCRIPTS["call_phrases"] = """
+local entries = {}
+for i = 2, #ARGV do
+    entries[i] = redis.call('HGET', index_key, ARGV[i])
+    if not entries[i] then return {'invalid', ARGV[i]} end
+end
+local phrases, phrase_ids, hits, total = {}, {}, {}, 0
+for i = 2, #ARGV do
+    if redis.call('SADD', called_set_key, ARGV[i]) == 1 then
+        local phrase_hits = cjson.decode(entries[i])
+        total = redis.call('RPUSH', called_key, ARGV[i])
+        table.insert(phrases, ARGV[i])
+        table.insert(phrase_ids, phrase_id_of(phrase_hits))
+        for _, hit in ipairs(phrase_hits) do table.insert(hits, hit) end
+    end
+end
+if #phrases == 0 then return {'duplicate', redis.call('LLEN', called_key)} end
+local event = emit({
+    type = 'phrases_called',
+    phrases = phrases,
+    phrase_ids = phrase_ids,
+    total_called = total
+})
+local result = {'ok', total, event, redis.call('HGET', meta_key, 'win_patterns')}
+mark(hits, result)
+touch()
+return result
+"""
+
+# Activity without a change: no event, and cached state stays valid
+_SCRIPTS["touch"] = """
+touch()
+return {'touched'}
+"""
+
+# A read; its own status, so cached state stays valid
+_SCRIPTS["board_owners"] = """
+local result = {'found'}
+for i = 2, #ARGV do
+    local board_uuid = redis.call('LINDEX', order_key, ARGV[i])
+    table.insert(result, board_uuid or false)
+    table.insert(result, board_uuid and redis.call('HGET', claims_key, board_uuid) or false)
+end
+return result
+"""
+
+_SCRIPTS["claim_board"] = """
+local board_uuid = ARGV[2]
+local board = redis.call('HGET', boards_key, board_uuid)
+if not board then return {'invalid'} end
+if redis.call('HSETNX', claims_key, board_uuid, ARGV[3]) == 0 then return {'taken'} end
+local claim = cjson.decode(ARGV[3])
+local event = emit({
+    type = 'player_joined',
+    board_uuid = board_uuid,
+    board_num = board_num_of(board),
+    player_name = claim.player_name,
+    player_email = claim.player_email
+})
+touch()
+return {'ok', event}
+"""
+
+# ARGV[2..] are claims, given to unclaimed boards in board_num order. Claims
+# nothing unless there are enough boards left. One players_joined event
+_SCRIPTS["claim_boards"] = """
+local claimed = {}
+for _, board_uuid in ipairs(redis.call('HKEYS', claims_key)) do claimed[board_uuid] = true end
+local free = {}
+for i, board_uuid in ipairs(redis.call('LRANGE', order_key, 0, -1)) do
+    if #free == #ARGV - 1 then break end
+    if not claimed[board_uuid] then table.insert(free, {board_uuid, i - 1}) end
+end
+if #free < #ARGV - 1 then return {'full', #free} end
+local players = {}
+for i, board in ipairs(free) do
+    local claim = cjson.decode(ARGV[i + 1])
+    redis.call('HSET', claims_key, board[1], ARGV[i + 1])
+    table.insert(players, {
+        board_uuid = board[1],
+        board_num = board[2],
+        player_name = claim.player_name,
+        player_email = claim.player_email
+    })
+end
+local event = emit({type = 'players_joined', players = players})
+touch()
+return {'ok', event}
+"""
+
+_SCRIPTS["record_win"] = """
+if redis.call('SADD', win_keys_key, ARGV[2]) == 0 then return {'duplicate'} end
+redis.call('RPUSH', winners_key, ARGV[3])
+local event = cjson.decode(ARGV[4])
+local board = redis.call('HGET', boards_key, event.board_uuid)
+if board then event.board_num = board_num_of(board) end
+event = emit(event)
+touch()
+return {'ok', event}
+"""
+
+_SCRIPTS["claim_win"] = """
+local board_uuid, pattern, mask = ARGV[2], ARGV[3], ARGV[4]
+if redis.call('SISMEMBER', win_masks_key, pattern .. ':' .. mask) == 0 then return {'bad_pattern'} end
+if redis.call('SISMEMBER', win_keys_key, board_uuid .. ':' .. pattern) == 1 then return {'duplicate'} end
+local board = redis.call('HGET', boards_key, board_uuid)
+if not board then return {'invalid'} end
+local board_num = board_num_of(board)
+for i = 6, #ARGV do
+    local pos = tonumber(ARGV[i])
+    if redis.call('GETBIT', marks_key, board_num * 32 + 31 - pos) == 0 then
+        return {'not_called', square_of(board, pos)}
+    end
+end
+local claim = redis.call('HGET', claims_key, board_uuid)
+local player = claim and cjson.decode(claim) or {}
+local player_name = player.player_name or 'Anonymous'
+local winner = cjson.encode({
+    board_uuid = board_uuid,
+    player_name = player_name,
+    player_email = player.player_email,
+    pattern = pattern,
+    timestamp = ARGV[5]
+})
+redis.call('SADD', win_keys_key, board_uuid .. ':' .. pattern)
+redis.call('RPUSH', winners_key, winner)
+local event = emit({
+    type = 'player_won',
+    board_uuid = board_uuid,
+    board_num = board_num,
+    player_name = player_name,
+    pattern = pattern
+})
+touch()
+return {'ok', winner, event}
+"""
+
+def _run(name, game_id, *args, ttl=GAME_TTL):
+    """
+    Run a mutation script, restoring a legacy blob or archived game first if
+    needed.
+    Returns the script's result list; its first item is a status string,
+    "ok" only if the script changed the game.
+    """
+    script, keys, args = _redis(game_id)[1][name], _keys(game_id), [ttl, *args]
+    result = script(keys=keys, args=args)
+    metrics.redis_round_trip(name, [keys, args], result)
+    if result[0] == b"missing" and _restore(game_id):
+        result = script(keys=keys, args=args)
+        metrics.redis_round_trip(name, [keys, args], result)
+    result[0] = result[0].decode()
+    if result[0] == "ok":
+        # Our own writes need not wait for the published version
+        _states.pop(game_id)
+    return result
+
+
+async def _arun(name, game_id, *args, ttl=GAME_TTL):
+    script, keys, args = _aredis(game_id)[1][name], _keys(game_id), [ttl, *args]
+    result = await script(keys=keys, args=args)
+    metrics.redis_round_trip(name, [keys, args], result)
+    if result[0] == b"missing" and await sync_to_async(_restore)(game_id):
+        result = await script(keys=keys, args=args)
+        metrics.redis_round_trip(name, [keys, args], result)
+    result[0] = result[0].decode()
+    if result[0] == "ok":
+        _states.pop(game_id)
+    return result
+
+
+@lru_cache(maxsize=64)
+def _compiled_patterns(win_patterns_payload):
+    return compile_win_patterns(serializers.loads(win_patterns_payload))
+
+
+def _called_phrase_result(result):
+    status, *rest = result
+    if status != "ok":
+        detail = rest[0] if rest else None
+        return status, (_str(detail) if isinstance(detail, bytes) else detail), [], None
+
+    total, event, win_patterns_payload, *hits = rest
+    marked = {}
+    new_bits = {}
+    for i in range(0, len(hits), 3):
+        board_num, pos, mask = hits[i:i + 3]
+        marked[board_num] = marked.get(board_num, 0) | mask
+        new_bits[board_num] = new_bits.get(board_num, 0) | (1 << pos)
+    return status, total, find_new_wins(_compiled_patterns(win_patterns_payload), marked, new_bits), json.loads(event)
+
+
+def record_called_phrase(game_id, phrase, ttl=GAME_TTL):
+    """
+    Atomically append phrase to the called list if it appears on some board
+    and was not already called, and mark it on those boards.
+    Returns (status, total_called, new_wins, event) where status is "ok",
+    "invalid", "duplicate" or "missing" (no such game), new_wins lists the
+    (board_num, pattern) pairs this call completed and event is the logged
+    phrase_called event (None unless status is "ok").
+    """
+    return _called_phrase_result(_run("call_phrase", game_id, phrase, ttl=ttl))
+
+
+async def arecord_called_phrase(game_id, phrase, ttl=GAME_TTL):
+    return _called_phrase_result(await _arun("call_phrase", game_id, phrase, ttl=ttl))
+
+
+def record_called_phrases(game_id, phrases, ttl=GAME_TTL):
+    """
+    record_called_phrase for a batch, atomically and with one phrases_called
+    event. Nothing is recorded if any phrase appears on no board; phrases
+    already called (or repeated) are skipped.
+    Returns (status, detail, new_wins, event) where status is "ok" (detail is
+    total_called), "invalid" (detail is the first such phrase), "duplicate"
+    (every phrase was already called; detail is total_called) or "missing".
+    """
+    return _called_phrase_result(_run("call_phrases", game_id, *phrases, ttl=ttl))
+
+
+async def arecord_called_phrases(game_id, phrases, ttl=GAME_TTL):
+    return _called_phrase_result(await _arun("call_phrases", game_id, *phrases, ttl=ttl))
+
+
+def _board_owners_result(board_nums, result):
+    status, *owners = result
+    if status != "found":
+        return {}
+    return {
+        board_num: (owners[i * 2].decode(), json.loads(owners[i * 2 + 1]) if owners[i * 2 + 1] else None)
+        for i, board_num in enumerate(board_nums)
+        if owners[i * 2]
+    }
+
+
+def get_board_owners(game_id, board_nums):
+    """Returns {board_num: (board_uuid, claim or None)} for the given boards."""
+    return _board_owners_result(board_nums, _run("board_owners", game_id, *board_nums))
+
+
+async def aget_board_owners(game_id, board_nums):
+    return _board_owners_result(board_nums, await _arun("board_owners", game_id, *board_nums))
+
+
+def _claim(player_name, player_email):
+    return json.dumps(claim_record(player_name, player_email))
+
+
+def _event_result(result):
+    status, *rest = result
+    return status, (json.loads(rest[-1]) if status == "ok" else None)
+
+
+def claim_board(game_id, board_uuid, player_name, player_email, ttl=GAME_TTL):
+    """
+    Atomically claim a board if nobody has claimed it yet.
+    Returns (status, event) where status is "ok", "taken", "invalid" (no such
+    board) or "missing" (no such game) and event is the logged player_joined
+    event (None unless status is "ok").
+    """
+    return _event_result(_run("claim_board", game_id, board_uuid, _claim(player_name, player_email), ttl=ttl))
+
+
+async def aclaim_board(game_id, board_uuid, player_name, player_email, ttl=GAME_TTL):
+    return _event_result(
+        await _arun("claim_board", game_id, board_uuid, _claim(player_name, player_email), ttl=ttl)
+    )
+
+
+def _claim_boards_result(result):
+    status, *rest = result
+    if status == "ok":
+        event = json.loads(rest[0])
+        return status, event["players"], event
+    return status, (rest[0] if rest else None), None
+
+
+def claim_boards(game_id, players, ttl=GAME_TTL):
+    """
+    Atomically give each (player_name, player_email) in players the next
+    unclaimed board, in board_num order, with one players_joined event.
+    Returns (status, detail, event):
+      ("ok", players, event)     players lists board_uuid, board_num, player_name, player_email
+      ("full", available, None)  fewer unclaimed boards than players; nothing claimed
+      ("missing", None, None)    no such game
+    """
+    return _claim_boards_result(_run("claim_boards", game_id, *(_claim(*p) for p in players), ttl=ttl))
+
+
+async def aclaim_boards(game_id, players, ttl=GAME_TTL):
+    return _claim_boards_result(await _arun("claim_boards", game_id, *(_claim(*p) for p in players), ttl=ttl))
+
+
+def _win_args(winner):
+    event = {
+        "type": "player_won",
+        "board_uuid": winner["board_uuid"],
+        "player_name": winner["player_name"],
+        "pattern": winner["pattern"],
+    }
+    return _win_key(winner["board_uuid"], winner["pattern"]), serializers.dumps(winner), json.dumps(event)
+
+
+def record_win(game_id, winner, ttl=GAME_TTL):
+    """
+    Record a winner once per (board_uuid, pattern).
+    Returns (status, event) where status is "ok", "duplicate" or "missing"
+    (no such game) and event is the logged player_won event.
+    """
+    return _event_result(_run("record_win", game_id, *_win_args(winner), ttl=ttl))
+
+
+async def arecord_win(game_id, winner, ttl=GAME_TTL):
+    return _event_result(await _arun("record_win", game_id, *_win_args(winner), ttl=ttl))
+
+
+def _claim_win_result(result, phrase_table):
+    status, *rest = result
+    if status == "ok":
+        return status, json.loads(rest[0]), json.loads(rest[1])
+    if status == "not_called":
+        return status, phrase_table()[rest[0]], None
+    return status, None, None
+
+
+def verify_and_record_win(game_id, board_uuid, pattern, positions, timestamp, ttl=GAME_TTL):
+    """
+    Check a client's win claim and record it, in one round trip and without
+    loading the game. positions must be exactly one of the game's masks for
+    pattern, and every square in it must be marked on the board.
+    Returns (status, detail, event):
+      ("ok", winner, event)        newly recorded; event is the logged player_won
+      ("duplicate", None, None)    already recorded for this board and pattern
+      ("bad_pattern", None, None)  positions are not a mask of pattern
+      ("not_called", phrase, None) a square in positions has not been called
+      ("invalid", None, None)      no such board
+      ("missing", None, None)      no such game
+    """
+    result = _run(
+        "claim_win", game_id, board_uuid, pattern, positions_mask(positions), timestamp, *positions, ttl=ttl
+    )
+    return _claim_win_result(
+        result, lambda: serializers.loads(_redis(game_id)[0].hget(_key(game_id, "meta"), "phrase_table"))
+    )
+
+
+async def averify_and_record_win(game_id, board_uuid, pattern, positions, timestamp, ttl=GAME_TTL):
+    result = await _arun(
+        "claim_win", game_id, board_uuid, pattern, positions_mask(positions), timestamp, *positions, ttl=ttl
+    )
+    if result[0] == "not_called":
+        payload = await _aredis(game_id)[0].hget(_key(game_id, "meta"), "phrase_table")
+        metrics.redis_round_trip("phrase_table", [(_key(game_id, "meta"), "phrase_table")], payload)
+        phrase_table = serializers.loads(payload)
+        return _claim_win_result(result, lambda: phrase_table)
+    return _claim_win_result(result, None)
+
+
+def touch_game(game_id, ttl=GAME_TTL):
+    """Restart the game's expiry and mark it active, restoring it if archived."""
+    _run("touch", game_id, ttl=ttl)
+
+
+async def atouch_game(game_id, ttl=GAME_TTL):
+    await _arun("touch", game_id, ttl=ttl)
+
+
+_touched = LRUCache(CACHE_GAMES * 16, ttl=TOUCH_INTERVAL)
+
+
+async def anote_activity(game_id):
+    """atouch_game(), at most once per TOUCH_INTERVAL per game in this worker."""
+    if _touched.peek(game_id) is None:
+        _touched.set(game_id, True)
+        await atouch_game(game_id)
+
+
+def archive_game(game_id):
+    """
+    Move a game out of Redis into the ArchivedGame table, compressed. Reads
+    and writes rehydrate it. Returns False if the game does not exist or
+    changed while it was being archived (it then stays in Redis).
+    """
+    from .models import ArchivedGame
+
+    meta_key = _key(game_id, "meta")
+    with _redis(game_id)[0].pipeline() as pipe:
+        # Every mutation writes meta, so watching it catches any of them
+        pipe.watch(meta_key)
+        if not pipe.exists(meta_key):
+            pipe.unwatch()
+            return False
+        game_data = get_game(game_id)
+        ArchivedGame.objects.update_or_create(game_id=game_id, defaults={
+            "version": game_data["version"],
+            "data": serializers.dumps(game_data, compress_min=1),
+        })
+        pipe.multi()
+        pipe.delete(*_keys(game_id))
+        try:
+            _execute("archive", pipe)
+        except redis.WatchError:
+            ArchivedGame.objects.filter(game_id=game_id).delete()
+            return False
+    _layouts.pop(game_id)
+    _states.pop(game_id)
+    return True
+
+
+def archive_idle_games(idle=ARCHIVE_IDLE, finished_idle=ARCHIVE_FINISHED_IDLE):
+    """
+    Archive every game inactive for idle seconds, or for finished_idle
+    seconds once it has a winner. Returns the archived game ids.
+    """
+    now = time.time()
+    archived = []
+    for client, _ in _all_redis():
+        meta_keys = list(client.scan_iter(match=_key("*", "meta"), _type="hash"))
+        with client.pipeline(transaction=False) as pipe:
+            for meta_key in meta_keys:
+                pipe.hget(meta_key, "active_at")
+                pipe.llen(meta_key[:-len(b"meta")] + b"winners")
+            results = _execute("read", pipe)
+
+        for i, meta_key in enumerate(meta_keys):
+            active_at, winners = results[i * 2:i * 2 + 2]
+            # Games stored before activity was tracked count as idle
+            idle_for = now - int(active_at or 0)
+            if idle_for >= (finished_idle if winners else idle):
+                game_id = _game_id_of(meta_key)
+                if archive_game(game_id):
+                    archived.append(game_id)
+    return archived
+
+
+class RedisGameStore(GameStore):
+    """The GameStore over this module: games shared by every worker through Redis."""
+
+    save_game = staticmethod(save_game)
+    get_game = staticmethod(get_game)
+    get_overview = staticmethod(get_overview)
+    get_board = staticmethod(get_board)
+    get_assignments = staticmethod(get_assignments)
+    get_indexed_state = staticmethod(get_indexed_state)
+    get_board_page = staticmethod(get_board_page)
+    get_version = staticmethod(get_version)
+    events_since = staticmethod(events_since)
+    get_board_owners = staticmethod(get_board_owners)
+    record_called_phrase = staticmethod(record_called_phrase)
+    record_called_phrases = staticmethod(record_called_phrases)
+    claim_board = staticmethod(claim_board)
+    claim_boards = staticmethod(claim_boards)
+    record_win = staticmethod(record_win)
+    verify_and_record_win = staticmethod(verify_and_record_win)
+    touch_game = staticmethod(touch_game)
+    archive_idle_games = staticmethod(archive_idle_games)
+
+    aget_game = staticmethod(aget_game)
+    aget_overview = staticmethod(aget_overview)
+    aget_board = staticmethod(aget_board)
+    aget_assignments = staticmethod(aget_assignments)
+    aget_indexed_state = staticmethod(aget_indexed_state)
+    aget_board_page = staticmethod(aget_board_page)
+    aget_version = staticmethod(aget_version)
+    aevents_since = staticmethod(aevents_since)
+    aget_board_owners = staticmethod(aget_board_owners)
+    arecord_called_phrase = staticmethod(arecord_called_phrase)
+    arecord_called_phrases = staticmethod(arecord_called_phrases)
+    aclaim_board = staticmethod(aclaim_board)
+    aclaim_boards = staticmethod(aclaim_boards)
+    arecord_win = staticmethod(arecord_win)
+    averify_and_record_win = staticmethod(averify_and_record_win)
+    atouch_game = staticmethod(atouch_game)
+    anote_activity = staticmethod(anote_activity)
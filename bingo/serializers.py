@@ -0,0 +1,60 @@
+import zlib
+
+import cbor2
+import msgpack
+import ujson
+from django.conf import settings
+
+# Stored payloads start with a one-byte tag naming their format, with the
+# high bit set when the body is zlib-compressed. Untagged payloads are plain
+# JSON: anything written before tagging existed, or by a Lua script (cjson).
+FORMATS = {
+    "json": 0x01,
+    "ujson": 0x01,  # Same wire format, faster encoder
+    "msgpack": 0x02,
+    "cbor": 0x03,
+}
+COMPRESSED = 0x80
+
+_encoders = {
+    "json": lambda value: ujson.dumps(value, ensure_ascii=False).encode(),
+    "ujson": lambda value: ujson.dumps(value, ensure_ascii=False).encode(),
+    "msgpack": lambda value: msgpack.packb(value, use_bin_type=True),
+    "cbor": cbor2.dumps,
+}
+_decoders = {
+    0x01: ujson.loads,
+    0x02: lambda body: msgpack.unpackb(body, raw=False, strict_map_key=False),
+    0x03: cbor2.loads,
+}
+
+
+def dumps(value, fmt=None, compress_min=None):
+    """
+    Encode value as a tagged payload. fmt and compress_min default to the
+    BINGO_STORE_FORMAT and BINGO_STORE_COMPRESS_MIN settings; payloads at
+    least compress_min bytes long are compressed (0 disables compression).
+    """
+    fmt = fmt or getattr(settings, "BINGO_STORE_FORMAT", "json")
+    if compress_min is None:
+        compress_min = getattr(settings, "BINGO_STORE_COMPRESS_MIN", 0)
+    tag = FORMATS[fmt]
+    body = _encoders[fmt](value)
+    if compress_min and len(body) >= compress_min:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            return bytes([tag | COMPRESSED]) + compressed
+    return bytes([tag]) + body
+
+
+def loads(data):
+    """Decode a payload written by dumps(), or plain untagged JSON."""
+    if isinstance(data, str):
+        data = data.encode()
+    tag = data[0]
+    if tag & ~COMPRESSED not in _decoders:
+        return ujson.loads(data)
+    body = data[1:]
+    if tag & COMPRESSED:
+        body = zlib.decompress(body)
+    return _decoders[tag & ~COMPRESSED](body)
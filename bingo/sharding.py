@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+from urllib.parse import urlsplit
+
+# Points per node on the ring; more spread games more evenly
+REPLICAS = 128
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def node_name(url):
+    """
+    A Redis URL's place on the ring: host, port and database, so changing a
+    password or scheme does not move games.
+    """
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 6379}{parts.path or '/0'}"
+
+
+def parse_urls(value):
+    """Comma-separated Redis URLs, e.g. from the REDIS_URLS environment variable."""
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes. Adding a node moves only the keys
+    it takes over (about 1/N of them), all from the existing nodes to it.
+    name(node) places a node on the ring.
+    """
+
+    def __init__(self, nodes, name=node_name):
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted(
+            (_hash(f"{name(node)}#{i}"), n) for n, node in enumerate(self.nodes) for i in range(REPLICAS)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [n for _, n in points]
+
+    def index_for(self, key):
+        """Position in nodes of the node that owns key."""
+        if len(self.nodes) == 1:
+            return 0
+        i = bisect.bisect(self._hashes, _hash(key))
+        return self._owners[i % len(self._hashes)]
+
+    def node_for(self, key):
+        return self.nodes[self.index_for(key)]
@@ -0,0 +1,271 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import serializers
+from .board_codec import decode_board, encode_board
+from .game_store import EVENT_LOG_LENGTH
+from .local_game_store import GameHandle, LocalGameStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    meta BLOB NOT NULL,
+    links TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    active_at INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_expires_at ON games (expires_at);
+CREATE TABLE IF NOT EXISTS boards (
+    game_id TEXT NOT NULL REFERENCES games ON DELETE CASCADE,
+    board_num INTEGER NOT NULL,
+    board_uuid TEXT NOT NULL,
+    squares BLOB NOT NULL,
+    marks INTEGER NOT NULL,
+    claim TEXT,
+    PRIMARY KEY (game_id, board_num)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS boards_uuid ON boards (game_id, board_uuid);
+CREATE TABLE IF NOT EXISTS phrases (
+    game_id TEXT NOT NULL REFERENCES games ON DELETE CASCADE,
+    phrase TEXT NOT NULL,
+    hits TEXT NOT NULL,
+    PRIMARY KEY (game_id, phrase)
+);
+CREATE TABLE IF NOT EXISTS called (
+    game_id TEXT NOT NULL REFERENCES games ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phrase TEXT NOT NULL,
+    PRIMARY KEY (game_id, phrase)
+);
+CREATE TABLE IF NOT EXISTS winners (
+    game_id TEXT NOT NULL REFERENCES games ON DELETE CASCADE,
+    win_key TEXT NOT NULL,
+    winner TEXT NOT NULL,
+    PRIMARY KEY (game_id, win_key)
+);
+CREATE TABLE IF NOT EXISTS events (
+    game_id TEXT NOT NULL REFERENCES games ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (game_id, seq)
+);
+"""
+
+# Stays under SQLite's limit on parameters per statement
+CHUNK = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK):
+        yield items[i:i + CHUNK]
+
+
+class _SQLiteGame(GameHandle):
+
+    def __init__(self, db, game_id, row):
+        self._db = db
+        self._id = game_id
+        meta, links, self._version = row
+        self._meta, self._links = meta, links
+
+    def _rows(self, sql, *params):
+        return self._db.execute(sql, (self._id, *params)).fetchall()
+
+    def _value(self, sql, *params):
+        row = self._db.execute(sql, (self._id, *params)).fetchone()
+        return None if row is None else row[0]
+
+    def meta(self):
+        return serializers.loads(self._meta)
+
+    def version(self):
+        return self._version
+
+    def next_version(self):
+        self._version += 1
+        self._db.execute("UPDATE games SET version = ? WHERE game_id = ?", (self._version, self._id))
+        return self._version
+
+    def touch(self, ttl):
+        now = time.time()
+        self._db.execute(
+            "UPDATE games SET active_at = ?, expires_at = ? WHERE game_id = ?", (int(now), now + ttl, self._id)
+        )
+
+    def order(self):
+        return [uuid for uuid, in self._rows("SELECT board_uuid FROM boards WHERE game_id = ? ORDER BY board_num")]
+
+    def boards(self):
+        return [
+            (board_uuid, *decode_board(squares))
+            for board_uuid, squares in self._rows(
+                "SELECT board_uuid, squares FROM boards WHERE game_id = ? ORDER BY board_num"
+            )
+        ]
+
+    def board(self, board_uuid):
+        squares = self._value("SELECT squares FROM boards WHERE game_id = ? AND board_uuid = ?", board_uuid)
+        return None if squares is None else decode_board(squares)
+
+    def squares(self, board_num):
+        return decode_board(self._value("SELECT squares FROM boards WHERE game_id = ? AND board_num = ?", board_num))[1]
+
+    def claims(self):
+        return {
+            board_uuid: json.loads(claim)
+            for board_uuid, claim in self._rows(
+                "SELECT board_uuid, claim FROM boards WHERE game_id = ? AND claim IS NOT NULL ORDER BY board_num"
+            )
+        }
+
+    def claim(self, board_uuid):
+        claim = self._value("SELECT claim FROM boards WHERE game_id = ? AND board_uuid = ?", board_uuid)
+        return None if claim is None else json.loads(claim)
+
+    def set_claim(self, board_uuid, claim):
+        self._db.execute(
+            "UPDATE boards SET claim = ? WHERE game_id = ? AND board_uuid = ?", (json.dumps(claim), self._id, board_uuid)
+        )
+
+    def called(self):
+        return [phrase for phrase, in self._rows("SELECT phrase FROM called WHERE game_id = ? ORDER BY position")]
+
+    def called_count(self):
+        return self._value("SELECT count(*) FROM called WHERE game_id = ?")
+
+    def is_called(self, phrase):
+        return self._value("SELECT 1 FROM called WHERE game_id = ? AND phrase = ?", phrase) is not None
+
+    def add_called(self, phrase):
+        total = self.called_count() + 1
+        self._db.execute("INSERT INTO called VALUES (?, ?, ?)", (self._id, total, phrase))
+        return total
+
+    def hits(self, phrase):
+        hits = self._value("SELECT hits FROM phrases WHERE game_id = ? AND phrase = ?", phrase)
+        return None if hits is None else json.loads(hits)
+
+    def mark(self, hits):
+        bits = {}
+        for board_num, pos in hits:
+            bits[board_num] = bits.get(board_num, 0) | (1 << pos)
+        self._db.executemany(
+            "UPDATE boards SET marks = marks | ? WHERE game_id = ? AND board_num = ?",
+            [(new_bits, self._id, board_num) for board_num, new_bits in bits.items()],
+        )
+        return self.masks(bits)
+
+    def masks(self, board_nums=None):
+        if board_nums is None:
+            return dict(self._rows("SELECT board_num, marks FROM boards WHERE game_id = ?"))
+        masks = {}
+        for chunk in _chunks(board_nums):
+            masks.update(self._rows(
+                f"SELECT board_num, marks FROM boards WHERE game_id = ? AND board_num IN ({','.join('?' * len(chunk))})",
+                *chunk,
+            ))
+        return masks
+
+    def winners(self):
+        return [json.loads(winner) for winner, in self._rows("SELECT winner FROM winners WHERE game_id = ? ORDER BY rowid")]
+
+    def has_win(self, win_key):
+        return self._value("SELECT 1 FROM winners WHERE game_id = ? AND win_key = ?", win_key) is not None
+
+    def add_winner(self, win_key, winner):
+        self._db.execute("INSERT INTO winners VALUES (?, ?, ?)", (self._id, win_key, json.dumps(winner)))
+
+    def log(self, seq, event):
+        self._db.execute("INSERT INTO events VALUES (?, ?, ?)", (self._id, seq, event))
+        self._db.execute("DELETE FROM events WHERE game_id = ? AND seq <= ?", (self._id, seq - EVENT_LOG_LENGTH))
+
+    def events_after(self, seq):
+        return [
+            json.loads(event)
+            for event, in self._rows("SELECT event FROM events WHERE game_id = ? AND seq > ? ORDER BY seq", seq)
+        ]
+
+    def links(self):
+        return json.loads(self._links)
+
+
+class SQLiteGameStore(LocalGameStore):
+    """
+    Games in a SQLite file (the BINGO_STORE_SQLITE_PATH setting): no server
+    and games survive restarts. Every worker on the host may share the file;
+    mutations take SQLite's write lock, so they run one at a time. Each
+    thread opens its own connection on first use.
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or settings.BINGO_STORE_SQLITE_PATH
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Transactions are started explicitly in _transaction()
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.execute("PRAGMA foreign_keys = ON")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self, write):
+        db = self._db()
+        # IMMEDIATE takes the write lock up front, so two mutations never
+        # both read before either writes
+        db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @contextmanager
+    def _game(self, game_id, write=False):
+        with self._transaction(write) as db:
+            row = db.execute(
+                "SELECT meta, links, version FROM games WHERE game_id = ? AND expires_at > ?",
+                (game_id, time.time()),
+            ).fetchone()
+            yield None if row is None else _SQLiteGame(db, game_id, row)
+
+    def _write_game(self, game_id, game, ttl):
+        meta = game["meta"]
+        now = time.time()
+        with self._transaction(write=True) as db:
+            # Dropping a game cascades to its rows
+            db.execute("DELETE FROM games WHERE game_id = ? OR expires_at <= ?", (game_id, now))
+            db.execute("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?)", (
+                game_id, serializers.dumps(meta), json.dumps(game["links"]), game["version"], int(now), now + ttl,
+            ))
+            db.executemany("INSERT INTO boards VALUES (?, ?, ?, ?, ?, ?)", [
+                (
+                    game_id, board_num, board_uuid, encode_board(board_num, squares, len(meta["phrase_table"])),
+                    game["marks"][board_num],
+                    json.dumps(game["claims"][board_uuid]) if board_uuid in game["claims"] else None,
+                )
+                for board_uuid, board_num, squares in game["boards"]
+            ])
+            db.executemany("INSERT INTO phrases VALUES (?, ?, ?)", [
+                (game_id, phrase, json.dumps(hits)) for phrase, hits in game["index"].items()
+            ])
+            db.executemany("INSERT OR IGNORE INTO called VALUES (?, ?, ?)", [
+                (game_id, position, phrase) for position, phrase in enumerate(dict.fromkeys(game["called"]), start=1)
+            ])
+            db.executemany("INSERT OR IGNORE INTO winners VALUES (?, ?, ?)", [
+                (game_id, f"{w['board_uuid']}:{w['pattern']}", json.dumps(w)) for w in game["winners"]
+            ])
@@ -1,6 +0,0 @@
-from upstash_redis import Redis
-
-redis = Redis.from_env()
-
-redis.set("foo", "bar")
-value = redis.get("foo")
\ No newline at end of file
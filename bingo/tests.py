@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .sharding import HashRing, node_name, parse_urls
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/bingo/healthz", timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def _ws_connect(port, path):
+    """Minimal WebSocket client handshake; returns the connected socket."""
+    sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f"GET {path} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+        f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    response = b""
+    while b"\r\n\r\n" not in response:
+        response += sock.recv(1)
+    assert response.startswith(b"HTTP/1.1 101"), response
+    return sock
+
+
+def _ws_recv(sock):
+    """Read one unfragmented text frame sent by the server."""
+    def read(n):
+        data = b""
+        while len(data) < n:
+            data += sock.recv(n - len(data))
+        return data
+
+    _, length = read(2)
+    if length == 126:
+        length = int.from_bytes(read(2), "big")
+    elif length == 127:
+        length = int.from_bytes(read(8), "big")
+    return json.loads(read(length))
+
+
+@unittest.skipUnless(
+    os.environ.get("REDIS_URL") and os.environ.get("CHANNEL_REDIS_URL"),
+    "needs REDIS_URL and CHANNEL_REDIS_URL pointing at a Redis server",
+)
+class MultiProcessBroadcastTests(SimpleTestCase):
+    """
+    Broadcasts must reach sockets held by other server processes, which
+    only works with the Redis channel layer.
+    """
+
+    def start(self, *args):
+        proc = subprocess.Popen([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.terminate)
+        return proc
+
+    def new_game(self):
+        from .bingoServer import create_game
+        from .redis_game_store import save_game
+
+        game_id = f"test-{os.urandom(4).hex()}"
+        save_game(game_id, create_game(game_id, 2, [f"phrase {i}" for i in range(48)]), ttl=60)
+        return game_id
+
+    def call(self, port, game_id, phrase):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/bingo/games/{game_id}/call/",
+            data=json.dumps({"phrase": phrase}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    def test_phrase_called_reaches_clients_on_other_workers(self):
+        ports = [_free_port(), _free_port()]
+        for port in ports:
+            self.start("-m", "daphne", "-b", "127.0.0.1", "-p", str(port), "shiftjoy.asgi:application")
+        for port in ports:
+            _wait_ready(port)
+
+        game_id = self.new_game()
+        sockets = [_ws_connect(port, f"/ws/bingo/{game_id}/") for port in ports]
+        for sock in sockets:
+            self.addCleanup(sock.close)
+        time.sleep(0.5)  # group_add completes after the handshake
+
+        self.assertTrue(self.call(ports[0], game_id, "phrase 7")["success"])
+        for sock in sockets:
+            event = _ws_recv(sock)
+            self.assertEqual((event["type"], event["phrase"]), ("phrase_called", "phrase 7"))
+
+    def test_runworkers_shares_one_port(self):
+        port = _free_port()
+        self.start("manage.py", "runworkers", "--workers", "2", "--bind", "127.0.0.1", "--port", str(port))
+        _wait_ready(port)
+
+        game_id = self.new_game()
+        sockets = [_ws_connect(port, f"/ws/bingo/{game_id}/") for _ in range(8)]
+        for sock in sockets:
+            self.addCleanup(sock.close)
+        time.sleep(0.5)
+
+        self.assertTrue(self.call(port, game_id, "phrase 3")["success"])
+        for sock in sockets:
+            self.assertEqual(_ws_recv(sock)["phrase"], "phrase 3")
+
+
+class BoardGeneratorTests(SimpleTestCase):
+    def test_boards(self):
+        import numpy as np
+
+        from .bingoCardGenerator import FREE_SPACE_INDEX, generate_board_indices
+
+        for num_phrases, num_boards in ((48, 1), (48, 500), (50, 97), (1000, 300)):
+            with self.subTest(num_phrases=num_phrases, num_boards=num_boards):
+                boards = generate_board_indices(num_phrases, num_boards, seed=1)
+                self.assertEqual(boards.shape, (num_boards, 25))
+                self.assertTrue((boards[:, 12] == FREE_SPACE_INDEX).all())
+                picks = np.delete(boards, 12, axis=1)
+                self.assertTrue((picks < num_phrases).all())
+                for board in picks.tolist():
+                    self.assertEqual(len(set(board)), 24)
+                self.assertEqual(len(np.unique(picks, axis=0)), num_boards)
+                # Dealt from whole decks, so phrase counts differ by at most one
+                counts = np.bincount(picks.reshape(-1), minlength=num_phrases)
+                self.assertLessEqual(counts.max() - counts.min(), 1)
+
+    def test_seed(self):
+        from .bingoCardGenerator import generate_board_indices
+
+        self.assertEqual(generate_board_indices(60, 40, seed=7).tolist(), generate_board_indices(60, 40, seed=7).tolist())
+        self.assertNotEqual(generate_board_indices(60, 40, seed=7).tolist(), generate_board_indices(60, 40, seed=8).tolist())
+
+    def test_too_few_phrases(self):
+        from .bingoCardGenerator import bingoCardGenerator, generate_board_indices
+
+        with self.assertRaises(ValueError):
+            generate_board_indices(47, 5)
+        with self.assertRaises(ValueError):
+            bingoCardGenerator([f"phrase {i}" for i in range(47)], 5)
+
+    def test_phrase_boards(self):
+        from .bingoCardGenerator import bingoCardGenerator
+
+        phrases = [f"phrase {i}" for i in range(48)]
+        boards = bingoCardGenerator(phrases, 3, seed=3)
+        self.assertEqual(boards, bingoCardGenerator(phrases, 3, seed=3))
+        for rows in boards.values():
+            squares = [square for row in rows for square in row]
+            self.assertEqual(squares[12], "Free Space")
+            self.assertEqual(len(set(squares)), 25)
+            self.assertTrue(set(squares) - {"Free Space"} <= set(phrases))
+
+
+class BoardCodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        from .bingoCardGenerator import FREE_SPACE_INDEX, MAX_PHRASES
+        from .board_codec import decode_board, encode_board
+
+        # One byte per square below 255 phrases, two from there
+        for table_size, size in ((48, 30), (254, 30), (255, 55), (256, 55), (MAX_PHRASES, 55)):
+            for board_num in (0, 2**32 - 1):
+                with self.subTest(table_size=table_size, board_num=board_num):
+                    squares = [table_size - 1 - i for i in range(24)]
+                    squares.insert(12, FREE_SPACE_INDEX)
+                    data = encode_board(board_num, squares, table_size)
+                    self.assertEqual(len(data), size)
+                    self.assertEqual(decode_board(data), (board_num, squares))
+
+    def test_limits(self):
+        import struct
+
+        from .bingoCardGenerator import MAX_PHRASES, generate_board_indices
+        from .board_codec import encode_board
+
+        squares = [0] * 25
+        # Index 65535 would read back as Free Space
+        with self.assertRaises(ValueError):
+            encode_board(0, squares, MAX_PHRASES + 1)
+        with self.assertRaises(ValueError):
+            generate_board_indices(MAX_PHRASES + 1, 1)
+        with self.assertRaises(struct.error):
+            encode_board(2**32, squares, 48)
+
+
+class GameStoreConformance:
+    """
+    The behaviour every GameStore backend must share. Subclasses mix this
+    into a TestCase and provide make_store().
+    """
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def delete_game(self, game_id):
+        pass
+
+    def setUp(self):
+        from .bingoServer import create_game
+
+        self.store = self.make_store()
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.addCleanup(self.delete_game, self.game_id)
+        self.game = create_game(self.game_id, 4, [f"phrase {i}" for i in range(48)])
+        self.store.save_game(self.game_id, self.game, ttl=60)
+        self.board_uuids = list(self.game["board_assignments"])
+
+    def phrase_at(self, board_num, pos):
+        squares = self.game["board_assignments"][self.board_uuids[board_num]]["squares"]
+        return self.game["phrase_table"][squares[pos]]
+
+    def test_missing_game(self):
+        missing = f"missing-{os.urandom(4).hex()}"
+        self.assertIsNone(self.store.get_game(missing))
+        self.assertIsNone(self.store.get_board(missing, self.board_uuids[0]))
+        self.assertIsNone(self.store.get_version(missing))
+        self.assertIsNone(self.store.events_since(missing, 0))
+        self.assertEqual(self.store.record_called_phrase(missing, "phrase 1"), ("missing", None, [], None))
+        self.assertEqual(self.store.claim_board(missing, self.board_uuids[0], "Ann", "ann@x"), ("missing", None))
+        self.assertEqual(self.store.get_board_owners(missing, [0]), {})
+
+    def test_save_and_get(self):
+        game_data = self.store.get_game(self.game_id)
+        self.assertEqual(game_data["version"], 0)
+        self.assertEqual(game_data["phrase_table"], self.game["phrase_table"])
+        self.assertEqual(game_data["player_links"], self.game["player_links"])
+        self.assertEqual(list(game_data["board_assignments"]), self.board_uuids)
+        board = game_data["board_assignments"][self.board_uuids[1]]
+        self.assertEqual((board["board_num"], board["assigned"]), (1, False))
+        self.assertEqual(board["squares"], self.game["board_assignments"][self.board_uuids[1]]["squares"])
+
+        board, called, phrase_table, version = self.store.get_board(self.game_id, self.board_uuids[1])
+        self.assertEqual((board["board_num"], called, version), (1, [], 0))
+        self.assertIsNone(self.store.get_board(self.game_id, "no-such-board")[0])
+
+    def test_call_phrase(self):
+        phrase = self.phrase_at(0, 0)
+        status, total, new_wins, event = self.store.record_called_phrase(self.game_id, phrase)
+        self.assertEqual((status, total, new_wins), ("ok", 1, []))
+        self.assertEqual(event, {
+            "type": "phrase_called",
+            "phrase": phrase,
+            "phrase_id": self.game["phrase_table"].index(phrase),
+            "total_called": 1,
+            "seq": 1,
+        })
+        self.assertEqual(self.store.record_called_phrase(self.game_id, phrase), ("duplicate", 1, [], None))
+        self.assertEqual(self.store.record_called_phrase(self.game_id, "nope")[0], "invalid")
+        self.assertEqual(self.store.get_assignments(self.game_id)[:2], (1, [phrase]))
+        self.assertEqual(self.store.get_indexed_state(self.game_id)[:2], (1, [event["phrase_id"]]))
+
+    def test_call_phrases_batch(self):
+        first, second = self.phrase_at(0, 0), self.phrase_at(0, 1)
+        self.assertEqual(self.store.record_called_phrases(self.game_id, [first, "nope"])[:2], ("invalid", "nope"))
+        self.assertEqual(self.store.get_version(self.game_id), 0)
+
+        self.store.record_called_phrase(self.game_id, first)
+        status, total, _, event = self.store.record_called_phrases(self.game_id, [first, second, second])
+        self.assertEqual((status, total), ("ok", 2))
+        self.assertEqual((event["type"], event["phrases"], event["seq"]), ("phrases_called", [second], 2))
+        self.assertEqual(self.store.record_called_phrases(self.game_id, [first, second]), ("duplicate", 2, [], None))
+
+    def test_calls_find_wins_and_claims_are_verified(self):
+        row = [0, 1, 2, 3, 4]
+        board_uuid = self.board_uuids[0]
+        self.store.claim_board(self.game_id, board_uuid, "Ann", "ann@x")
+        self.assertEqual(
+            self.store.verify_and_record_win(self.game_id, board_uuid, "traditional", row, "t")[:2],
+            ("not_called", self.phrase_at(0, 0)),
+        )
+        wins = []
+        for pos in row:
+            wins += self.store.record_called_phrase(self.game_id, self.phrase_at(0, pos))[2]
+        self.assertIn((0, "traditional"), wins)
+
+        self.assertEqual(self.store.verify_and_record_win(self.game_id, board_uuid, "traditional", [0, 1], "t")[0],
+                         "bad_pattern")
+        self.assertEqual(self.store.verify_and_record_win(self.game_id, "no-such-board", "traditional", row, "t")[0],
+                         "invalid")
+        status, winner, event = self.store.verify_and_record_win(self.game_id, board_uuid, "traditional", row, "t")
+        self.assertEqual(status, "ok")
+        self.assertEqual((winner["player_name"], winner["pattern"]), ("Ann", "traditional"))
+        self.assertEqual((event["type"], event["board_num"], event["seq"]), ("player_won", 0, 7))
+        self.assertEqual(self.store.verify_and_record_win(self.game_id, board_uuid, "traditional", row, "t")[0],
+                         "duplicate")
+        self.assertEqual(self.store.get_game(self.game_id)["winners"], [winner])
+
+    def test_record_win(self):
+        winner = {"board_uuid": self.board_uuids[2], "player_name": "Bo", "pattern": "x", "timestamp": "t"}
+        status, event = self.store.record_win(self.game_id, winner)
+        self.assertEqual((status, event["board_num"], event["player_name"]), ("ok", 2, "Bo"))
+        self.assertEqual(self.store.record_win(self.game_id, winner), ("duplicate", None))
+        self.assertEqual(self.store.get_game(self.game_id)["winners"], [winner])
+
+    def test_claims(self):
+        status, event = self.store.claim_board(self.game_id, self.board_uuids[1], "Ann", "ann@x")
+        self.assertEqual((status, event["board_num"], event["player_name"]), ("ok", 1, "Ann"))
+        self.assertEqual(self.store.claim_board(self.game_id, self.board_uuids[1], "Bo", "bo@x"), ("taken", None))
+        self.assertEqual(self.store.claim_board(self.game_id, "no-such-board", "Bo", "bo@x"), ("invalid", None))
+
+        self.assertEqual(self.store.claim_boards(self.game_id, [("P", "p@x")] * 4), ("full", 3, None))
+        status, players, event = self.store.claim_boards(self.game_id, [("Bo", "bo@x"), ("Cy", "cy@x")])
+        self.assertEqual(status, "ok")
+        self.assertEqual([(p["board_num"], p["player_name"]) for p in players], [(0, "Bo"), (2, "Cy")])
+        self.assertEqual((event["type"], event["seq"]), ("players_joined", 2))
+
+        _, _, claims = self.store.get_assignments(self.game_id)
+        self.assertEqual(claims[self.board_uuids[1]]["player_email"], "ann@x")
+        self.assertIsNone(claims[self.board_uuids[3]])
+        self.assertEqual(self.store.get_board_owners(self.game_id, [1, 3, 9]), {
+            1: (self.board_uuids[1], claims[self.board_uuids[1]]),
+            3: (self.board_uuids[3], None),
+        })
+
+    def test_events_since(self):
+        self.store.claim_board(self.game_id, self.board_uuids[0], "Ann", "ann@x")
+        self.store.record_called_phrase(self.game_id, self.phrase_at(0, 0))
+        self.store.record_called_phrase(self.game_id, self.phrase_at(0, 1))
+        self.assertEqual([e["seq"] for e in self.store.events_since(self.game_id, 0)], [1, 2, 3])
+        self.assertEqual([e["type"] for e in self.store.events_since(self.game_id, 2)], ["phrase_called"])
+        self.assertEqual(self.store.events_since(self.game_id, 3), [])
+
+    def test_board_page(self):
+        self.store.claim_board(self.game_id, self.board_uuids[3], "Ann", "ann@x")
+        for pos in range(4):
+            self.store.record_called_phrase(self.game_id, self.phrase_at(0, pos))
+        for page in (self.store.get_board_page, async_to_sync(self.store.aget_board_page)):
+            version, total, _, boards = page(self.game_id, None, 1, 2)
+            self.assertEqual((version, total), (5, 4))
+            self.assertEqual([b["board_uuid"] for b in boards], self.board_uuids[1:3])
+            self.assertEqual([b["board_num"] for b in page(self.game_id, "claimed")[3]], [3])
+            self.assertEqual(page(self.game_id, "unclaimed")[1], 3)
+            near = {b["board_num"]: b for b in page(self.game_id, "near_win")[3]}
+            self.assertEqual(near[0]["to_win"], 1)
+            self.assertEqual(near[0]["marked"] & 0b11111, 0b1111)
+            self.assertEqual(page(self.game_id, None, 10, 5)[3], [])
+
+    def test_sync_and_async_reads_agree(self):
+        self.store.claim_board(self.game_id, self.board_uuids[1], "Ann", "ann@x")
+        self.store.record_called_phrase(self.game_id, self.phrase_at(1, 0))
+        missing = f"missing-{os.urandom(4).hex()}"
+        for name, args in (
+            ("get_game", ()),
+            ("get_overview", ()),
+            ("get_board", (self.board_uuids[1],)),
+            ("get_assignments", ()),
+            ("get_indexed_state", ()),
+            ("get_board_page", ("claimed", 0, 10)),
+            ("get_version", ()),
+            ("events_since", (0,)),
+            ("get_board_owners", ([0, 1],)),
+        ):
+            with self.subTest(name):
+                sync, asynchronous = getattr(self.store, name), async_to_sync(getattr(self.store, "a" + name))
+                self.assertIsNotNone(sync(self.game_id, *args))
+                self.assertEqual(sync(self.game_id, *args), asynchronous(self.game_id, *args))
+                self.assertEqual(sync(missing, *args), asynchronous(missing, *args))
+
+    def test_async_twins(self):
+        phrase = self.phrase_at(1, 0)
+        status, event = async_to_sync(self.store.aclaim_board)(self.game_id, self.board_uuids[1], "Ann", "ann@x")
+        self.assertEqual(status, "ok")
+        self.assertEqual(async_to_sync(self.store.arecord_called_phrase)(self.game_id, phrase)[:2], ("ok", 1))
+        board, called, _, version = async_to_sync(self.store.aget_board)(self.game_id, self.board_uuids[1])
+        self.assertEqual((board["player_name"], called, version), ("Ann", [phrase], 2))
+        game_data, called, claims = async_to_sync(self.store.aget_overview)(self.game_id)
+        self.assertEqual((game_data["version"], list(claims)), (2, [self.board_uuids[1]]))
+        self.assertEqual(async_to_sync(self.store.aget_version)(self.game_id), 2)
+        self.assertEqual(len(async_to_sync(self.store.aevents_since)(self.game_id, 0)), 2)
+
+    def test_async_mutations(self):
+        row = [0, 1, 2, 3, 4]
+        run = async_to_sync
+        status, detail, _, event = run(self.store.arecord_called_phrases)(
+            self.game_id, [self.phrase_at(0, pos) for pos in row])
+        self.assertEqual((status, detail, event["seq"]), ("ok", 5, 1))
+        status, players, event = run(self.store.aclaim_boards)(self.game_id, [("Ann", "ann@x")])
+        self.assertEqual((status, players[0]["board_num"], event["seq"]), ("ok", 0, 2))
+        status, winner, event = run(self.store.averify_and_record_win)(
+            self.game_id, self.board_uuids[0], "traditional", row, "t")
+        self.assertEqual((status, event["seq"]), ("ok", 3))
+        other = {"board_uuid": self.board_uuids[2], "player_name": "Bo", "pattern": "x", "timestamp": "t"}
+        self.assertEqual(run(self.store.arecord_win)(self.game_id, other)[0], "ok")
+        run(self.store.atouch_game)(self.game_id)
+        self.assertEqual(self.store.get_game(self.game_id)["winners"], [winner, other])
+
+        copy_id = f"test-{os.urandom(4).hex()}"
+        self.addCleanup(self.delete_game, copy_id)
+        run(self.store.asave_game)(copy_id, self.game, 60)
+        self.assertEqual(self.store.get_game(copy_id)["phrase_table"], self.game["phrase_table"])
+
+    def test_concurrent_mutations_are_atomic(self):
+        phrases = list(self.game["phrase_index"])
+
+        def call_all(offset):
+            return [
+                self.store.record_called_phrase(self.game_id, phrases[(i + offset) % len(phrases)])[0]
+                for i in range(len(phrases))
+            ]
+
+        def claim(i):
+            return self.store.claim_board(self.game_id, self.board_uuids[0], f"P{i}", f"p{i}@x")[0]
+
+        with ThreadPoolExecutor(8) as pool:
+            statuses = [s for result in pool.map(call_all, range(0, 48, 6)) for s in result]
+            claims = list(pool.map(claim, range(8)))
+        self.assertEqual(statuses.count("ok"), len(phrases))
+        self.assertEqual(claims.count("ok"), 1)
+        _, called, _ = self.store.get_assignments(self.game_id)
+        self.assertEqual(sorted(called), sorted(phrases))
+        self.assertEqual(self.store.get_version(self.game_id), len(phrases) + 1)
+
+
+class MemoryGameStoreTests(GameStoreConformance, SimpleTestCase):
+    def make_store(self):
+        from .memory_game_store import MemoryGameStore
+        return MemoryGameStore()
+
+
+class SQLiteGameStoreTests(GameStoreConformance, SimpleTestCase):
+    def make_store(self):
+        from .sqlite_game_store import SQLiteGameStore
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return SQLiteGameStore(os.path.join(tmp.name, "games.sqlite3"))
+
+
+@unittest.skipUnless(os.environ.get("REDIS_URL"), "needs REDIS_URL pointing at a Redis server")
+class RedisGameStoreTests(GameStoreConformance, TestCase):
+    # A TestCase: missing games are looked up in the ArchivedGame table
+
+    def make_store(self):
+        from .redis_game_store import RedisGameStore
+
+        return RedisGameStore()
+
+    def delete_game(self, game_id):
+        from .redis_game_store import _keys, _redis
+
+        _redis(game_id)[0].delete(*_keys(game_id))
+
+    def test_archive_and_rehydrate(self):
+        from .models import ArchivedGame
+        from .redis_game_store import _keys, _redis, archive_game
+
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        self.store.claim_board(self.game_id, self.board_uuids[0], "Ann", "ann@x")
+        before = self.store.get_game(self.game_id)
+        self.assertTrue(archive_game(self.game_id))
+        self.assertEqual(_redis(self.game_id)[0].exists(*_keys(self.game_id)), 0)
+        self.assertEqual(ArchivedGame.objects.get(game_id=self.game_id).version, before["version"])
+
+        # Any read brings it back
+        self.assertEqual(self.store.get_version(self.game_id), before["version"])
+        self.assertEqual(self.store.get_game(self.game_id), before)
+        self.assertFalse(ArchivedGame.objects.filter(game_id=self.game_id).exists())
+        self.assertEqual(self.store.record_called_phrase(self.game_id, "phrase 2")[0], "ok")
+
+    def cached_state_gone_stale(self):
+        # Caches the state, then changes the game as another worker would:
+        # this worker's cache still holds the old state
+        from .redis_game_store import _states, _subscribed
+
+        deadline = time.monotonic() + 5
+        async_to_sync(self.store.aget_assignments)(self.game_id)
+        while not _subscribed(self.game_id) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        async_to_sync(self.store.aget_assignments)(self.game_id)
+        stale = _states.peek(self.game_id)
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        _states.set(self.game_id, stale)
+        return stale
+
+    def test_published_version_invalidates_cached_state(self):
+        from .redis_game_store import _current, _published
+
+        stale = self.cached_state_gone_stale()
+        deadline = time.monotonic() + 5
+        while _published.peek(self.game_id) != stale["version"] + 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIs(_current(self.game_id, stale), False)
+        self.assertEqual(async_to_sync(self.store.aget_assignments)(self.game_id)[1], ["phrase 1"])
+
+    def test_evicted_published_version_is_checked(self):
+        from .redis_game_store import _current, _published
+
+        stale = self.cached_state_gone_stale()
+        time.sleep(0.2)
+        _published.pop(self.game_id)
+        self.assertIsNone(_current(self.game_id, stale))
+        self.assertEqual(async_to_sync(self.store.aget_assignments)(self.game_id)[1], ["phrase 1"])
+
+    def test_reads_keep_cached_state(self):
+        from .redis_game_store import _states
+
+        self.store.claim_board(self.game_id, self.board_uuids[0], "Ann", "ann@x")
+        async_to_sync(self.store.aget_assignments)(self.game_id)
+        self.assertIsNotNone(_states.peek(self.game_id))
+        self.assertEqual(async_to_sync(self.store.aget_board_owners)(self.game_id, [0])[0][0], self.board_uuids[0])
+        async_to_sync(self.store.atouch_game)(self.game_id)
+        self.assertIsNotNone(_states.peek(self.game_id))
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        self.assertIsNone(_states.peek(self.game_id))
+
+    def test_activity_extends_ttl(self):
+        from .game_store import GAME_TTL
+        from .redis_game_store import _key, _redis
+
+        meta_key = _key(self.game_id, "meta")
+        self.assertLessEqual(_redis(self.game_id)[0].ttl(meta_key), 60)
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        self.assertGreater(_redis(self.game_id)[0].ttl(meta_key), 60)
+
+        _redis(self.game_id)[0].expire(meta_key, 60)
+        self.store.touch_game(self.game_id)
+        self.assertGreater(_redis(self.game_id)[0].ttl(meta_key), GAME_TTL - 10)
+
+
+class GameStoreInterfaceTests(SimpleTestCase):
+    def test_incomplete_backend_cannot_be_created(self):
+        from .game_store import GameStore
+        from .redis_game_store import RedisGameStore
+
+        class Partial(GameStore):
+            get_game = staticmethod(lambda game_id: None)
+
+        with self.assertRaises(TypeError):
+            Partial()
+        self.assertFalse(RedisGameStore.__abstractmethods__)
+
+
+class HashRingTests(SimpleTestCase):
+    nodes = ["redis://a:6379/0", "redis://b:6379/0", "redis://c:6379/0"]
+    keys = [f"game-{i}" for i in range(3000)]
+
+    def test_spreads_keys_evenly(self):
+        ring = HashRing(self.nodes)
+        counts = {node: 0 for node in self.nodes}
+        for key in self.keys:
+            counts[ring.node_for(key)] += 1
+        for count in counts.values():
+            self.assertLess(abs(count - 1000), 250)
+
+    def test_adding_a_node_moves_only_its_share(self):
+        before, after = HashRing(self.nodes), HashRing(self.nodes + ["redis://d:6379/0"])
+        moved = [key for key in self.keys if before.node_for(key) != after.node_for(key)]
+        self.assertTrue({after.node_for(key) for key in moved} <= {"redis://d:6379/0"})
+        self.assertLess(abs(len(moved) - 750), 250)
+
+    def test_credentials_do_not_move_keys(self):
+        self.assertEqual(node_name("redis://:secret@a:6379/0"), node_name("rediss://a:6379"))
+        with_password = HashRing(["redis://:secret@a:6379/0", "redis://b:6379/0"])
+        without = HashRing(["redis://a:6379/0", "redis://b:6379/0"])
+        self.assertEqual([with_password.index_for(k) for k in self.keys], [without.index_for(k) for k in self.keys])
+
+    def test_channel_layer_groups_follow_games(self):
+        from .channel_layers import GameShardedChannelLayer, game_group
+
+        layer = GameShardedChannelLayer(hosts=self.nodes)
+        ring = HashRing(self.nodes)
+        for key in self.keys[:100]:
+            self.assertEqual(layer.consistent_hash(game_group(key)), ring.index_for(key))
+
+
+class RateLimitTests(SimpleTestCase):
+    limits = {"call_phrase": {"game": (10, 30), "board": (1, 2), "client": (2, 3)}}
+
+    def test_local_buckets_refill(self):
+        from .rate_limits import LocalBuckets
+
+        now = [0.0]
+        buckets = LocalBuckets(clock=lambda: now[0])
+        spec = [("game", 10, 30), ("board", 1, 2)]
+        self.assertIsNone(buckets.take(spec))
+        self.assertIsNone(buckets.take(spec))
+        self.assertEqual(buckets.take(spec), (1, 1.0))
+        # A rejected request takes no tokens from the other buckets
+        self.assertEqual(buckets._buckets.peek("game")[0], 28)
+        now[0] += 0.5
+        self.assertEqual(buckets.take(spec), (1, 0.5))
+        now[0] += 0.5
+        self.assertIsNone(buckets.take(spec))
+
+    def check(self, board, client="10.0.0.1"):
+        from . import rate_limits
+
+        return async_to_sync(rate_limits.acheck)("call_phrase", "g1", board=board, client=client)
+
+    def limited(self):
+        from . import rate_limits
+
+        async def is_board(game_id, board):
+            return board in ("b1", "b2", "b3")
+
+        return [
+            mock.patch.object(rate_limits, "LIMITS", self.limits),
+            mock.patch.object(rate_limits, "_local", rate_limits.LocalBuckets()),
+            mock.patch.object(rate_limits, "_is_board", is_board),
+            self.settings(BINGO_STORE_BACKEND="memory"),
+        ]
+
+    def test_acheck_names_the_exhausted_bucket(self):
+        from . import rate_limits
+
+        with contextlib.ExitStack() as stack:
+            for patch in self.limited():
+                stack.enter_context(patch)
+            self.assertIsNone(self.check("b1"))
+            self.assertIsNone(self.check("b1"))
+            self.assertEqual(self.check("b1")[0], "board")
+            self.assertIsNone(self.check("b2"))
+            self.assertEqual(self.check("b3")[0], "client")
+            self.assertIsNone(self.check("b3", client="10.0.0.2"))
+            with mock.patch.object(rate_limits, "ENABLED", False):
+                self.assertIsNone(self.check("b1"))
+
+    def test_unknown_board_gets_no_bucket(self):
+        from . import rate_limits
+
+        with contextlib.ExitStack() as stack:
+            for patch in self.limited():
+                stack.enter_context(patch)
+            for client in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+                self.assertIsNone(self.check("nope", client=client))
+            self.assertFalse(any(":board:" in key for key in rate_limits._local._buckets._data))
+
+    def test_client_ip(self):
+        from django.test import RequestFactory
+
+        from . import rate_limits
+
+        request = RequestFactory().post("/", REMOTE_ADDR="10.0.0.9", HTTP_X_FORWARDED_FOR="1.2.3.4, 5.6.7.8")
+        for proxies, expected in ((0, "10.0.0.9"), (1, "5.6.7.8"), (2, "1.2.3.4"), (3, "10.0.0.9")):
+            with self.subTest(proxies=proxies), mock.patch.object(rate_limits, "TRUSTED_PROXIES", proxies):
+                self.assertEqual(rate_limits.client_ip(request), expected)
+
+    def test_refund(self):
+        from .rate_limits import LocalBuckets
+
+        buckets = LocalBuckets(clock=lambda: 0.0)
+        spec = [("game", 1, 2)]
+        self.assertIsNone(buckets.take(spec))
+        self.assertIsNone(buckets.take(spec))
+        self.assertIsNotNone(buckets.take(spec))
+        self.assertIsNone(buckets.take(spec, cost=-1))
+        self.assertIsNone(buckets.take(spec))
+        # Never above the burst
+        for _ in range(3):
+            buckets.take(spec, cost=-1)
+        self.assertEqual(buckets._buckets.peek("game")[0], 2)
+
+    def test_duplicate_calls_are_not_charged(self):
+        from . import rate_limits, views
+        from .bingoServer import create_game
+        from .memory_game_store import MemoryGameStore
+
+        game_id = f"test-{os.urandom(4).hex()}"
+        store = MemoryGameStore()
+        store.save_game(game_id, create_game(game_id, 2, [f"phrase {i}" for i in range(48)]))
+        limits = {"call_phrase": {"game": (0.01, 2), "client": (0.01, 2)}}
+
+        def call(phrase):
+            return self.client.post(f"/bingo/games/{game_id}/call/", json.dumps({"phrase": phrase}),
+                                    content_type="application/json")
+
+        with mock.patch.object(rate_limits, "LIMITS", limits), \
+                mock.patch.object(rate_limits, "_local", rate_limits.LocalBuckets()), \
+                mock.patch.object(views, "store", store), \
+                override_settings(BINGO_STORE_BACKEND="memory",
+                                  CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}):
+            self.assertEqual(call("phrase 1").status_code, 200)
+            for _ in range(5):
+                self.assertEqual(call("phrase 1").json()["error"], "Already called")
+            self.assertEqual(call("phrase 2").status_code, 200)
+            response = call("phrase 3")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.json()["limit"], "game")
+            self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_claim_boards_is_limited(self):
+        from django.conf import settings
+
+        self.assertIn("claim_boards", settings.BINGO_RATE_LIMITS)
+
+    @unittest.skipUnless(os.environ.get("REDIS_URL"), "needs REDIS_URL pointing at a Redis server")
+    def test_redis_buckets(self):
+        from . import rate_limits
+        from .redis_game_store import _redis
+
+        game_id = f"test-{os.urandom(4).hex()}"
+        spec = [(rate_limits._bucket_key("call_phrase", game_id, "board", "b1"), 1, 2)]
+        self.addCleanup(lambda: _redis(game_id)[0].delete(spec[0][0]))
+        take = async_to_sync(rate_limits._redis_take)
+        self.assertIsNone(take(game_id, spec))
+        self.assertIsNone(take(game_id, spec))
+        index, wait = take(game_id, spec)
+        self.assertEqual(index, 0)
+        self.assertTrue(0 < wait <= 1)
+        self.assertLessEqual(_redis(game_id)[0].ttl(spec[0][0]), 3)
+
+    @unittest.skipUnless(os.environ.get("REDIS_URL"), "needs REDIS_URL pointing at a Redis server")
+    def test_redis_board_bucket_needs_a_board_of_the_game(self):
+        from . import rate_limits
+        from .redis_game_store import _key, _redis
+
+        game_id = f"test-{os.urandom(4).hex()}"
+        spec = [(rate_limits._bucket_key("call_phrase", game_id, "board", "b1"), 1, 2)]
+        client = _redis(game_id)[0]
+        self.addCleanup(lambda: client.delete(spec[0][0], _key(game_id, "boards")))
+        take = async_to_sync(rate_limits._redis_take)
+        for _ in range(3):
+            self.assertIsNone(take(game_id, spec, 0, "b1"))
+        self.assertFalse(client.exists(spec[0][0]))
+        client.hset(_key(game_id, "boards"), "b1", "{}")
+        self.assertIsNone(take(game_id, spec, 0, "b1"))
+        self.assertIsNone(take(game_id, spec, 0, "b1"))
+        self.assertEqual(take(game_id, spec, 0, "b1")[0], 0)
+        # A refund makes room for one more
+        self.assertIsNone(take(game_id, spec, 0, "b1", -1))
+        self.assertIsNone(take(game_id, spec, 0, "b1"))
+        self.assertEqual(take(game_id, spec, 0, "b1")[0], 0)
+
+
+class SerializerTests(SimpleTestCase):
+    value = {"phrase_table": ["caf\u00e9", "b"] * 50, "seed": 7, "nested": {"wins": [[0, 1], [2, 3]]}}
+
+    def test_round_trip(self):
+        from . import serializers
+
+        for fmt in serializers.FORMATS:
+            for compress_min in (0, 1):
+                with self.subTest(fmt=fmt, compress_min=compress_min):
+                    data = serializers.dumps(self.value, fmt=fmt, compress_min=compress_min)
+                    self.assertEqual(data[0] & ~serializers.COMPRESSED, serializers.FORMATS[fmt])
+                    self.assertEqual(serializers.loads(data), self.value)
+
+    def test_untagged_json(self):
+        from . import serializers
+
+        # Written before tagging, or by a Lua script
+        self.assertEqual(serializers.loads(json.dumps(self.value)), self.value)
+        self.assertEqual(serializers.loads(json.dumps(self.value).encode()), self.value)
+        self.assertEqual(serializers.loads(b"[1, 2]"), [1, 2])
+
+    def test_compress_min(self):
+        from . import serializers
+
+        size = len(serializers.dumps(self.value, fmt="msgpack", compress_min=0)) - 1
+        self.assertFalse(serializers.dumps(self.value, fmt="msgpack", compress_min=size + 1)[0] & serializers.COMPRESSED)
+        data = serializers.dumps(self.value, fmt="msgpack", compress_min=size)
+        self.assertTrue(data[0] & serializers.COMPRESSED)
+        self.assertLess(len(data), size)
+        # Kept as is when compression would not make it smaller
+        self.assertFalse(serializers.dumps("ab", fmt="json", compress_min=1)[0] & serializers.COMPRESSED)
+        with self.settings(BINGO_STORE_FORMAT="cbor", BINGO_STORE_COMPRESS_MIN=1):
+            self.assertEqual(serializers.dumps(self.value)[0], serializers.FORMATS["cbor"] | serializers.COMPRESSED)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class BatchEndpointTests(SimpleTestCase):
+    """The batch phrase call and the CSV board claim."""
+
+    def setUp(self):
+        from . import rate_limits, views
+        from .bingoServer import create_game
+        from .memory_game_store import MemoryGameStore
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.store = MemoryGameStore()
+        self.store.save_game(self.game_id, create_game(self.game_id, 3, [f"phrase {i}" for i in range(48)]))
+        for patch in (
+            mock.patch.object(views, "store", self.store),
+            mock.patch.object(views, "MAX_PLAYERS", 3),
+            mock.patch.object(rate_limits, "ENABLED", False),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def call(self, phrases):
+        return self.client.post(
+            f"/bingo/games/{self.game_id}/call-batch/", json.dumps({"phrases": phrases}), content_type="application/json",
+        )
+
+    def claim(self, text):
+        return self.client.post(f"/bingo/games/{self.game_id}/claim-boards/", text, content_type="text/csv")
+
+    def test_call_phrases(self):
+        response = self.call(["phrase 1", "phrase 2", "phrase 1"])
+        self.assertEqual(response.json(), {"success": True, "called": ["phrase 1", "phrase 2"], "total_called": 2})
+        # Already called phrases are skipped, and a batch of only those is rejected
+        self.assertEqual(self.call(["phrase 2", "phrase 3"]).json()["called"], ["phrase 3"])
+        response = self.call(["phrase 1", "phrase 3"])
+        self.assertEqual((response.status_code, response.json()["error"]), (400, "Already called"))
+
+    def test_unknown_phrase_rejects_the_batch(self):
+        response = self.call(["phrase 1", "nope"])
+        self.assertEqual((response.status_code, response.json()["error"]), (400, 'Invalid phrase "nope"'))
+        self.assertEqual(self.store.get_assignments(self.game_id)[1], [])
+        for phrases in ([], "phrase 1", [1]):
+            with self.subTest(phrases=phrases):
+                self.assertEqual(self.call(phrases).status_code, 400)
+
+    def test_claim_boards(self):
+        response = self.claim("Name,Email\nAnn,ann@x\n\n Bo , bo@x \n")
+        self.assertEqual(response.status_code, 200)
+        claims = self.store.get_assignments(self.game_id)[2]
+        self.assertEqual(
+            sorted((claim["player_name"], claim["player_email"]) for claim in claims.values() if claim),
+            [("Ann", "ann@x"), ("Bo", "bo@x")],
+        )
+        response = self.claim("Cy,cy@x\nDi,di@x\n")
+        self.assertEqual((response.status_code, response.json()["error"]), (409, "Only 1 unclaimed boards for 2 players"))
+
+    def test_bad_csv(self):
+        for text, error in (
+            ("Ann,ann@x\nBo\n", "Line 2: expected name,email"),
+            ("Ann,\n", "Line 1: expected name,email"),
+            ("name,email\n", "No players in CSV"),
+            ("a,a@x\nb,b@x\nc,c@x\nd,d@x\n", "At most 3 players per upload"),
+        ):
+            with self.subTest(text=text):
+                response = self.claim(text)
+                self.assertEqual((response.status_code, response.json()["error"]), (400, error))
+        response = self.claim(b"\xff\xfe")
+        self.assertEqual((response.status_code, response.json()["error"]), (400, "CSV must be UTF-8"))
+        self.assertFalse(any(self.store.get_assignments(self.game_id)[2].values()))
+
+
+class FragmentTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        from .bingoServer import create_game
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.game = create_game(self.game_id, 2, [f"phrase {i}" for i in range(48)])
+        self.board_uuid = next(iter(self.game["board_assignments"]))
+        self.addCleanup(cache.clear)
+
+    def render(self, game=None):
+        from . import fragments
+
+        game = game or self.game
+        squares = game["board_assignments"][self.board_uuid]["squares"]
+        with mock.patch.object(fragments, "render_to_string", wraps=fragments.render_to_string) as render:
+            html = async_to_sync(fragments.board_html)(self.game_id, self.board_uuid, squares, game["phrase_table"])
+        return html, render.call_count
+
+    def test_reused(self):
+        html, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn("phrase", html)
+        self.assertEqual(self.render(), (html, 0))
+
+    def test_layout_version(self):
+        from . import fragments
+
+        self.render()
+        with mock.patch.object(fragments, "LAYOUT_VERSION", fragments.LAYOUT_VERSION + 1):
+            self.assertEqual(self.render()[1], 1)
+            self.assertEqual(self.render()[1], 0)
+
+    def test_game_created_again(self):
+        from .bingoServer import create_game
+
+        html, _ = self.render()
+        game = create_game(self.game_id, 2, [f"other {i}" for i in range(48)])
+        game["board_assignments"] = {self.board_uuid: next(iter(game["board_assignments"].values()))}
+        other, renders = self.render(game)
+        self.assertEqual(renders, 1)
+        self.assertNotEqual(other, html)
+        self.assertIn("other", other)
+
+
+class AdminApiTests(SimpleTestCase):
+    def setUp(self):
+        from . import views
+        from .bingoServer import create_game
+        from .memory_game_store import MemoryGameStore
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.store = MemoryGameStore()
+        self.game = create_game(self.game_id, 5, [f"phrase {i}" for i in range(48)])
+        self.store.save_game(self.game_id, self.game)
+        self.boards = list(self.game["board_assignments"])
+        patch = mock.patch.object(views, "store", self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def boards_page(self, **params):
+        return self.client.get(f"/bingo/admin/{self.game_id}/boards/", params)
+
+    def test_summary(self):
+        self.store.claim_board(self.game_id, self.boards[0], "Ann", "ann@x")
+        self.store.record_called_phrase(self.game_id, "phrase 3")
+        data = self.client.get(f"/bingo/admin/{self.game_id}/summary/").json()
+        self.assertEqual((data["num_boards"], data["claimed"], data["phrases_called"]), (5, 1, ["phrase 3"]))
+        self.assertEqual(data["seq"], 2)
+
+    def test_paging(self):
+        pages, offset = [], 0
+        while offset is not None:
+            data = self.boards_page(offset=offset, limit=2).json()
+            self.assertEqual((data["total"], data["offset"]), (5, offset))
+            pages.append([board["board_num"] for board in data["boards"]])
+            offset = data["next_offset"]
+        self.assertEqual(pages, [[0, 1], [2, 3], [4]])
+        data = self.boards_page(offset=10).json()
+        self.assertEqual((data["boards"], data["next_offset"]), ([], None))
+        self.assertEqual(len(self.boards_page().json()["boards"][0]["phrases"]), 25)
+
+    def test_filters(self):
+        from .game_store import NEAR_WIN
+
+        self.store.claim_board(self.game_id, self.boards[1], "Ann", "ann@x")
+        squares = self.game["board_assignments"][self.boards[0]]["squares"]
+        # Four squares of the top row leave board 0 one square from a win
+        for i in squares[:4]:
+            self.store.record_called_phrase(self.game_id, self.game["phrase_table"][i])
+
+        def nums(status):
+            return [board["board_num"] for board in self.boards_page(filter=status).json()["boards"]]
+
+        self.assertEqual(nums("claimed"), [1])
+        self.assertEqual(nums("unclaimed"), [0, 2, 3, 4])
+        self.assertIn(0, nums("near_win"))
+        for board in self.boards_page(filter="near_win").json()["boards"]:
+            self.assertTrue(0 < board["to_win"] <= NEAR_WIN)
+        self.assertEqual(self.boards_page(filter="claimed").json()["boards"][0]["player_name"], "Ann")
+
+    def test_bad_input(self):
+        for params in (
+            {"filter": "nope"}, {"offset": "x"}, {"offset": "-1"}, {"offset": "\u00b2"},
+            {"limit": "0"}, {"limit": "201"}, {"limit": ""},
+        ):
+            with self.subTest(params=params):
+                response = self.boards_page(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_missing_game(self):
+        for url in ("/bingo/admin/nope/summary/", "/bingo/admin/nope/boards/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CreateGameViewTests(SimpleTestCase):
+    def post(self, phrases, num_players="5"):
+        from . import views
+        from .memory_game_store import MemoryGameStore
+
+        with mock.patch.object(views, "store", MemoryGameStore()):
+            return self.client.post("/bingo/create/", {"phrases": "\n".join(phrases), "num_players": num_players})
+
+    def test_creates_game(self):
+        response = self.post([f"phrase {i}" for i in range(48)])
+        self.assertEqual(response.status_code, 302)
+
+    def test_repeated_phrases_count_once(self):
+        response = self.post([f"phrase {i % 47}" for i in range(60)] + ["Free Space"])
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "Need at least 48 different phrases. You provided 47.", status_code=400)
+
+    def test_bad_num_players(self):
+        phrases = [f"phrase {i}" for i in range(48)]
+        for num_players in ("0", "x"):
+            with self.subTest(num_players=num_players):
+                self.assertEqual(self.post(phrases, num_players).status_code, 400)
+
+
+class GameStateViewTests(SimpleTestCase):
+    """The polling endpoint: ETag revalidation and ?since= deltas from the event log."""
+
+    def setUp(self):
+        from . import memory_game_store, views
+        from .bingoServer import create_game
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        # A short log, so old enough since values fall off it
+        with mock.patch.object(memory_game_store, "EVENT_LOG_LENGTH", 2):
+            self.store = memory_game_store.MemoryGameStore()
+            game = create_game(self.game_id, 2, [f"phrase {i}" for i in range(48)])
+            self.store.save_game(self.game_id, game)
+        self.boards = list(game["board_assignments"])
+        patch = mock.patch.object(views, "store", self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.url = f"/bingo/games/{self.game_id}/state/"
+
+    def test_etag(self):
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], '"1"')
+        self.assertEqual(response.json()["phrases_called"], ["phrase 1"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"1"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], '"1"')
+
+        self.store.record_called_phrase(self.game_id, "phrase 2")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"2"')
+        self.assertEqual(response.json()["phrases_called"], ["phrase 1", "phrase 2"])
+
+    def test_since_in_the_event_log(self):
+        self.store.record_called_phrase(self.game_id, "phrase 1")
+        self.store.record_called_phrase(self.game_id, "phrase 2")
+        self.store.claim_board(self.game_id, self.boards[0], "Ann", "ann@example.com")
+        data = self.client.get(self.url, {"since": 1}).json()
+        self.assertEqual(data["since"], 1)
+        self.assertEqual(data["seq"], 3)
+        self.assertEqual(data["phrases_called"], ["phrase 2"])
+        self.assertEqual(data["board_assignments"], {
+            self.boards[0]: {"assigned": True, "player_name": "Ann", "player_email": "ann@example.com"},
+        })
+
+    def test_since_older_than_the_event_log(self):
+        for i in range(1, 5):
+            self.store.record_called_phrase(self.game_id, f"phrase {i}")
+        data = self.client.get(self.url, {"since": 1}).json()
+        self.assertNotIn("since", data)
+        self.assertEqual(data["seq"], 4)
+        self.assertEqual(data["phrases_called"], [f"phrase {i}" for i in range(1, 5)])
+        self.assertEqual(set(data["board_assignments"]), set(self.boards))
+
+    def test_bad_since(self):
+        for since in ("x", "-1", "\u00b2"):
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get(self.url, {"since": since}).status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class OutboxTests(SimpleTestCase):
+    """A socket that falls behind gets one snapshot instead of every event, and is closed if it stays stuck."""
+
+    def setUp(self):
+        from . import consumers
+        from .bingoServer import create_game
+        from .memory_game_store import MemoryGameStore
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.store = MemoryGameStore()
+        self.phrases = [f"phrase {i}" for i in range(48)]
+        self.store.save_game(self.game_id, create_game(self.game_id, 2, self.phrases))
+        for patch in (
+            mock.patch.object(consumers, "store", self.store),
+            mock.patch.object(consumers, "OUTBOX_SIZE", 3),
+            mock.patch.object(consumers, "OUTBOX_WINDOW", 2),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def connect(self):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+
+        from .routing import websocket_urlpatterns
+
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/bingo/{self.game_id}/?ack=1")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def call(self, phrase):
+        from .views import _broadcast
+
+        event = self.store.record_called_phrase(self.game_id, phrase)[3]
+        await _broadcast(self.game_id, event)
+        return event["seq"]
+
+    def test_out_of_order_events_are_sent_in_order(self):
+        from .views import _broadcast
+
+        async def run():
+            communicator = await self.connect()
+            first, second = (self.store.record_called_phrase(self.game_id, phrase)[3] for phrase in self.phrases[:2])
+            await _broadcast(self.game_id, second)
+            await _broadcast(self.game_id, first)
+            frames = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertEqual([frame["seq"] for frame in frames], [first["seq"], second["seq"]])
+            self.assertEqual([frame["phrase"] for frame in frames], self.phrases[:2])
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_missing_event_is_read_from_the_log(self):
+        from . import consumers
+        from .views import _broadcast
+
+        async def run():
+            communicator = await self.connect()
+            first, second = (self.store.record_called_phrase(self.game_id, phrase)[3] for phrase in self.phrases[:2])
+            await _broadcast(self.game_id, second)
+            frames = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertEqual([frame["seq"] for frame in frames], [first["seq"], second["seq"]])
+            # The late broadcast is a duplicate
+            await _broadcast(self.game_id, first)
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        with mock.patch.object(consumers, "GAP_WAIT", 0):
+            async_to_sync(run)()
+
+    def test_consumer_state_without_connect(self):
+        # As benchmarks/bench_fanout.py drives consumers
+        from . import frames
+        from .consumers import BingoGameConsumer
+
+        sent = []
+
+        async def send(message):
+            sent.append(message["text"])
+
+        async def run():
+            consumer = BingoGameConsumer()
+            consumer.base_send = send
+            consumer.init_state()
+            consumer.writer = asyncio.create_task(consumer.write())
+            event = {"type": "phrase_called", "phrase": "phrase 1", "phrase_id": 1, "total_called": 1, "seq": 1}
+            await consumer.phrase_called({"type": "phrase_called", "seq": 1, **frames.encode_all(event)})
+            while consumer.outbox:
+                await asyncio.sleep(0)
+            consumer.writer.cancel()
+
+        async_to_sync(run)()
+        self.assertEqual([json.loads(text)["seq"] for text in sent], [1])
+
+    def test_metrics_do_not_name_games(self):
+        # /metrics is public and a game id is the game's only credential
+        from . import metrics
+
+        async def run():
+            communicator = await self.connect()
+            await self.call(self.phrases[0])
+            await communicator.receive_json_from()
+            exposition = metrics.render()
+            self.assertIn("bingo_websocket_connections", exposition)
+            self.assertNotIn(self.game_id, exposition)
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_overflow_is_coalesced_into_a_snapshot(self):
+        async def run():
+            communicator = await self.connect()
+            seqs = [await self.call(phrase) for phrase in self.phrases[:10]]
+            first = [await communicator.receive_json_from() for _ in range(2)]
+            self.assertEqual([frame["seq"] for frame in first], seqs[:2])
+            # The window is full until the client acknowledges
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.send_json_to({"type": "ack", "seq": seqs[1]})
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot["type"], "snapshot")
+            self.assertEqual(snapshot["seq"], seqs[-1])
+            self.assertEqual(snapshot["phrases_called"], self.phrases[:10])
+            await communicator.send_json_to({"type": "ack", "seq": seqs[-1]})
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_stuck_client_is_closed_with_resume_hint(self):
+        from . import consumers
+
+        async def run():
+            communicator = await self.connect()
+            seqs = [await self.call(phrase) for phrase in self.phrases[:3]]
+            for _ in range(2):
+                await communicator.receive_json_from()
+            await communicator.send_json_to({"type": "ack", "seq": seqs[0]})
+            await self.call(self.phrases[3])
+            with mock.patch.object(consumers, "OUTBOX_STALL_TIMEOUT", 0):
+                await self.call(self.phrases[4])
+                # The one frame the ack let through, then the close
+                self.assertEqual((await communicator.receive_json_from())["seq"], seqs[2])
+                close = await communicator.receive_output()
+            self.assertEqual(close["type"], "websocket.close")
+            self.assertEqual(close["code"], consumers.STALLED)
+            self.assertEqual(close["reason"], f"last_seq={seqs[0]}")
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class SubprotocolTests(SimpleTestCase):
+    """Sockets get JSON text frames unless they offer a binary subprotocol."""
+
+    decoders = {
+        "bingo.msgpack": lambda data: __import__("msgpack").unpackb(data),
+        "bingo.cbor": lambda data: __import__("cbor2").loads(data),
+    }
+
+    def setUp(self):
+        from . import consumers, memory_game_store
+
+        self.store = memory_game_store.MemoryGameStore()
+        patch = mock.patch.object(consumers, "store", self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.new_game()
+
+    def new_game(self):
+        from . import memory_game_store
+        from .bingoServer import create_game
+
+        self.game_id = f"test-{os.urandom(4).hex()}"
+        self.game = create_game(self.game_id, 2, [f"phrase {i}" for i in range(48)])
+        # A short log, so a reconnect from seq 0 gets a snapshot
+        with mock.patch.object(memory_game_store, "EVENT_LOG_LENGTH", 2):
+            self.store.save_game(self.game_id, self.game)
+        self.board_uuid = next(iter(self.game["board_assignments"]))
+
+    async def connect(self, subprotocols, query=""):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+
+        from .routing import websocket_urlpatterns
+
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/bingo/{self.game_id}/{query}", subprotocols=subprotocols,
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    async def broadcast(self):
+        from .views import _broadcast
+
+        for phrase in ("phrase 5", "phrase 6"):
+            await _broadcast(self.game_id, self.store.record_called_phrase(self.game_id, phrase)[3])
+        await _broadcast(self.game_id, self.store.claim_board(self.game_id, self.board_uuid, "Ann", "ann@x")[1])
+
+    def test_binary_frames(self):
+        for name, decode in self.decoders.items():
+            with self.subTest(subprotocol=name):
+                self.new_game()
+                board_num = self.game["board_assignments"][self.board_uuid]["board_num"]
+
+                async def run():
+                    communicator, subprotocol = await self.connect(["bingo.unknown", name])
+                    self.assertEqual(subprotocol, name)
+                    seq = self.store.get_version(self.game_id)
+                    await self.broadcast()
+                    frames = [decode(await communicator.receive_from()) for _ in range(3)]
+                    await communicator.disconnect()
+                    return seq, frames
+
+                seq, frames = async_to_sync(run)()
+                self.assertEqual(frames, [
+                    [1, seq + 1, 5, seq + 1],
+                    [1, seq + 2, 6, seq + 2],
+                    [2, seq + 3, board_num, "Ann", "ann@x"],
+                ])
+
+    def test_binary_snapshot(self):
+        for i in range(4):
+            self.store.record_called_phrase(self.game_id, f"phrase {i}")
+
+        async def run():
+            communicator, _ = await self.connect(["bingo.cbor"], "?last_seq=0")
+            frame = self.decoders["bingo.cbor"](await communicator.receive_from())
+            await communicator.disconnect()
+            return frame
+
+        self.assertEqual(async_to_sync(run)(), [0, 4, [0, 1, 2, 3], []])
+
+    def test_json_without_a_known_subprotocol(self):
+        for subprotocols in (None, ["bingo.unknown"]):
+            with self.subTest(subprotocols=subprotocols):
+                self.new_game()
+
+                async def run():
+                    communicator, subprotocol = await self.connect(subprotocols)
+                    self.assertIsNone(subprotocol)
+                    await self.broadcast()
+                    events = [await communicator.receive_json_from() for _ in range(3)]
+                    await communicator.disconnect()
+                    return events
+
+                events = async_to_sync(run)()
+                self.assertEqual([event["type"] for event in events], ["phrase_called", "phrase_called", "player_joined"])
+                self.assertEqual(events[0]["phrase"], "phrase 5")
+
+    def test_broadcast_encodes_once_per_format(self):
+        from . import frames
+
+        async def run():
+            sockets = [
+                (await self.connect(subprotocols))[0]
+                for subprotocols in (None, None, ["bingo.msgpack"], ["bingo.msgpack"], ["bingo.cbor"], ["bingo.cbor"])
+            ]
+            with mock.patch.object(frames, "encode", wraps=frames.encode) as encode:
+                await self.broadcast()
+                for communicator in sockets:
+                    for _ in range(3):
+                        await communicator.receive_from()
+            for communicator in sockets:
+                await communicator.disconnect()
+            return encode.call_args_list
+
+        calls = async_to_sync(run)()
+        # Three events, each encoded once per format however many sockets get it
+        self.assertEqual(sorted(fmt for (_, fmt), _ in calls), ["cbor"] * 3 + ["msgpack"] * 3 + ["text"] * 3)
+
+    def test_unparseable_last_seq_is_ignored(self):
+        async def run():
+            communicator, _ = await self.connect(None, "?last_seq=%C2%B2")
+            await self.broadcast()
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return event
+
+        self.assertEqual(async_to_sync(run)()["phrase"], "phrase 5")
+
+    def test_compact(self):
+        from . import frames
+
+        self.assertEqual(frames.compact({"type": "player_won", "seq": 9, "board_num": 1, "player_name": "Ann", "pattern": "x"}),
+                         [frames.PLAYER_WON, 9, 1, "Ann", "x"])
+        self.assertEqual(frames.compact({"type": "phrases_called", "seq": 3, "phrase_ids": [4, 5], "total_called": 7}),
+                         [frames.PHRASES_CALLED, 3, [4, 5], 7])
+        self.assertEqual(frames.compact({"type": "players_joined", "seq": 4, "players": [
+            {"board_num": 0, "player_name": "Bo", "player_email": "bo@x"},
+        ]}), [frames.PLAYERS_JOINED, 4, [[0, "Bo", "bo@x"]]])
+        with self.assertRaises(ValueError):
+            frames.compact({"type": "nope", "seq": 1})
+
+
+@unittest.skipUnless(
+    len(parse_urls(os.environ.get("REDIS_URLS"))) >= 2,
+    "needs REDIS_URLS listing at least two Redis nodes",
+)
+class RedisShardingTests(TestCase):
+    """Games stay reachable while nodes are added, and rebalance_games moves them into place."""
+
+    def setUp(self):
+        from . import redis_game_store
+
+        self.store = redis_game_store
+        self.urls = parse_urls(os.environ["REDIS_URLS"])
+        self.game_ids = [f"test-{os.urandom(4).hex()}" for _ in range(12)]
+        for game_id in self.game_ids:
+            self.addCleanup(self.delete, game_id)
+
+    def delete(self, game_id):
+        for client, _ in self.store._all_redis():
+            client.delete(*self.store._keys(game_id), *self.store._untagged_keys(game_id))
+
+    def save_all(self):
+        from .bingoServer import create_game
+
+        for game_id in self.game_ids:
+            self.store.save_game(game_id, create_game(game_id, 2, [f"phrase {i}" for i in range(48)]), ttl=60)
+            self.store.claim_board(game_id, self.store.get_game(game_id)["player_links"][0].rsplit("/", 1)[1],
+                                   "Ann", "ann@x")
+
+    def test_adding_a_node(self):
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls[:1])):
+            self.save_all()
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls)):
+            moving = [g for g in self.game_ids if self.store._shards().node_for(g) != self.urls[0]]
+            self.assertTrue(moving)
+            # Found and moved on first access
+            self.assertEqual(self.store.get_version(moving[0]), 1)
+            moves = self.store.rebalance_games()
+            self.assertEqual(sorted(g for g, _, _ in moves if g in self.game_ids), sorted(moving[1:]))
+            for game_id in self.game_ids:
+                self.assertTrue(self.store._redis(game_id)[0].exists(self.store._key(game_id, "meta")))
+                self.assertEqual(self.store.get_version(game_id), 1)
+            self.assertEqual(self.store.rebalance_games(dry_run=True), [])
+
+    def test_move_keeps_a_newer_copy_on_the_node(self):
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls[:1])):
+            self.save_all()
+            source = self.store._redis(self.game_ids[0])[0]
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls)):
+            game_id = next(g for g in self.game_ids if self.store._shards().node_for(g) != self.urls[0])
+            stale = [(key, source.dump(key), source.pttl(key)) for key in self.store._keys(game_id)]
+            # Moved on access, then changed on its new node
+            self.assertEqual(self.store.record_called_phrase(game_id, "phrase 1")[0], "ok")
+            # A second mover still holding the old copy
+            for key, dump, pttl in stale:
+                if dump is not None:
+                    source.restore(key, max(pttl, 0), dump)
+            self.assertTrue(self.store._move_game(game_id, source))
+            self.assertEqual(self.store.get_version(game_id), 2)
+            self.assertFalse(source.exists(self.store._key(game_id, "meta")))
+
+    def test_legacy_migration_keeps_a_newer_copy(self):
+        from .bingoServer import create_game
+
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls)):
+            source = self.store._all_redis()[0][0]
+            for node, game_id in (("same", next(g for g in self.game_ids if self.store._redis(g)[0] is source)),
+                                  ("other", next(g for g in self.game_ids if self.store._redis(g)[0] is not source))):
+                with self.subTest(node=node):
+                    self.addCleanup(source.delete, self.store._blob_key(game_id))
+                    blob = json.dumps(create_game(game_id, 2, [f"phrase {i}" for i in range(48)]))
+                    source.set(self.store._blob_key(game_id), blob, ex=60)
+                    self.assertEqual(self.store.record_called_phrase(game_id, "phrase 1")[0], "ok")
+                    self.assertFalse(source.exists(self.store._blob_key(game_id)))
+                    # A second migrator still holding the old blob
+                    source.set(self.store._blob_key(game_id), blob, ex=60)
+                    self.assertTrue(self.store._migrate_legacy(game_id, source))
+                    self.assertEqual(self.store.get_game(game_id)["phrases_called"], ["phrase 1"])
+                    self.assertFalse(source.exists(self.store._blob_key(game_id)))
+
+    def test_untagged_keys_are_moved(self):
+        with mock.patch.object(self.store, "_ring", HashRing(self.urls[:1])):
+            self.save_all()
+            client = self.store._redis(self.game_ids[0])[0]
+            for game_id in self.game_ids[:2]:
+                for key, untagged in zip(self.store._keys(game_id), self.store._untagged_keys(game_id)):
+                    if client.exists(key):
+                        client.rename(key, untagged)
+            self.assertEqual(self.store.get_version(self.game_ids[0]), 1)
+            self.assertEqual([g for g, _, _ in self.store.rebalance_games()], [self.game_ids[1]])
+            self.assertFalse(client.exists(self.store._untagged_keys(self.game_ids[1])[0]))
@@ -6,8 +6,12 @@ app_name = 'bingo'
 urlpatterns = [
     path('create/', views.CreateGameView.as_view(), name='create_game'),
     path('admin/<str:game_id>/', views.GameAdminView.as_view(), name='game_admin'),
+    path('admin/<str:game_id>/summary/', views.admin_summary, name='admin_summary'),
+    path('admin/<str:game_id>/boards/', views.admin_boards, name='admin_boards'),
     path('games/<str:game_id>/state/', views.get_game_state, name='game_state'),  # ADD THIS
     path('games/<str:game_id>/call/', views.call_phrase, name='call_phrase'),
+    path('games/<str:game_id>/call-batch/', views.call_phrases, name='call_phrases'),
+    path('games/<str:game_id>/claim-boards/', views.claim_boards, name='claim_boards'),
     path('games/<str:game_id>/claim-win/', views.claim_win, name='claim_win'),
     path('games/<str:game_id>/<str:board_uuid>/', views.BoardView.as_view(), name='board_view'),
     path("healthz", views.healthz, name="healthz"),
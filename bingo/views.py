@@ -1,66 +1,95 @@
+import csv
+import io
 import json
+import math
+import time
 import uuid
 from django.http import JsonResponse
 from django.views import View
 # from django.core.cache import cache
-from .redis_game_store import get_game, save_game, touch_game   
+from .game_store import store
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from .bingoServer import create_game
+from .bingoServer import FREE_SPACE, create_game
+from .bingoCardGenerator import MAX_PHRASES
+from .board_codec import board_grid
+from . import fragments, frames, metrics, rate_limits
+from .channel_layers import game_group
 from datetime import datetime
 
+MAX_PLAYERS = 10000
+
 class CreateGameView(View):
     def get(self, request):
         # Show the creation form
         return render(request, 'bingo/create_game.html')
     
     def post(self, request):
-        # Get phrases from form
+        # Get phrases from form, each distinct phrase once as create_game
+        # keeps them
         phrases_raw = request.POST.get('phrases', '')
-        phrases = [p.strip() for p in phrases_raw.split('\n') if p.strip()]
+        phrases = list(dict.fromkeys(
+            p.strip() for p in phrases_raw.split('\n') if p.strip() and p.strip() != FREE_SPACE
+        ))
         
-        num_players = int(request.POST.get('num_players', 5))
+        try:
+            num_players = int(request.POST.get('num_players', 5))
+        except ValueError:
+            return self.error(request, 'Number of players must be a whole number.', phrases_raw, '')
         
         # SERVER-SIDE VALIDATION
-        if num_players < 1 or num_players > 256:
-            return render(request, 'bingo/create_game.html', {
-                'error': f'Number of players must be between 1 and 256. You requested {num_players}.',
-                'phrases': phrases_raw,
-                'num_players': num_players
-            })
+        if num_players < 1 or num_players > MAX_PLAYERS:
+            return self.error(
+                request, f'Number of players must be between 1 and {MAX_PLAYERS}. You requested {num_players}.',
+                phrases_raw, num_players,
+            )
         
         # Validate phrases
         if len(phrases) < 48:
-            return render(request, 'bingo/create_game.html', {
-                'error': f'Need at least 48 phrases. You provided {len(phrases)}.',
-                'phrases': phrases_raw,
-                'num_players': num_players
-            })
+            return self.error(
+                request, f'Need at least 48 different phrases. You provided {len(phrases)}.',
+                phrases_raw, num_players,
+            )
+        if len(phrases) > MAX_PHRASES:
+            return self.error(
+                request, f'At most {MAX_PHRASES} different phrases. You provided {len(phrases)}.',
+                phrases_raw, num_players,
+            )
         
         game_id = str(uuid.uuid4())
         game_data = create_game(game_id, num_players, phrases)
         
         # Store in cache (1 hour timeout)
-        save_game(game_id, game_data)
+        store.save_game(game_id, game_data)
         
         # Redirect to admin dashboard (not render)
         from django.shortcuts import redirect
         return redirect('bingo:game_admin', game_id=game_id)
 
+    def error(self, request, error, phrases_raw, num_players):
+        # The form again, with what was entered
+        return render(request, 'bingo/create_game.html', {
+            'error': error,
+            'phrases': phrases_raw,
+            'num_players': num_players
+        }, status=400)
+
 
 class BoardView(View):
-    def get(self, request, game_id, board_uuid):
-        # Retrieve game data
-        game_data = get_game(game_id)
+    async def get(self, request, game_id, board_uuid):
+        # Retrieve just this board and the called phrases
+        board_state = await store.aget_board(game_id, board_uuid)
         
-        if not game_data:
+        if not board_state:
             return render(request, 'bingo/error.html', {
                 'error': 'Game not found or expired.'
             })
         
         # Get board assignment
-        board_assignment = game_data['board_assignments'].get(board_uuid)
+        board_assignment, phrases_called, phrase_table, version = board_state
         
         if not board_assignment:
             return render(request, 'bingo/error.html', {
@@ -70,36 +99,21 @@ class BoardView(View):
         # Check if board is already assigned
         if board_assignment['assigned']:
             # Already claimed - show the board
-            # Build columns for template
-            columns = []
-            for col in range(5):
-                column_squares = []
-                for row in range(5):
-                    column_squares.append({
-                        'row': row,
-                        'col': col,
-                        'phrase': board_assignment['board_data'][row][col]
-                    })
-                columns.append(column_squares)
-            
-            return render(request, 'bingo/game_board.html', {
-                'game_id': game_id,
-                'board_uuid': board_uuid,
-                'columns': columns,
-                'player_name': board_assignment.get('player_name', 'Anonymous'),
-                'player_email': board_assignment.get('player_email', ''),
-                'phrases_called': (game_data.get('phrases_called', [])),  # Add this
-    })
+            return await self.render_board(
+                request, game_id, board_uuid, board_assignment['squares'], phrase_table,
+                board_assignment.get('player_name', 'Anonymous'), board_assignment.get('player_email', ''),
+                phrases_called, version,
+            )
         else:
             # Not claimed yet - show registration form
             return render(request, 'bingo/claim_board.html', {
                 'game_id': game_id,
                 'board_uuid': board_uuid,
-                'phrases_called': (game_data.get('phrases_called', [])),  # Add this
+                'phrases_called': phrases_called,
 
             })
     
-    def post(self, request, game_id, board_uuid):
+    async def post(self, request, game_id, board_uuid):
         # Get player info from form
         player_email = request.POST.get('player_email', '').strip()
         player_name = request.POST.get('player_name', '').strip()
@@ -112,16 +126,16 @@ class BoardView(View):
                 'error': 'Both email and display name are required.'
             })
         
-        # Retrieve game data
-        game_data = get_game(game_id)
+        # Retrieve just this board and the called phrases
+        board_state = await store.aget_board(game_id, board_uuid)
         
-        if not game_data:
+        if not board_state:
             return render(request, 'bingo/error.html', {
                 'error': 'Game not found or expired.'
             })
         
         # Get board assignment
-        board_assignment = game_data['board_assignments'].get(board_uuid)
+        board_assignment, phrases_called, phrase_table, version = board_state
         
         if not board_assignment:
             return render(request, 'bingo/error.html', {
@@ -134,216 +148,485 @@ class BoardView(View):
                 'error': 'This board has already been claimed.'
             })
         
-       # Claim the board
-        board_assignment['assigned'] = True
-        board_assignment['player_email'] = player_email
-        board_assignment['player_name'] = player_name
-        board_assignment['player_id'] = player_email
-        
-        # Update cache
-        save_game(game_id, game_data)
+        # Claim the board atomically; a concurrent claim may have won the race
+        status, event = await store.aclaim_board(game_id, board_uuid, player_name, player_email)
+        if status != 'ok':
+            return render(request, 'bingo/error.html', {
+                'error': 'This board has already been claimed.'
+            })
         
         # BROADCAST VIA WEBSOCKET
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'bingo_game_{game_id}',
-            {
-                'type': 'player_joined',
-                'board_uuid': board_uuid,
-                'player_name': player_name,
-                'player_email': player_email
-            }
-        )
+        await _broadcast(game_id, event)
         
-        # Build columns for template
-        columns = []
-        for col in range(5):
-            column_squares = []
-            for row in range(5):
-                column_squares.append({
-                    'row': row,
-                    'col': col,
-                    'phrase': board_assignment['board_data'][row][col]
-                })
-            columns.append(column_squares)
-        
-        # Show the board
+        # Show the board. Replay from the read above so the page also sees
+        # this claim and anything called since
+        return await self.render_board(
+            request, game_id, board_uuid, board_assignment['squares'], phrase_table,
+            player_name, player_email, phrases_called, version,
+        )
+    
+    async def render_board(self, request, game_id, board_uuid, squares, phrase_table,
+                           player_name, player_email, phrases_called, version):
+        # The grid is a cached fragment; only the player and called phrases vary
         return render(request, 'bingo/game_board.html', {
             'game_id': game_id,
             'board_uuid': board_uuid,
-            'columns': columns,
+            'board_html': await fragments.board_html(game_id, board_uuid, squares, phrase_table),
             'player_name': player_name,
             'player_email': player_email,
-            'phrases_called': (game_data.get('phrases_called', []))
+            'phrases_called': phrases_called,
+            'seq': version,
         })
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+
+async def _broadcast(game_id, event):
+    # Events come from the store's log and carry their seq. The frame is
+    # encoded once per wire format here and every consumer forwards the one
+    # its socket negotiated as is
+    message = {'type': event['type'], 'seq': event['seq'], **frames.encode_all(event)}
+    start = time.perf_counter()
+    await get_channel_layer().group_send(game_group(game_id), message)
+    metrics.BROADCAST_SECONDS.observe(time.perf_counter() - start, event['type'])
+
+
+def board_states(claims):
+    """Per-board assignment summary sent to polling and reconnecting clients."""
+    return {
+        uuid: {
+            'assigned': claim is not None,
+            'player_name': (claim or {}).get('player_name'),
+            'player_email': (claim or {}).get('player_email')
+        }
+        for uuid, claim in claims.items()
+    }
+
+
+async def _throttled(request, view, game_id, board_uuid=None):
+    # A 429 if one of view's rate limits is exhausted; checked before the
+    # game is touched, so throttled requests cost one Redis round trip. The
+    # board bucket is only taken for a board of the game
+    limited = await rate_limits.acheck(
+        view, game_id, board=board_uuid if isinstance(board_uuid, str) else None,
+        client=rate_limits.client_ip(request),
+    )
+    if limited is None:
+        return None
+    scope, wait = limited
+    retry_after = max(1, math.ceil(wait))
+    response = JsonResponse({
+        'success': False,
+        'error': f'Too many requests, try again in {retry_after} s',
+        'limit': scope,
+        'retry_after': retry_after,
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+async def _refund(request, view, game_id, board_uuid=None):
+    # Gives back what _throttled took, for a request that changed nothing
+    await rate_limits.arefund(
+        view, game_id, board=board_uuid if isinstance(board_uuid, str) else None,
+        client=rate_limits.client_ip(request),
+    )
+
+
+def _winner(board_uuid, claim, pattern):
+    return {
+        'board_uuid': board_uuid,
+        'player_name': claim.get('player_name', 'Anonymous'),
+        'player_email': claim.get('player_email'),
+        'pattern': pattern,
+        'timestamp': str(datetime.now())
+    }
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def call_phrase(request, game_id):
+async def call_phrase(request, game_id):
     try:
         data = json.loads(request.body)
         phrase = data.get('phrase')
         board_uuid = data.get('board_uuid')
         
-        # Retrieve game data
-        game_data = get_game(game_id)
-        
-        if not game_data:
-            return JsonResponse({'error': 'Game not found'}, status=404)
-        
-        # Validate phrase exists in this game
-        phrase_valid = False
-        for board_data in game_data['board_assignments'].values():
-            for row in board_data['board_data']:
-                if phrase in row:
-                    phrase_valid = True
-                    break
-            if phrase_valid:
-                break
-        
-        if not phrase_valid:
+        if not isinstance(phrase, str):
             return JsonResponse({'error': 'Invalid phrase'}, status=400)
         
-        # Check if already called
-        if phrase in game_data['phrases_called']:
-            return JsonResponse({'error': 'Already called'}, status=400)
+        throttled = await _throttled(request, 'call_phrase', game_id, board_uuid)
+        if throttled:
+            return throttled
         
-        # Add to phrases_called
-        game_data['phrases_called'].append(phrase)
+        # Validate against the phrase index and add to phrases_called
+        # unless it was already called
+        status, total_called, new_wins, event = await store.arecord_called_phrase(game_id, phrase)
         
-        # Update cache
-        save_game(game_id, game_data)
+        if status == 'missing':
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        if status == 'invalid':
+            return JsonResponse({'error': 'Invalid phrase'}, status=400)
+        if status == 'duplicate':
+            # Players on one board often click the same phrase together;
+            # only the first call counts against the limits
+            await _refund(request, 'call_phrase', game_id, board_uuid)
+            return JsonResponse({'error': 'Already called'}, status=400)
         
         # BROADCAST VIA WEBSOCKET
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'bingo_game_{game_id}',
-            {
-                'type': 'phrase_called',
-                'phrase': phrase,
-                'total_called': len(game_data['phrases_called'])
-            }
-        )
+        await _broadcast(game_id, event)
+        await _announce_wins(game_id, new_wins)
         
         return JsonResponse({
             'success': True,
             'phrase': phrase,
-            'total_called': len(game_data['phrases_called'])
+            'total_called': total_called
         })
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JsonResponse({'error': str(e)}, status=500)
+
+
+async def _announce_wins(game_id, new_wins):
+    # Announce boards a call completed a win pattern on
+    if not new_wins:
+        return
+    owners = await store.aget_board_owners(game_id, sorted({board_num for board_num, _ in new_wins}))
+    for board_num, pattern in new_wins:
+        board_uuid, claim = owners.get(board_num, (None, None))
+        if not claim:
+            # Unclaimed boards have nobody to announce
+            continue
+        winner = _winner(board_uuid, claim, pattern)
+        win_status, win_event = await store.arecord_win(game_id, winner)
+        if win_status == 'ok':
+            await _broadcast(game_id, win_event)
+
+
+MAX_BATCH_PHRASES = 500
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def call_phrases(request, game_id):
+    """Call a list of phrases at once: one store round trip and one phrases_called broadcast."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    phrases = data.get('phrases') if isinstance(data, dict) else None
+    
+    if (not isinstance(phrases, list) or not 0 < len(phrases) <= MAX_BATCH_PHRASES
+            or not all(isinstance(phrase, str) for phrase in phrases)):
+        return JsonResponse({'error': f'phrases must be a list of 1 to {MAX_BATCH_PHRASES} phrases'}, status=400)
+    
+    throttled = await _throttled(request, 'call_phrases', game_id)
+    if throttled:
+        return throttled
+    
+    # All or nothing: an invalid phrase rejects the batch
+    status, detail, new_wins, event = await store.arecord_called_phrases(game_id, phrases)
+    
+    if status == 'missing':
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    if status == 'invalid':
+        return JsonResponse({'error': f'Invalid phrase "{detail}"'}, status=400)
+    if status == 'duplicate':
+        await _refund(request, 'call_phrases', game_id)
+        return JsonResponse({'error': 'Already called'}, status=400)
+    
+    await _broadcast(game_id, event)
+    await _announce_wins(game_id, new_wins)
+    
+    return JsonResponse({
+        'success': True,
+        'called': event['phrases'],
+        'total_called': detail
+    })
+
+
+def _parse_players_csv(text):
+    """
+    name,email rows (an optional header row is skipped). Returns
+    ([(player_name, player_email), ...], error).
+    """
+    players = []
+    for line, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if line == 1 and [cell.lower() for cell in cells[:2]] == ['name', 'email']:
+            continue
+        if len(cells) < 2 or not cells[0] or not cells[1]:
+            return None, f'Line {line}: expected name,email'
+        players.append((cells[0], cells[1]))
+    if not players:
+        return None, 'No players in CSV'
+    if len(players) > MAX_PLAYERS:
+        return None, f'At most {MAX_PLAYERS} players per upload'
+    return players, None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def claim_boards(request, game_id):
+    """
+    Pre-register players from a name,email CSV, uploaded as the "file" form
+    field or sent as the request body. Each gets the next unclaimed board, in
+    one store round trip and one players_joined broadcast.
+    """
+    if response := await _throttled(request, 'claim_boards', game_id):
+        return response
+    upload = request.FILES.get('file')
+    raw = upload.read() if upload else request.body
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return JsonResponse({'error': 'CSV must be UTF-8'}, status=400)
+    
+    players, error = _parse_players_csv(text)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    # All or nothing: if there are not enough boards left, nobody is claimed
+    status, detail, event = await store.aclaim_boards(game_id, players)
+    
+    if status == 'missing':
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    if status == 'full':
+        return JsonResponse({
+            'error': f'Only {detail} unclaimed boards for {len(players)} players'
+        }, status=409)
+    
+    await _broadcast(game_id, event)
+    
+    return JsonResponse({
+        'success': True,
+        'claimed': [
+            {
+                **player,
+                'url': request.build_absolute_uri(
+                    reverse('bingo:board_view', args=[game_id, player['board_uuid']])
+                ),
+            }
+            for player in detail
+        ]
+    })
     
 class GameAdminView(View):
-    def get(self, request, game_id):
-        # Retrieve game data
-        game_data = get_game(game_id)
+    async def get(self, request, game_id):
+        # Retrieve game data without expanding every board
+        overview = await store.aget_overview(game_id)
         
-        if not game_data:
+        if not overview:
             return render(request, 'bingo/error.html', {
                 'error': 'Game not found or expired.'
             })
+        game_data, phrases_called, _ = overview
         
-        # Render admin dashboard
+        # Render the dashboard shell; board cards are loaded page by page
+        # from admin_boards as the host scrolls
         return render(request, 'bingo/game_admin.html', {
             'game_data': game_data,
-            'game_id': game_id
+            'game_id': game_id,
+            'phrases_called': phrases_called,
         })
+
+
+BOARD_FILTERS = ('claimed', 'unclaimed', 'near_win')
+MAX_PAGE_SIZE = 200
+
+
+@require_http_methods(["GET"])
+async def admin_summary(request, game_id):
+    overview = await store.aget_overview(game_id)
+    
+    if overview is None:
+        return JsonResponse({'error': 'Game not found'}, status=404)
     
+    game_data, phrases_called, claims = overview
+    return _state_response(game_data['version'], {
+        'game_state': game_data['game_state'],
+        'num_boards': game_data['num_boards'],
+        'claimed': len(claims),
+        'phrases_called': phrases_called,
+        'winners': game_data['winners'],
+    })
+
+
 @require_http_methods(["GET"])
-def get_game_state(request, game_id):
-    game_data = get_game(game_id)
+async def admin_boards(request, game_id):
+    status = request.GET.get('filter') or None
+    if status is not None and status not in BOARD_FILTERS:
+        return JsonResponse({'error': 'Invalid filter'}, status=400)
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+    
+    page = await store.aget_board_page(game_id, status, offset, limit)
     
-    if not game_data:
+    if page is None:
         return JsonResponse({'error': 'Game not found'}, status=404)
     
-    # Return minimal data needed for updates
-    return JsonResponse({
-        'phrases_called': game_data.get('phrases_called', []),
-        'board_assignments': {
-            uuid: {
+    # Only what a dashboard card shows
+    version, total, phrase_table, boards = page
+    return _state_response(version, {
+        'filter': status,
+        'total': total,
+        'offset': offset,
+        'next_offset': offset + limit if offset + limit < total else None,
+        'boards': [
+            {
+                'board_uuid': board['board_uuid'],
+                'board_num': board['board_num'],
+                'phrases': [phrase for row in board_grid(board['squares'], phrase_table) for phrase in row],
                 'assigned': board['assigned'],
                 'player_name': board.get('player_name'),
-                'player_email': board.get('player_email')
+                'player_email': board.get('player_email'),
+                'marked': board['marked'],
+                'to_win': board['to_win'],
             }
-            for uuid, board in game_data['board_assignments'].items()
-        }
+            for board in boards
+        ],
     })
-from django.http import JsonResponse
+
+
+def _etag(version):
+    # The version counter changes with every mutation
+    return f'"{version}"'
+
+
+def _state_response(version, data):
+    # Clients must revalidate before reusing a cached copy
+    response = JsonResponse({'seq': version, **data})
+    response['ETag'] = _etag(version)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_http_methods(["GET"])
+async def get_game_state(request, game_id):
+    since = request.GET.get('since')
+    if since is not None and not since.isdecimal():
+        return JsonResponse({'error': 'Invalid since'}, status=400)
+    
+    # Revalidation only needs the version counter
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        version = await store.aget_version(game_id)
+        if version is None:
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        not_modified = get_conditional_response(request, etag=_etag(version))
+        if not_modified is not None:
+            not_modified['ETag'] = _etag(version)
+            return not_modified
+    
+    # ?since=<seq> returns only phrases called and boards claimed after seq,
+    # from the event log; if the log no longer reaches back that far, fall
+    # through to the full state
+    if since is not None:
+        events = await store.aevents_since(game_id, int(since))
+        if events is not None:
+            return _state_response(int(since) + len(events), {
+                'since': int(since),
+                'phrases_called': [
+                    phrase for e in events
+                    for phrase in ([e['phrase']] if e['type'] == 'phrase_called' else e.get('phrases', []))
+                ],
+                'board_assignments': {
+                    player['board_uuid']: {
+                        'assigned': True,
+                        'player_name': player['player_name'],
+                        'player_email': player.get('player_email')
+                    }
+                    for e in events
+                    for player in ([e] if e['type'] == 'player_joined' else e.get('players', []))
+                }
+            })
+    
+    assignments = await store.aget_assignments(game_id)
+    
+    if assignments is None:
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    
+    version, phrases_called, claims = assignments
+    
+    # Return minimal data needed for updates
+    return _state_response(version, {
+        'phrases_called': phrases_called,
+        'board_assignments': board_states(claims)
+    })
+from django.http import Http404, HttpResponse, JsonResponse
 
 def healthz(request):
     return JsonResponse({"ok": True})
 
+def metrics_view(request):
+    # Prometheus text format; this worker's metrics only
+    if not metrics.ENABLED:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def claim_win(request, game_id):
+async def claim_win(request, game_id):
     try:
         data = json.loads(request.body)
         board_uuid = data.get('board_uuid')
         pattern = data.get('pattern')
         positions = data.get('positions')
         
-        # Retrieve game data
-        game_data = get_game(game_id)
+        if not isinstance(board_uuid, str) or not isinstance(pattern, str):
+            return JsonResponse({'success': False, 'error': 'Invalid claim'}, status=400)
         
-        if not game_data:
-            return JsonResponse({'error': 'Game not found'}, status=404)
+        # Positions must be distinct squares 0-24
+        if (not isinstance(positions, list)
+                or not all(isinstance(pos, int) and 0 <= pos < 25 for pos in positions)
+                or len(set(positions)) != len(positions)):
+            return JsonResponse({'success': False, 'error': 'Invalid positions'}, status=400)
         
-        # Get board
-        board_assignment = game_data['board_assignments'].get(board_uuid)
-        if not board_assignment:
-            return JsonResponse({'error': 'Invalid board'}, status=404)
+        throttled = await _throttled(request, 'claim_win', game_id, board_uuid)
+        if throttled:
+            return throttled
         
-        # Get phrases on this board at the claimed positions
-        board_phrases = []
-        for pos in positions:
-            row = pos // 5
-            col = pos % 5
-            phrase = board_assignment['board_data'][row][col]
-            board_phrases.append(phrase)
-        
-        # Validate: all phrases at those positions must be called (or Free Space)
-        phrases_called_set = set(game_data['phrases_called'])
-        phrases_called_set.add('Free Space')  # Free Space is always valid
-        
-        for phrase in board_phrases:
-            if phrase not in phrases_called_set:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Phrase "{phrase}" has not been called yet'
-                }, status=400)
-        
-        # Valid win! Record it
-        winner = {
-            'board_uuid': board_uuid,
-            'player_name': board_assignment.get('player_name', 'Anonymous'),
-            'player_email': board_assignment.get('player_email'),
-            'pattern': pattern,
-            'timestamp': str(datetime.now())
-        }
+        # Check pattern, board and called squares and record the win in one
+        # round trip; retried or duplicate claims are rejected before any
+        # game data is read
+        status, detail, event = await store.averify_and_record_win(
+            game_id, board_uuid, pattern, positions, str(datetime.now())
+        )
         
-        game_data['winners'].append(winner)
-        save_game(game_id, game_data)
+        if status == 'missing':
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        if status == 'invalid':
+            return JsonResponse({'error': 'Invalid board'}, status=404)
+        if status == 'bad_pattern':
+            return JsonResponse({
+                'success': False,
+                'error': f'Positions do not form a "{pattern}" pattern'
+            }, status=400)
+        if status == 'not_called':
+            return JsonResponse({
+                'success': False,
+                'error': f'Phrase "{detail}" has not been called yet'
+            }, status=400)
+        if status == 'duplicate':
+            # Already recorded for this board and pattern; nothing to broadcast
+            return JsonResponse({
+                'success': True,
+                'pattern': pattern,
+                'already_recorded': True
+            })
+        
+        winner = detail
         
         # Broadcast win to all clients
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'bingo_game_{game_id}',
-            {
-                'type': 'player_won',
-                'board_uuid': board_uuid,
-                'player_name': winner['player_name'],
-                'pattern': pattern
-            }
-        )
+        await _broadcast(game_id, event)
         
         return JsonResponse({
             'success': True,
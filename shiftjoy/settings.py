@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bingo.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -127,17 +128,86 @@ STATIC_URL = 'static/'
 
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 
-# Cache (for game state storage)
+# Cache for rendered page fragments (bingo/fragments.py): one entry per
+# player board shown. The admin dashboard loads its boards from the JSON API
+# and caches nothing here
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('BINGO_FRAGMENT_CACHE_ENTRIES', 10000)),
+        },
     }
 }
 
-# Channels (for WebSocket)
+# Game store payload encoding: json, ujson, msgpack or cbor. Payloads of at
+# least BINGO_STORE_COMPRESS_MIN bytes are zlib-compressed (0 to disable).
+BINGO_STORE_FORMAT = os.environ.get('BINGO_STORE_FORMAT', 'msgpack')
+BINGO_STORE_COMPRESS_MIN = int(os.environ.get('BINGO_STORE_COMPRESS_MIN', 1024))
+
+# Where games live (bingo/game_store.py): redis (REDIS_URL, shared by every
+# worker and node), memory (this process only) or sqlite (a file shared by
+# the workers on one host). Connections are opened on first use.
+BINGO_STORE_BACKEND = os.environ.get('BINGO_STORE_BACKEND', 'redis')
+BINGO_STORE_SQLITE_PATH = os.environ.get('BINGO_STORE_SQLITE_PATH', str(BASE_DIR / 'games.sqlite3'))
+
+# Token-bucket rate limits for the call, claim-win and CSV claim POSTs
+# (bingo/rate_limits.py): (tokens per second, burst) per game, per board and
+# per client address. Client buckets are roomy because whole offices share
+# an address. Throttled requests get a 429 with Retry-After, which the board
+# page waits out before retrying; calls of an already called phrase are not
+# charged. BINGO_RATE_LIMITS=0 turns them off.
+BINGO_RATE_LIMITS_ENABLED = os.environ.get('BINGO_RATE_LIMITS', '1') != '0'
+BINGO_RATE_LIMITS = {
+    'call_phrase': {'game': (10, 30), 'board': (0.5, 5), 'client': (5, 20)},
+    'call_phrases': {'game': (1, 5), 'client': (1, 5)},
+    'claim_win': {'game': (100, 500), 'board': (1, 5), 'client': (10, 50)},
+    'claim_boards': {'game': (0.1, 5), 'client': (0.1, 5)},
+}
+# Number of proxies in front of the app that append to X-Forwarded-For (1 on
+# Render). The client address is the hop the outermost one added; with 0 the
+# header is ignored and the peer address is used.
+BINGO_TRUSTED_PROXIES = int(os.environ.get('BINGO_TRUSTED_PROXIES', 0))
+
+# Per-socket outbound queues (bingo/consumers.py): frames waiting beyond
+# BINGO_WS_OUTBOX_SIZE collapse into one snapshot; pages acknowledge what
+# they have processed and get at most BINGO_WS_OUTBOX_WINDOW frames ahead;
+# a socket that makes no progress for BINGO_WS_OUTBOX_STALL_TIMEOUT seconds
+# is closed.
+BINGO_WS_OUTBOX_SIZE = int(os.environ.get('BINGO_WS_OUTBOX_SIZE', 64))
+BINGO_WS_OUTBOX_WINDOW = int(os.environ.get('BINGO_WS_OUTBOX_WINDOW', 16))
+BINGO_WS_OUTBOX_STALL_TIMEOUT = float(os.environ.get('BINGO_WS_OUTBOX_STALL_TIMEOUT', 30))
+
+# Request, Redis, broadcast and WebSocket metrics served at /metrics
+# (bingo/metrics.py). BINGO_METRICS=0 turns collection and the endpoint off.
+BINGO_METRICS = os.environ.get('BINGO_METRICS', '1') != '0'
+
+# Channels (for WebSocket). The in-memory layer only reaches sockets held by
+# the same process; set CHANNEL_REDIS_URL (it may equal REDIS_URL) to fan
+# group messages out through Redis when running several Daphne processes or
+# nodes (see `manage.py runworkers`). CHANNEL_REDIS_URLS (comma-separated)
+# spreads game groups over several Redis nodes the way REDIS_URLS spreads
+# games.
 ASGI_APPLICATION = 'shiftjoy.asgi.application'
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL')
+CHANNEL_REDIS_URLS = [
+    url.strip() for url in os.environ.get('CHANNEL_REDIS_URLS', '').split(',') if url.strip()
+] or ([CHANNEL_REDIS_URL] if CHANNEL_REDIS_URL else [])
+if CHANNEL_REDIS_URLS:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'bingo.channel_layers.GameShardedChannelLayer',
+            'CONFIG': {
+                'hosts': CHANNEL_REDIS_URLS,
+                'prefix': 'shiftjoy:asgi',
+                'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1500)),
+                'expiry': int(os.environ.get('CHANNEL_LAYER_EXPIRY', 60)),
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
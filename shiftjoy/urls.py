@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
-from bingo.views import healthz, LandingPageView
+from bingo.views import healthz, metrics_view, LandingPageView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('bingo/', include('bingo.urls')),
     path('healthz', healthz, name="healthz"),
+    path('metrics', metrics_view, name="metrics"),
     path('', LandingPageView.as_view(), name='landing'),
 ]
\ No newline at end of file